@@ -0,0 +1,72 @@
+"""
+ha_test.test_bootstrap
+~~~~~~~~~~~~~~~~~~~~~~
+
+Tests the bootstrap module.
+"""
+# pylint: disable=too-many-public-methods,protected-access
+import unittest
+import threading
+import time
+
+import homeassistant.loader as loader
+import homeassistant.bootstrap as bootstrap
+
+from helpers import get_test_home_assistant, MockModule
+
+
+class TestBootstrap(unittest.TestCase):
+    """ Test the bootstrap module. """
+
+    def setUp(self):  # pylint: disable=invalid-name
+        self.hass = get_test_home_assistant()
+        loader.prepare(self.hass)
+
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        """ Stop down stuff we started. """
+        self.hass.stop()
+
+    def _mock_component(self, domain, dependencies=None, sleep=0):
+        """ Registers a component that records when it gets set up. """
+        def setup(hass, config):
+            """ Records start and end of setup. """
+            with self.lock:
+                self.calls.append(('start', domain))
+            time.sleep(sleep)
+            with self.lock:
+                self.calls.append(('end', domain))
+            return True
+
+        module = MockModule(domain, dependencies or [])
+        module.setup = setup
+        loader.set_component(domain, module)
+
+    def test_setup_respects_dependencies(self):
+        """ Test that components start after their dependencies ended. """
+        self._mock_component('mod1', sleep=.1)
+        self._mock_component('mod2', ['mod1'])
+        self._mock_component('mod3', sleep=.1)
+        self._mock_component('mod4', ['group'])
+
+        bootstrap.from_config_dict(
+            {'mod2': {}, 'mod3': {}, 'mod4': {}}, self.hass)
+
+        started = [name for action, name in self.calls if action == 'start']
+        ended = [name for action, name in self.calls if action == 'end']
+
+        self.assertEqual(['mod1', 'mod2', 'mod3', 'mod4'], sorted(started))
+
+        # mod1 and mod3 are independent and should run concurrently
+        self.assertLess(self.calls.index(('start', 'mod3')),
+                        self.calls.index(('end', 'mod1')))
+
+        # Dependencies are respected
+        self.assertLess(self.calls.index(('end', 'mod1')),
+                        self.calls.index(('start', 'mod2')))
+
+        # Components depending on group start after all others are done
+        self.assertEqual('mod4', ended[-1])
+        self.assertEqual(('start', 'mod4'), self.calls[-2])
@@ -5,8 +5,11 @@ ha_test.test_component_chromecast
 Tests Chromecast component.
 """
 # pylint: disable=too-many-public-methods,protected-access
+import collections
 import logging
+import threading
 import unittest
+from datetime import datetime
 
 import homeassistant as ha
 from homeassistant.const import (
@@ -88,3 +91,81 @@ class TestChromecast(unittest.TestCase):
         """
         self.assertFalse(chromecast.setup(
             self.hass, {chromecast.DOMAIN: {CONF_HOSTS: '127.0.0.1'}}))
+
+    def test_setup_with_discovery(self):
+        """ Test discovering and refreshing Chromecasts in the background. """
+        release = threading.Event()
+        refreshes = []
+
+        class FakeCast(object):
+            """ Chromecast that plays YouTube. """
+            def __init__(self, host):
+                if host == 'unreachable':
+                    raise FakePychromecast.ChromecastConnectionError()
+
+                self.host = host
+                self.device = collections.namedtuple(
+                    'Device', 'friendly_name')(host)
+                self.app = collections.namedtuple('App', 'app_id')('YouTube')
+
+            def refresh(self):
+                """ The cast named stuck does not respond. """
+                refreshes.append(self.host)
+
+                if self.host == 'stuck':
+                    release.wait()
+
+            def get_protocol(self, protocol):  # pylint: disable=no-self-use
+                """ No media protocol. """
+                return None
+
+        class FakePychromecast(object):
+            """ Replaces the pychromecast module. """
+            available = True
+            APP_ID = {'HOME': 'HomeScreen'}
+            PROTOCOL_RAMP = 'ramp'
+            PyChromecast = FakeCast
+
+            class ChromecastConnectionError(Exception):
+                """ Connection failed. """
+                pass
+
+            @staticmethod
+            def discover_chromecasts():
+                """ Finds the casts. """
+                return ['living', 'stuck', 'unreachable']
+
+        orig_pychromecast = chromecast.pychromecast
+        chromecast.pychromecast = FakePychromecast
+        self.addCleanup(setattr, chromecast, 'pychromecast', orig_pychromecast)
+        self.addCleanup(release.set)
+
+        orig_timeout = chromecast.REFRESH_TIMEOUT
+        chromecast.REFRESH_TIMEOUT = 0.2
+        self.addCleanup(setattr, chromecast, 'REFRESH_TIMEOUT', orig_timeout)
+
+        self.assertTrue(chromecast.setup(self.hass, {chromecast.DOMAIN: {}}))
+
+        release.set()
+        self.hass.pool.block_till_done()
+        release.clear()
+
+        living = chromecast.ENTITY_ID_FORMAT.format('living')
+        self.assertEqual('YouTube', self.hass.states.get(living).state)
+        self.assertIsNotNone(
+            self.hass.states.get(chromecast.ENTITY_ID_FORMAT.format('stuck')))
+
+        changes = []
+        self.hass.bus.listen(
+            ha.EVENT_STATE_CHANGED, lambda event: changes.append(event))
+
+        # An unresponsive cast does not stall the other ones
+        del refreshes[:]
+        self.hass.bus.fire(ha.EVENT_TIME_CHANGED,
+                           {ha.ATTR_NOW: datetime.now()})
+        self.hass.pool.block_till_done()
+
+        self.assertEqual(['living', 'stuck'], sorted(refreshes))
+
+        # Unchanged casts do not change the state
+        self.assertEqual([], changes)
@@ -7,18 +7,62 @@ Tests the group compoments.
 # pylint: disable=protected-access,too-many-public-methods
 import unittest
 from datetime import datetime, timedelta
+import json
 import logging
 import os
+import threading
+import tempfile
+import http.server
+import ipaddress
+import socketserver
 
 import homeassistant as ha
 import homeassistant.loader as loader
 from homeassistant.const import (
-    STATE_HOME, STATE_NOT_HOME, ATTR_ENTITY_PICTURE, CONF_PLATFORM)
+    STATE_HOME, STATE_NOT_HOME, ATTR_ENTITY_PICTURE, CONF_PLATFORM,
+    CONF_HOST, CONF_USERNAME, CONF_PASSWORD)
 import homeassistant.components.device_tracker as device_tracker
 
 from helpers import get_test_home_assistant
 
 
+def start_http_server(routes):
+    """
+    Starts a HTTP server on localhost that handles each connection in a
+    thread. routes maps a HTTP method to a function that is called with the
+    request handler and returns the status and the body of the response.
+    Call shutdown and server_close on the returned server to stop it.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """ Handler that responds with the result of the route. """
+        protocol_version = 'HTTP/1.1'
+
+        def handle_route(self):
+            """ Respond with the status and body returned by the route. """
+            status, content = routes[self.command](self)
+
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        do_GET = do_POST = handle_route
+
+        # pylint: disable=redefined-builtin
+        def log_message(self, format, *args):
+            """ Do not log requests. """
+
+    class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+        """ Server that handles each connection in a thread. """
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
 def setUpModule():   # pylint: disable=invalid-name
     """ Setup to ignore group errors. """
     logging.disable(logging.CRITICAL)
@@ -34,13 +78,16 @@ class TestComponentsDeviceTracker(unittest.TestCase):
 
         self.known_dev_path = self.hass.get_config_path(
             device_tracker.KNOWN_DEVICES_FILE)
+        self.known_dev_db_path = self.hass.get_config_path(
+            device_tracker.KNOWN_DEVICES_DB)
 
     def tearDown(self):  # pylint: disable=invalid-name
         """ Stop down stuff we started. """
         self.hass.stop()
 
-        if os.path.isfile(self.known_dev_path):
-            os.remove(self.known_dev_path)
+        for path in (self.known_dev_path, self.known_dev_db_path):
+            if os.path.isfile(path):
+                os.remove(path)
 
     def test_is_on(self):
         """ Test is_on method. """
@@ -188,3 +235,389 @@ class TestComponentsDeviceTracker(unittest.TestCase):
         self.assertTrue(device_tracker.is_on(self.hass, dev1))
         self.assertFalse(device_tracker.is_on(self.hass, dev2))
         self.assertTrue(device_tracker.is_on(self.hass, dev3))
+
+    def test_scan_loop(self):
+        """ Test that scans requested during a scan are coalesced. """
+        scan_started = threading.Event()
+        finish_scan = threading.Event()
+        scans = []
+        results = []
+
+        class SlowScanner(object):
+            """ Scanner that blocks till finish_scan is set. """
+            # pylint: disable=too-few-public-methods
+
+            def scan_devices(self):  # pylint: disable=no-self-use
+                """ Blocks and returns a fake device. """
+                scans.append(1)
+                scan_started.set()
+                finish_scan.wait()
+                return ['dev1']
+
+        scan_loop = device_tracker.ScanLoop(
+            self.hass, SlowScanner(), results.append)
+
+        now = datetime.now()
+
+        scan_loop.request_scan(now)
+        scan_started.wait(5)
+
+        # Both requests are merged into one follow-up scan
+        scan_loop.request_scan(now + timedelta(seconds=10))
+        scan_loop.request_scan(now + timedelta(seconds=20))
+
+        finish_scan.set()
+        self.hass.pool.block_till_done()
+
+        self.assertEqual(2, len(scans))
+        self.assertEqual(1, scan_loop.coalesced_scans)
+        self.assertEqual(
+            [now, now + timedelta(seconds=20)],
+            [result.scan_time for result in results])
+        self.assertEqual(frozenset(['dev1']), scan_loop.last_result.devices)
+
+    def test_multiple_scanners(self):
+        """ Test that results of multiple scanners are merged. """
+        class FakeScanner(object):
+            """ Scanner returning a configurable list of devices. """
+
+            def __init__(self, devices):
+                self.devices = devices
+
+            def scan_devices(self):
+                """ Returns the fake devices. """
+                return self.devices
+
+            def get_device_name(self, device):  # pylint: disable=no-self-use
+                """ Returns a name for the device. """
+                return device.upper()
+
+        with open(self.known_dev_path, 'w') as fil:
+            fil.write('device,name,track,picture\n')
+            fil.write('dev1,Device 1,1,\n')
+            fil.write('dev2,Device 2,1,\n')
+
+        fast = device_tracker.ScanLoop(
+            self.hass, FakeScanner(['dev1']), name='fast')
+        slow = device_tracker.ScanLoop(
+            self.hass, FakeScanner(['dev2']), name='slow',
+            interval=timedelta(minutes=1))
+
+        tracker = device_tracker.DeviceTracker(self.hass, [fast, slow])
+
+        dev1 = device_tracker.ENTITY_ID_FORMAT.format('Device_1')
+        dev2 = device_tracker.ENTITY_ID_FORMAT.format('Device_2')
+
+        self.assertTrue(device_tracker.is_on(self.hass, dev1))
+        self.assertTrue(device_tracker.is_on(self.hass, dev2))
+        self.assertEqual(['fast'],
+                         list(tracker.tracked['dev1']['last_seen_by']))
+
+        # The fast scanner reports dev2 before the slow one runs again
+        fast.device_scanner.devices = ['dev1', 'dev2']
+
+        later = datetime.now() + timedelta(seconds=10)
+
+        self.assertFalse(slow.is_due(later))
+
+        self.hass.bus.fire(ha.EVENT_TIME_CHANGED, {ha.ATTR_NOW: later})
+        self.hass.pool.block_till_done()
+
+        self.assertEqual(
+            {'fast': later, 'slow': slow.last_result.scan_time},
+            tracker.tracked['dev2']['last_seen_by'])
+
+    def test_setup_multiple_platforms(self):
+        """ Test setting up multiple scanner platforms. """
+        self.assertTrue(device_tracker.setup(self.hass, {
+            device_tracker.DOMAIN: {CONF_PLATFORM: 'test'},
+            device_tracker.DOMAIN + ' 2': {
+                CONF_PLATFORM: 'test',
+                device_tracker.CONF_SCAN_INTERVAL: '60'},
+            device_tracker.DOMAIN + ' 3': {CONF_PLATFORM: 'nonexisting'},
+        }))
+
+    def test_device_registry(self):
+        """ Test the device registry. """
+        with open(self.known_dev_path, 'w') as fil:
+            fil.write('device,name,track,picture\n')
+            fil.write('dev1,Device 1,1,\n')
+
+        registry = device_tracker.DeviceRegistry(
+            self.known_dev_db_path, self.known_dev_path)
+
+        self.assertEqual(['dev1'], list(registry.load()))
+        self.assertEqual('Device 1', registry.get('dev1')['name'])
+
+        registry.add_devices([('dev2', 'Device 2'), ('dev1', 'Ignored')])
+
+        self.assertIn('dev2', registry)
+        self.assertEqual('Device 1', registry.get('dev1')['name'])
+
+        with open(self.known_dev_path) as fil:
+            self.assertEqual('dev2,Device 2,0,\n', list(fil)[-1])
+
+        # An unchanged CSV file is not parsed again
+        registry = device_tracker.DeviceRegistry(
+            self.known_dev_db_path, self.known_dev_path)
+        registry._import_csv = None
+
+        self.assertEqual(['dev1', 'dev2'], list(registry.load()))
+
+        # An edited CSV file is imported
+        with open(self.known_dev_path, 'w') as fil:
+            fil.write('device,name,track,picture\n')
+            fil.write('dev3,Device 3,1,\n')
+
+        registry = device_tracker.DeviceRegistry(
+            self.known_dev_db_path, self.known_dev_path)
+
+        self.assertEqual(['dev3'], list(registry.load()))
+
+        registry.add_devices([('dev4', 'Device 4')])
+        registry.export_csv()
+
+        with open(self.known_dev_path) as fil:
+            self.assertEqual(
+                ['device,name,track,picture\n', 'dev3,Device 3,1,\n',
+                 'dev4,Device 4,0,\n'],
+                list(fil))
+
+    def test_nmap_read_arp_table(self):
+        """ Test parsing the kernel neighbor table. """
+        nmap_tracker = loader.get_component('device_tracker.nmap_tracker')
+
+        with tempfile.NamedTemporaryFile('w') as arp_file:
+            arp_file.write(
+                "IP address       HW type     Flags       HW address"
+                "            Mask     Device\n"
+                "192.168.1.1      0x1         0x2         "
+                "00:11:22:33:44:55     *        eth0\n"
+                "192.168.1.2      0x1         0x0         "
+                "00:00:00:00:00:00     *        eth0\n"
+                "192.168.1.3      0x1         0x6         "
+                "66:77:88:99:aa:bb     *        eth0\n")
+            arp_file.flush()
+
+            self.assertEqual(
+                {'192.168.1.1': '00:11:22:33:44:55',
+                 '192.168.1.3': '66:77:88:99:aa:bb'},
+                nmap_tracker._read_arp_table(arp_file.name))
+
+        self.assertIsNone(
+            nmap_tracker._read_arp_table('/non/existing/path'))
+
+    def test_nmap_parse_hosts(self):
+        """ Test reading the devices from the nmap hosts. """
+        nmap_tracker = loader.get_component('device_tracker.nmap_tracker')
+
+        class Host(object):
+            """ Host as reported by libnmap. """
+            def __init__(self, ipv4, mac, hostnames, up=True):
+                self.ipv4, self.mac, self.hostnames = ipv4, mac, hostnames
+                self.up = up
+
+            def is_up(self):
+                """ If the host responded. """
+                return self.up
+
+        self.addCleanup(setattr, nmap_tracker, '_read_arp_table',
+                        nmap_tracker._read_arp_table)
+        nmap_tracker._read_arp_table = \
+            lambda: {'192.168.1.3': '11:22:33:44:55:66'}
+
+        devices = nmap_tracker._parse_hosts([
+            Host('192.168.1.2', 'AA:BB:CC:DD:EE:FF', ['phone']),
+            Host('192.168.1.3', '', []),
+            Host('192.168.1.4', '', []),
+            Host('192.168.1.5', '22:22:22:22:22:22', [], False)])
+
+        self.assertEqual(
+            {'AA:BB:CC:DD:EE:FF': device_tracker.ScannedDevice(
+                'AA:BB:CC:DD:EE:FF', 'phone', '192.168.1.2'),
+             '11:22:33:44:55:66': device_tracker.ScannedDevice(
+                 '11:22:33:44:55:66', '192.168.1.3', '192.168.1.3')},
+            devices)
+
+    def test_nmap_sweep_slices(self):
+        """ Test splitting the nmap targets in slices. """
+        nmap_tracker = loader.get_component('device_tracker.nmap_tracker')
+
+        self.assertEqual(
+            [['192.168.1.0/26', '10.0.0.1-10'], ['192.168.1.64/26'],
+             ['192.168.1.128/26'], ['192.168.1.192/26']],
+            nmap_tracker._sweep_slices('192.168.1.1/24 10.0.0.1-10', 4))
+
+        self.assertEqual(
+            [['10.0.0.5/32'], ['router']],
+            nmap_tracker._sweep_slices('10.0.0.5 router', 6))
+
+        # Networks are split in as many slices of about equal size
+        slices = nmap_tracker._sweep_slices('192.168.1.0/24', 6)
+
+        self.assertEqual(6, len(slices))
+        self.assertEqual(
+            [40, 40, 48, 40, 40, 48],
+            [sum(ipaddress.ip_network(target).num_addresses
+                 for target in targets) for targets in slices])
+
+    def test_nmap_presence_targets(self):
+        """ Test that presence scans start with a sweep of the full range. """
+        nmap_tracker = loader.get_component('device_tracker.nmap_tracker')
+
+        scanner = nmap_tracker.NmapDeviceScanner.__new__(
+            nmap_tracker.NmapDeviceScanner)
+        scanner.hosts = '192.168.1.0/24 router'
+        scanner.last_results = {}
+        scanner._sweep_slices = nmap_tracker._sweep_slices(
+            scanner.hosts, nmap_tracker.SWEEP_SLICES)
+        scanner._sweep_index = None
+
+        self.assertEqual(['192.168.1.0/24', 'router'],
+                         scanner._presence_targets())
+
+        scanner.last_results = {
+            'AA:BB:CC:DD:EE:FF': device_tracker.ScannedDevice(
+                'AA:BB:CC:DD:EE:FF', 'phone', '192.168.1.200')}
+
+        self.assertEqual(['192.168.1.200'] + scanner._sweep_slices[0],
+                         scanner._presence_targets())
+        self.assertEqual(['192.168.1.200'] + scanner._sweep_slices[1],
+                         scanner._presence_targets())
+
+    def test_tomato_parse_devices(self):
+        """ Test combining the Tomato device list with the DHCP leases. """
+        tomato = loader.get_component('device_tracker.tomato')
+
+        devices = tomato._parse_devices(
+            [['eth1', 'AA:BB:CC:DD:EE:FF', -53, 2],
+             ['eth1', '11:22:33:44:55:66', -70, 1]],
+            [['phone', '192.168.1.2', 'AA:BB:CC:DD:EE:FF', '1 day'],
+             ['', '192.168.1.3', '11:22:33:44:55:66', '1 day'],
+             ['laptop', '192.168.1.4', '00:00:00:00:00:01', '1 day']])
+
+        self.assertEqual(
+            {'AA:BB:CC:DD:EE:FF': device_tracker.ScannedDevice(
+                'AA:BB:CC:DD:EE:FF', 'phone', '192.168.1.2', -53),
+             '11:22:33:44:55:66': device_tracker.ScannedDevice(
+                 '11:22:33:44:55:66', None, '192.168.1.3', -70)},
+            devices)
+
+    def test_http_client(self):
+        """ Test that the HTTP client reuses connections. """
+        client_ports = []
+
+        def get(handler):
+            """ Records the client port, responds with an empty body. """
+            client_ports.append(handler.client_address[1])
+
+            return 200, b''
+
+        server = start_http_server({'GET': get})
+
+        try:
+            host = '127.0.0.1:{}'.format(server.server_port)
+            client = device_tracker.HttpClient()
+
+            for _ in range(3):
+                self.assertEqual(
+                    200,
+                    client.request('GET', 'http://{}/'.format(host))
+                    .status_code)
+
+            self.assertEqual(3, len(client_ports))
+            self.assertEqual(1, len(set(client_ports)))
+            self.assertIsNotNone(client.get_latency(host))
+            self.assertEqual(client.get_latency(host),
+                             client.get_latency('HTTP://127.0.0.1'))
+            self.assertIsNone(client.get_latency('192.168.1.1'))
+
+            self.assertIs(device_tracker.get_http_client(),
+                          device_tracker.get_http_client())
+
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_luci_batch(self):
+        """ Test the batched luci requests and the token renewal. """
+        luci = loader.get_component('device_tracker.luci')
+
+        requests_made = []
+        tokens = ['expired', 'valid']
+        batch_support = [True]
+
+        def call(entry):
+            """ Returns the result of a single luci call. """
+            if entry['method'] == 'net.arptable':
+                return [{'HW address': '00:11:22:33:44:55'}]
+            elif entry['method'] == 'net.mac_hints':
+                return [['00:11:22:33:44:55', 'Phone']]
+
+        def post(handler):
+            """ Acts as the luci RPC interface. """
+            path = handler.path
+            body = json.loads(handler.rfile.read(
+                int(handler.headers['Content-Length'])).decode('utf-8'))
+            requests_made.append((path, body))
+
+            if path.endswith('/auth'):
+                status, data = 200, {'result': tokens.pop(0)}
+            elif not path.endswith('auth=valid'):
+                status, data = 403, {}
+            elif isinstance(body, list) and batch_support[0]:
+                status, data = 200, [{'id': entry['id'],
+                                      'result': call(entry)}
+                                     for entry in body]
+            elif isinstance(body, list):
+                status, data = 200, {'result': None}
+            else:
+                status, data = 200, {'result': call(body)}
+
+            return status, json.dumps(data).encode('utf-8')
+
+        server = start_http_server({'POST': post})
+
+        try:
+            scanner = luci.get_scanner(None, {device_tracker.DOMAIN: {
+                CONF_HOST: '127.0.0.1:{}'.format(server.server_port),
+                CONF_USERNAME: 'user', CONF_PASSWORD: 'pass'}})
+
+            # Expired token is renewed and arp + names in one request
+            del requests_made[:]
+            self.assertEqual(['00:11:22:33:44:55'], scanner.scan_devices())
+            self.assertEqual(3, len(requests_made))
+            self.assertEqual(
+                ['net.arptable', 'net.mac_hints'],
+                [entry['method'] for entry in requests_made[2][1]])
+            self.assertEqual('valid', scanner.token)
+            self.assertEqual(
+                'Phone', scanner.last_results['00:11:22:33:44:55'].name)
+
+            # Names come from the cache
+            del requests_made[:]
+            self.assertEqual('Phone',
+                             scanner.get_device_name('00:11:22:33:44:55'))
+            self.assertEqual([], requests_made)
+
+            # Fresh names are not requested again
+            scanner._update_info(no_throttle=True)
+            self.assertEqual(
+                ['net.arptable'],
+                [entry['method'] for entry in requests_made[0][1]])
+
+            # Routers without batch support get one request per call
+            batch_support[0] = False
+            scanner.names_updated = None
+            del requests_made[:]
+            scanner._update_info(no_throttle=True)
+            self.assertFalse(scanner.batch_supported)
+            self.assertEqual(
+                ['net.arptable', 'net.mac_hints'],
+                [body['method'] for _, body in requests_made[1:]])
+            self.assertEqual(['00:11:22:33:44:55'], list(scanner.last_results))
+            self.assertIsNotNone(scanner.names_updated)
+
+        finally:
+            server.shutdown()
+            server.server_close()
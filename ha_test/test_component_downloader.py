@@ -0,0 +1,287 @@
+"""
+ha_test.test_component_downloader
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Tests downloader component.
+"""
+# pylint: disable=too-many-public-methods,protected-access
+import os
+import json
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import homeassistant as ha
+import homeassistant.components.downloader as downloader
+
+CONTENT = bytes(range(256)) * 1024
+
+
+class FileServer(socketserver.ThreadingMixIn, HTTPServer):
+    """ Serves CONTENT, supports Range requests. """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FileHandler)
+
+        # Range headers of the requests
+        self.ranges = []
+
+        # Number of responses to cut off halfway
+        self.drop = 0
+
+        # Set to let requests for /slow continue
+        self.release = threading.Event()
+
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        """ Returns the url of path on this server. """
+        return "http://127.0.0.1:{}/{}".format(self.server_port, path)
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """ Handles requests for the FileServer. """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Serves CONTENT. """
+        server = self.server
+        offset = 0
+
+        with server.lock:
+            server.ranges.append(self.headers.get('Range'))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+
+            drop = server.drop > 0
+            server.drop -= 1
+
+        try:
+            if self.path == '/slow':
+                server.release.wait(10)
+
+            if self.headers.get('Range'):
+                offset = int(self.headers['Range'][6:-1])
+                self.send_response(206)
+            else:
+                self.send_response(200)
+
+            self.send_header('Content-Length', len(CONTENT) - offset)
+            self.end_headers()
+
+            if drop:
+                self.wfile.write(
+                    CONTENT[offset:offset + downloader.CHUNK_SIZE + 1000])
+                self.wfile.flush()
+                self.close_connection = True
+
+            elif self.path == '/paused' and not offset:
+                # Pause after a few chunks until released
+                self.wfile.write(CONTENT[:2 * downloader.CHUNK_SIZE])
+                self.wfile.flush()
+
+                server.release.wait(10)
+
+                self.wfile.write(CONTENT[2 * downloader.CHUNK_SIZE:])
+
+            else:
+                self.wfile.write(CONTENT[offset:])
+
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    # pylint: disable=redefined-builtin
+    def log_message(self, format, *args):
+        """ Silences the request log. """
+
+
+class TestDownloader(unittest.TestCase):
+    """ Test the downloader module. """
+
+    def setUp(self):  # pylint: disable=invalid-name
+        self.hass = ha.HomeAssistant()
+
+        self.download_path = tempfile.mkdtemp()
+        self.queue_path = os.path.join(self.download_path, 'queue.json')
+
+        self.server = FileServer()
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        """ Stop down stuff we started. """
+        self.server.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self.hass.stop()
+        shutil.rmtree(self.download_path)
+
+    def read(self, *path):
+        """ Returns the content of a downloaded file. """
+        with open(os.path.join(self.download_path, *path), 'rb') as inp:
+            return inp.read()
+
+    def test_setup(self):
+        """ Test setup and downloading with the service. """
+        self.assertFalse(downloader.setup(self.hass, {}))
+        self.assertFalse(downloader.setup(
+            self.hass, {downloader.DOMAIN: {
+                downloader.CONF_DOWNLOAD_DIR: '/non/existing'}}))
+
+        self.hass.config_dir = self.download_path
+
+        self.assertTrue(downloader.setup(
+            self.hass, {downloader.DOMAIN: {
+                downloader.CONF_DOWNLOAD_DIR: self.download_path}}))
+
+        self.assertEqual(downloader.STATE_IDLE,
+                         self.hass.states.get(downloader.ENTITY_ID).state)
+
+        self.hass.services.call(
+            downloader.DOMAIN, downloader.SERVICE_DOWNLOAD_FILE,
+            {downloader.ATTR_URL: self.server.url('file.bin'),
+             downloader.ATTR_SUBDIR: 'sub'})
+
+        self.hass.pool.block_till_done()
+
+        for _ in range(50):
+            if self.hass.states.is_state(downloader.ENTITY_ID,
+                                         downloader.STATE_IDLE):
+                break
+
+            time.sleep(0.1)
+
+        self.assertEqual(CONTENT, self.read('sub', 'file.bin'))
+
+    def test_download(self):
+        """ Test downloading files with unique names. """
+        manager = downloader.DownloadManager(
+            self.hass, self.download_path, 2, self.queue_path)
+
+        manager.add(self.server.url('file.bin'))
+        manager.add(self.server.url('file.bin'))
+        manager.block_till_done()
+
+        self.assertEqual(CONTENT, self.read('file.bin'))
+        self.assertEqual(CONTENT, self.read('file_2.bin'))
+        self.assertEqual([None, None], self.server.ranges)
+
+        state = self.hass.states.get(downloader.ENTITY_ID)
+
+        self.assertEqual(downloader.STATE_IDLE, state.state)
+        self.assertEqual(0, state.attributes[downloader.ATTR_QUEUED])
+        self.assertEqual([], state.attributes[downloader.ATTR_DOWNLOADS])
+
+        with open(self.queue_path) as inp:
+            self.assertEqual([], json.load(inp))
+
+    def test_resume(self):
+        """ Test resuming a download after the connection dropped. """
+        self.server.drop = 2
+
+        manager = downloader.DownloadManager(
+            self.hass, self.download_path, 1, self.queue_path)
+
+        manager.add(self.server.url('file.bin'))
+        manager.block_till_done()
+
+        self.assertEqual(CONTENT, self.read('file.bin'))
+        self.assertFalse(os.path.isfile(os.path.join(
+            self.download_path, 'file.bin' + downloader.PART_SUFFIX)))
+        # The incomplete last chunk of a dropped connection is lost
+        self.assertEqual(
+            [None, 'bytes={}-'.format(downloader.CHUNK_SIZE),
+             'bytes={}-'.format(2 * downloader.CHUNK_SIZE)],
+            self.server.ranges)
+
+    def test_persisted_queue(self):
+        """ Test continuing downloads from the queue file. """
+        path = os.path.join(self.download_path, 'file.bin')
+
+        with open(path + downloader.PART_SUFFIX, 'wb') as outp:
+            outp.write(CONTENT[:5000])
+
+        with open(self.queue_path, 'w') as outp:
+            json.dump([{'url': self.server.url('file.bin'), 'path': path},
+                       {'url': self.server.url('other.bin')}], outp)
+
+        manager = downloader.DownloadManager(
+            self.hass, self.download_path, 1, self.queue_path)
+        manager.block_till_done()
+
+        self.assertEqual(CONTENT, self.read('file.bin'))
+        self.assertEqual(CONTENT, self.read('other.bin'))
+        self.assertEqual(['bytes=5000-', None], self.server.ranges)
+
+    def test_resume_after_stop(self):
+        """ Test resuming a download that was stopped by a restart. """
+        manager = downloader.DownloadManager(
+            self.hass, self.download_path, 1, self.queue_path)
+
+        manager.add(self.server.url('paused'))
+
+        part_path = os.path.join(
+            self.download_path, 'paused' + downloader.PART_SUFFIX)
+
+        for _ in range(50):
+            if os.path.isfile(part_path) and \
+               os.path.getsize(part_path) >= downloader.CHUNK_SIZE:
+                break
+
+            time.sleep(0.1)
+
+        # Stop while the transfer is running
+        stopper = threading.Thread(target=manager.stop)
+        stopper.start()
+        self.server.release.set()
+        stopper.join()
+
+        downloaded = os.path.getsize(part_path)
+
+        self.assertTrue(0 < downloaded < len(CONTENT))
+
+        with open(self.queue_path) as inp:
+            self.assertEqual(os.path.join(self.download_path, 'paused'),
+                             json.load(inp)[0]['path'])
+
+        # After the restart the download continues in the same file
+        manager = downloader.DownloadManager(
+            self.hass, self.download_path, 1, self.queue_path)
+        manager.block_till_done()
+
+        self.assertEqual([None, 'bytes={}-'.format(downloaded)],
+                         self.server.ranges)
+        self.assertEqual(CONTENT, self.read('paused'))
+        self.assertEqual(['paused', 'queue.json'],
+                         sorted(os.listdir(self.download_path)))
+
+    def test_concurrency(self):
+        """ Test that at most max_concurrent files download at once. """
+        self.addCleanup(self.server.release.set)
+
+        manager = downloader.DownloadManager(
+            self.hass, self.download_path, 2, self.queue_path)
+
+        for _ in range(3):
+            manager.add(self.server.url('slow'))
+
+        state = self.hass.states.get(downloader.ENTITY_ID)
+
+        self.assertEqual(downloader.STATE_DOWNLOADING, state.state)
+
+        # Give the third download the chance to start
+        time.sleep(0.5)
+
+        self.assertEqual(2, self.server.active)
+
+        self.server.release.set()
+        manager.block_till_done()
+
+        self.assertEqual(2, self.server.max_active)
+        self.assertEqual(CONTENT, self.read('slow_3'))
@@ -99,6 +99,46 @@ class TestComponentsGroup(unittest.TestCase):
         group_state = self.hass.states.get(self.group_name)
         self.assertEqual(STATE_ON, group_state.state)
 
+    def test_monitor_many_members(self):
+        """ Test that the group is on as long as any member is on. """
+        entity_ids = ['light.Light_{}'.format(idx) for idx in range(50)]
+
+        for entity_id in entity_ids:
+            self.hass.states.set(entity_id, STATE_OFF)
+
+        self.hass.states.set(entity_ids[3], STATE_ON)
+
+        self.assertTrue(group.setup_group(self.hass, 'many', entity_ids))
+
+        group_name = group.ENTITY_ID_FORMAT.format('many')
+
+        self.assertEqual(STATE_ON, self.hass.states.get(group_name).state)
+
+        # Turning a member on twice counts it once
+        self.hass.states.set(entity_ids[10], STATE_ON)
+        self.hass.states.set(entity_ids[10], STATE_ON, {'brightness': 5})
+        self.hass.states.set(entity_ids[3], STATE_OFF)
+        self.hass.pool.block_till_done()
+
+        self.assertEqual(STATE_ON, self.hass.states.get(group_name).state)
+
+        self.hass.states.set(entity_ids[10], STATE_OFF)
+        self.hass.pool.block_till_done()
+
+        self.assertEqual(STATE_OFF, self.hass.states.get(group_name).state)
+
+    def test_group_state_set_elsewhere(self):
+        """ Test that a group state set from elsewhere is corrected. """
+        self.hass.states.set(self.group_name, STATE_OFF)
+
+        # The group stays on, the next member change sets it again
+        self.hass.states.set('light.Ceiling', STATE_ON)
+        self.hass.pool.block_till_done()
+
+        group_state = self.hass.states.get(self.group_name)
+        self.assertEqual(STATE_ON, group_state.state)
+        self.assertTrue(group_state.attributes[group.ATTR_AUTO])
+
     def test_is_on(self):
         """ Test is_on method. """
         self.assertTrue(group.is_on(self.hass, self.group_name))
@@ -124,6 +164,55 @@ class TestComponentsGroup(unittest.TestCase):
         # Test that non strings are ignored
         self.assertEqual([], group.expand_entity_ids(self.hass, [5, True]))
 
+    def test_expand_nested_groups(self):
+        """ Test expanding groups that contain groups. """
+        self.assertTrue(group.setup_group(
+            self.hass, 'nested', [self.group_name, 'switch.AC']))
+
+        nested_name = group.ENTITY_ID_FORMAT.format('nested')
+
+        self.assertEqual(
+            ['light.Bowl', 'light.Ceiling', 'switch.AC'],
+            group.expand_entity_ids(self.hass, [nested_name]))
+
+        self.assertEqual(
+            ['switch.AC', 'light.Bowl', 'light.Ceiling'],
+            group.expand_entity_ids(
+                self.hass, ['switch.AC', nested_name, self.group_name]))
+
+        # Changing the members of a nested group changes the expansion
+        self.assertTrue(group.setup_group(
+            self.hass, 'init_group', ['light.Ceiling']))
+
+        self.assertEqual(
+            ['light.Ceiling', 'switch.AC'],
+            group.expand_entity_ids(self.hass, [nested_name]))
+
+        group.remove_group(self.hass, 'init_group')
+
+        self.assertEqual(
+            ['switch.AC'], group.expand_entity_ids(self.hass, [nested_name]))
+
+    def test_expand_cycle(self):
+        """ Test expanding groups that contain themselves. """
+        first_name = group.ENTITY_ID_FORMAT.format('first')
+        second_name = group.ENTITY_ID_FORMAT.format('second')
+
+        self.hass.states.set(first_name, STATE_OFF)
+        self.hass.states.set(second_name, STATE_OFF)
+
+        self.assertTrue(group.setup_group(
+            self.hass, 'first', ['light.Bowl', second_name]))
+        self.assertTrue(group.setup_group(
+            self.hass, 'second', ['switch.AC', first_name]))
+
+        self.assertEqual(
+            ['light.Bowl', 'switch.AC'],
+            group.expand_entity_ids(self.hass, [first_name]))
+        self.assertEqual(
+            ['switch.AC', 'light.Bowl'],
+            group.expand_entity_ids(self.hass, [second_name]))
+
     def test_get_entity_ids(self):
         """ Test get_entity_ids method. """
         # Get entity IDs from our group
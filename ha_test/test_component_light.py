@@ -5,6 +5,9 @@ ha_test.test_component_switch
 Tests switch component.
 """
 # pylint: disable=too-many-public-methods,protected-access
+import copy
+import threading
+import time
 import unittest
 import os
 
@@ -35,6 +38,11 @@ class TestLight(unittest.TestCase):
         if os.path.isfile(user_light_file):
             os.remove(user_light_file)
 
+    def fire_time_changed(self, now):
+        """ Fires a time changed event and waits for its jobs. """
+        self.hass.bus.fire(ha.EVENT_TIME_CHANGED, {ha.ATTR_NOW: now})
+        self.hass.pool.block_till_done()
+
     def test_methods(self):
         """ Test if methods call the services as expected. """
         # Test is_on
@@ -274,3 +282,287 @@ class TestLight(unittest.TestCase):
         self.assertEqual(
             {light.ATTR_XY_COLOR: [.4, .6], light.ATTR_BRIGHTNESS: 100},
             data)
+
+    def test_hue_io_per_update(self):
+        """ Benchmark the bridge requests of a Hue light state update. """
+        hue = loader.get_component('light.hue')
+
+        bridge_calls = []
+
+        def update_lights(**kwargs):
+            """ Count the calls that query the bridge. """
+            bridge_calls.append(kwargs)
+
+        info = {'name': 'Bowl',
+                'state': {'reachable': True, 'on': True,
+                          'bri': 120, 'xy': [0.4, 0.5]}}
+
+        bowl = hue.HueLight(1, info, None, update_lights)
+        bowl.entity_id = 'light.bowl'
+
+        # The state comes from the last refresh of the bridge
+        bowl.update_ha_state(self.hass)
+
+        self.assertEqual(0, len(bridge_calls))
+
+        state = self.hass.states.get('light.bowl')
+        self.assertEqual(STATE_ON, state.state)
+        self.assertEqual(120, state.attributes[light.ATTR_BRIGHTNESS])
+
+        bowl.update_ha_state(self.hass, True)
+
+        self.assertEqual(1, len(bridge_calls))
+
+        # Changing the attributes does not change the snapshot
+        bowl.get_state_attributes()[light.ATTR_BRIGHTNESS] = 10
+        bowl.get_snapshot().attributes[light.ATTR_BRIGHTNESS] = 10
+
+        self.assertEqual(120, bowl.snapshot.attributes[light.ATTR_BRIGHTNESS])
+
+    def test_hue_batch_handler(self):
+        """ Test sending commands to multiple Hue lights at once. """
+        hue = loader.get_component('light.hue')
+
+        class FakeBridge(object):
+            """ Records the requests made to the bridge. """
+            def __init__(self):
+                self.requests = []
+                self.groups = {
+                    '1': {'name': 'Kitchen', 'lights': ['1', '2']},
+                    '2': {'name': 'Home Assistant 1', 'lights': ['1', '5']}}
+
+            def set_light(self, light_id, command):
+                """ Command for one light. """
+                self.requests.append(('set_light', light_id, command))
+
+            def set_group(self, group_id, command, value=None):
+                """ Command for or change of a group of lights. """
+                if command == 'lights':
+                    self.requests.append(('set_group', group_id, value))
+                    self.groups[str(group_id)]['lights'] = \
+                        [str(light_id) for light_id in value]
+                else:
+                    self.requests.append(('set_group', group_id, command))
+
+                if group_id and str(group_id) not in self.groups:
+                    return [[{'error': {'type': 3}}]]
+
+                return [[{'success': {}}]]
+
+            def get_group(self):
+                """ Existing groups. """
+                self.requests.append(('get_group',))
+                return self.groups
+
+            def create_group(self, name, lights):
+                """ Create a group. """
+                self.requests.append(('create_group', name, lights))
+                self.groups['3'] = {'name': name,
+                                    'lights': [str(idx) for idx in lights]}
+                return [{'success': {'id': '3'}}]
+
+        bridge = FakeBridge()
+        info = {'name': 'Light', 'state': {'reachable': True, 'on': False}}
+        lights = {str(idx): hue.HueLight(idx, info, bridge, None)
+                  for idx in range(1, 6)}
+
+        handler = hue.HueBatchHandler(bridge, lights, None)
+
+        # All lights of the bridge
+        handler.turn_off(list(lights.values()))
+        self.assertEqual([('set_group', 0, {'on': False})], bridge.requests)
+
+        # Existing group
+        del bridge.requests[:]
+        handler.turn_off([lights['1'], lights['2']])
+        self.assertEqual([('get_group',), ('set_group', 1, {'on': False})],
+                         bridge.requests)
+
+        # New group with a free name is created once and then reused
+        del bridge.requests[:]
+        for _ in range(2):
+            handler.turn_on([lights['3'], lights['4'], lights['5']])
+
+        self.assertEqual(
+            [('create_group', 'Home Assistant 2', [3, 4, 5]),
+             ('set_group', 3, {'on': True, 'alert': 'none'}),
+             ('set_group', 3, {'on': True, 'alert': 'none'})],
+            bridge.requests)
+
+        # Groups are read again after a group removed by another app failed
+        del bridge.groups['1']
+
+        del bridge.requests[:]
+        handler.turn_off([lights['1'], lights['2']])
+        self.assertEqual([('set_group', 1, {'on': False}), ('get_group',),
+                          ('set_light', 1, {'on': False}),
+                          ('set_light', 2, {'on': False})], bridge.requests)
+
+        # Too few lights for a new group
+        del bridge.requests[:]
+        handler.turn_off([lights['2'], lights['3']])
+        self.assertEqual([('set_light', 2, {'on': False}),
+                          ('set_light', 3, {'on': False})], bridge.requests)
+
+        # At the limit the least recently used created group is changed
+        handler.max_groups = 2
+
+        del bridge.requests[:]
+        handler.turn_off([lights['2'], lights['3'], lights['4']])
+        self.assertEqual([('set_group', 2, [2, 3, 4]),
+                          ('set_group', 2, {'on': False})], bridge.requests)
+        self.assertEqual([3, 2], handler.own_groups)
+
+    def test_batch_service(self):
+        """ Test that the service hands lights to their batch handler. """
+        platform = loader.get_component('light.test')
+
+        platform.init()
+
+        dev1, dev2, dev3 = platform.get_lights(None, None)
+
+        class BatchHandler(object):
+            """ Records the batch commands. """
+            calls = []
+
+            def turn_on(self, lights, **kwargs):
+                """ Turn lights on. """
+                self.calls.append(('turn_on', lights, kwargs))
+
+                for device in lights:
+                    device.turn_on(**kwargs)
+
+            def update(self):
+                """ Refresh lights. """
+                self.calls.append(('update',))
+
+        # Platforms set the batch handler when they create the lights
+        dev1.batch_handler = dev2.batch_handler = BatchHandler()
+
+        self.assertTrue(
+            light.setup(self.hass, {light.DOMAIN: {CONF_TYPE: 'test'}}))
+
+        light.turn_on(self.hass, brightness=100)
+
+        self.hass.pool.block_till_done()
+
+        self.assertEqual(
+            [('turn_on', [dev1, dev2], {light.ATTR_BRIGHTNESS: 100}),
+             ('update',)],
+            BatchHandler.calls)
+        self.assertEqual(('turn_on', {light.ATTR_BRIGHTNESS: 100}),
+                         dev3.last_call('turn_on'))
+
+        for dev in (dev1, dev2, dev3):
+            self.assertTrue(light.is_on(self.hass, dev.entity_id))
+
+        # Rapid commands to a light with a batch handler are coalesced and
+        # not limited by the interval of the handler
+        BatchHandler.min_command_interval = 1
+        turn_on = dev1.turn_on
+        sending = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_turn_on(**kwargs):
+            """ Blocks until released, like a slow bridge. """
+            sending.set()
+            release.wait(5)
+            turn_on(**kwargs)
+
+        dev1.turn_on = slow_turn_on
+        start = time.time()
+
+        light.turn_on(self.hass, dev1.entity_id, brightness=0)
+        self.assertTrue(sending.wait(5))
+
+        for brightness in range(1, 10):
+            self.hass.services.call(
+                light.DOMAIN, SERVICE_TURN_ON,
+                {ATTR_ENTITY_ID: dev1.entity_id,
+                 light.ATTR_BRIGHTNESS: brightness}, True)
+
+        release.set()
+        self.hass.pool.block_till_done()
+
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(
+            [{light.ATTR_BRIGHTNESS: 0}, {light.ATTR_BRIGHTNESS: 9}],
+            [call[1] for call in dev1.calls if call[0] == 'turn_on'][-2:])
+        self.assertEqual(3, len([call for call in dev1.calls
+                                 if call[0] == 'turn_on']))
+
+    def test_hue_refresh(self):
+        """ Test that Hue refreshes report only the changed lights. """
+        hue = loader.get_component('light.hue')
+
+        api_lights = {
+            str(idx): {'name': 'Light {}'.format(idx),
+                       'state': {'reachable': True, 'on': False,
+                                 'bri': 100, 'xy': [0.5, 0.5]}}
+            for idx in (1, 2)}
+
+        class FakePhue(object):
+            """ Replaces the phue module. """
+            available = True
+
+            class Bridge(object):
+                """ Bridge that returns api_lights. """
+                def __init__(self, host, config_file_path):
+                    pass
+
+                def get_api(self):  # pylint: disable=no-self-use
+                    """ Copy of the current light states. """
+                    return {'lights': copy.deepcopy(api_lights)}
+
+                def set_light(self, light_id, command):
+                    """ Ignore commands. """
+                    pass
+
+        orig_phue = hue.phue
+        hue.phue = FakePhue
+        self.addCleanup(setattr, hue, 'phue', orig_phue)
+
+        lights = sorted(hue.get_devices(self.hass, {}),
+                        key=lambda light: light.light_id)
+
+        changed = []
+
+        for hue_light in lights:
+            hue_light.subscribe(
+                lambda hue_light=hue_light: changed.append(hue_light.name))
+            hue_light.name = hue_light.get_name()
+
+        poller = lights[0].poller
+
+        self.assertEqual(hue.MAX_POLL_INTERVAL, poller.interval)
+
+        # Only the changed light is reported and polling speeds up.
+        # Forced refreshes are limited to one per second.
+        time.sleep(1)
+        api_lights['2']['state']['on'] = True
+        self.fire_time_changed(poller.next_poll)
+
+        self.assertEqual(['Light 2'], changed)
+        self.assertEqual(hue.MIN_POLL_INTERVAL, poller.interval)
+        self.assertTrue(lights[1].is_on())
+
+        # Polling slows down when nothing changes
+        self.fire_time_changed(poller.next_poll)
+
+        self.assertEqual(['Light 2'], changed)
+        self.assertEqual(2 * hue.MIN_POLL_INTERVAL, poller.interval)
+
+        # Not polled before it is time
+        api_lights['1']['state']['on'] = True
+        self.fire_time_changed(poller.next_poll - hue.MIN_POLL_INTERVAL)
+        self.assertEqual(['Light 2'], changed)
+
+        # A refresh is not started while one is running
+        self.assertTrue(poller.start_poll(poller.next_poll))
+        self.assertFalse(poller.start_poll(poller.next_poll))
+        poller.poll()
+
+        # Commands speed up polling
+        lights[0].turn_on()
+        self.assertEqual(hue.MIN_POLL_INTERVAL, poller.interval)
@@ -0,0 +1,97 @@
+"""
+ha_test.test_component_process
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Tests process component.
+"""
+# pylint: disable=too-many-public-methods,protected-access
+import os
+import shutil
+import tempfile
+import unittest
+
+import homeassistant.components.process as process
+
+
+class TestProcess(unittest.TestCase):
+    """ Test the process module. """
+
+    def setUp(self):  # pylint: disable=invalid-name
+        self.proc_path = tempfile.mkdtemp()
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        """ Remove the fake /proc. """
+        shutil.rmtree(self.proc_path)
+
+    def add_process(self, pid, cmdline, comm=b''):
+        """ Adds a process to the fake /proc. """
+        path = os.path.join(self.proc_path, str(pid))
+        os.mkdir(path)
+
+        with open(os.path.join(path, 'cmdline'), 'wb') as outp:
+            outp.write(cmdline)
+
+        with open(os.path.join(path, 'comm'), 'wb') as outp:
+            outp.write(comm)
+
+    def test_matcher(self):
+        """ Test matching all substrings in one pass. """
+        matcher = process.ProcessMatcher({
+            'process.server': 'server',
+            'process.web_server': 'webserver',
+            'process.web': 'web',
+            'process.other': 'other',
+        })
+
+        self.assertEqual(
+            {'process.server', 'process.web_server', 'process.web'},
+            matcher.match('/usr/bin/webserver --port 80'))
+
+        self.assertEqual(set(), matcher.match('/usr/bin/python'))
+        self.assertEqual(set(), process.ProcessMatcher({}).match('python'))
+
+    def test_scanner(self):
+        """ Test finding processes in /proc. """
+        self.add_process(1, b'/sbin/init\0')
+        self.add_process(2, b'', b'kthreadd\n')
+        self.add_process(10, b'python\0-m\0homeassistant\0')
+        os.mkdir(os.path.join(self.proc_path, 'self'))
+
+        scanner = process.ProcessScanner(
+            {'process.ha': 'python -m homeassistant',
+             'process.kthreadd': '[kthreadd]',
+             'process.mpd': 'mpd'},
+            self.proc_path)
+
+        self.assertEqual({'process.ha', 'process.kthreadd'}, scanner.scan())
+
+        # Unchanged command lines are not matched again
+        matched = scanner._processes['10'][1]
+        scanner.scan()
+        self.assertIs(matched, scanner._processes['10'][1])
+
+        # Processes that exec or rewrite their arguments are matched again
+        with open(os.path.join(self.proc_path, '10', 'cmdline'), 'wb') as out:
+            out.write(b'mpd\0')
+
+        self.assertEqual({'process.mpd', 'process.kthreadd'}, scanner.scan())
+
+        # Exited processes are forgotten
+        shutil.rmtree(os.path.join(self.proc_path, '10'))
+        self.add_process(11, b'python\0-m\0homeassistant\0')
+
+        self.assertEqual({'process.ha', 'process.kthreadd'}, scanner.scan())
+        self.assertEqual(['1', '11', '2'], sorted(scanner._processes))
+
+    def test_scanner_ps(self):
+        """ Test finding processes with ps without /proc. """
+        self.addCleanup(setattr, process, 'PS_STRING', process.PS_STRING)
+        process.PS_STRING = \
+            "printf '  PID CMD\\n    1 /sbin/init\\n    7 /usr/bin/mpd\\n'"
+
+        scanner = process.ProcessScanner(
+            {'process.init': '/sbin/init', 'process.mpd': 'mpd',
+             'process.ha': 'homeassistant'},
+            os.path.join(self.proc_path, 'nonexisting'))
+
+        self.assertEqual({'process.init', 'process.mpd'}, scanner.scan())
@@ -5,12 +5,16 @@ ha_test.test_component_sun
 Tests Sun component.
 """
 # pylint: disable=too-many-public-methods,protected-access
+import os
+import shutil
+import tempfile
 import unittest
 import datetime as dt
 
 import ephem
 
 import homeassistant as ha
+import homeassistant.loader as loader
 from homeassistant.const import CONF_LATITUDE, CONF_LONGITUDE
 import homeassistant.components.sun as sun
 
@@ -72,6 +76,136 @@ class TestSun(unittest.TestCase):
         self.assertIsNone(sun.next_rising(self.hass, 'non.existing'))
         self.assertIsNone(sun.next_setting(self.hass, 'non.existing'))
 
+    def test_dawn_dusk(self):
+        """ Test retrieving dawn and dusk. """
+        self.assertTrue(sun.setup(
+            self.hass,
+            {ha.DOMAIN: {
+                CONF_LATITUDE: '32.87336',
+                CONF_LONGITUDE: '117.22743'
+            }}))
+
+        now = dt.datetime.now()
+
+        next_dawn = sun.next_dawn(self.hass)
+        next_dusk = sun.next_dusk(self.hass)
+
+        self.assertTrue(now < next_dawn < now + dt.timedelta(days=1))
+        self.assertTrue(now < next_dusk < now + dt.timedelta(days=1))
+
+    def test_sun_table(self):
+        """ Test the table of sun events and its cache file. """
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        path = os.path.join(config_dir, sun.SUN_TABLE_FILE)
+
+        observer = ephem.Observer()
+        observer.lat = '52.3731'  # pylint: disable=assigning-non-slot
+        observer.long = '4.8922'  # pylint: disable=assigning-non-slot
+        body_sun = ephem.Sun()  # pylint: disable=no-member
+
+        utc_now = dt.datetime.utcnow()
+
+        table = sun.SunTable('52.3731', '4.8922', path)
+
+        # Also compare a date far into the table
+        for date in (utc_now, utc_now + dt.timedelta(days=200)):
+            expected = observer.next_setting(body_sun, start=date).datetime()
+
+            self.assertTrue(abs(expected - table.next_event(
+                sun.EVENT_SETTING, date)) < dt.timedelta(seconds=1))
+
+        self.assertTrue(os.path.isfile(path))
+
+        # A new table for the same location is loaded from the file
+        cached = sun.SunTable('52.3731', '4.8922', path)
+        cached.compute = None
+
+        self.assertEqual(table.next_event(sun.EVENT_DAWN, utc_now),
+                         cached.next_event(sun.EVENT_DAWN, utc_now))
+
+        # A table for another location is computed again
+        other = sun.SunTable('32.87336', '117.22743', path)
+        other.ensure(utc_now)
+
+        self.assertNotEqual(table.next_event(sun.EVENT_DAWN, utc_now),
+                            other.next_event(sun.EVENT_DAWN, utc_now))
+
+        # A table that runs out is computed again
+        table.ensure(utc_now + dt.timedelta(days=sun.TABLE_DAYS))
+
+        self.assertTrue(table.end > utc_now + dt.timedelta(
+            days=sun.TABLE_DAYS + sun.TABLE_MIN_DAYS))
+
+    def test_polar_table(self):
+        """ Test the table close to the pole, with months without events. """
+        table = sun.SunTable('78.22', '15.65')
+
+        # The polar night in Longyearbyen ends mid February
+        rising = table.next_event(sun.EVENT_RISING,
+                                  dt.datetime(2014, 12, 1, 12))
+
+        self.assertTrue(dt.datetime(2015, 2, 1) < rising <
+                        dt.datetime(2015, 3, 1))
+
+        # Before the next polar night the table runs out of risings and is
+        # computed again from that date
+        rising = table.next_event(sun.EVENT_RISING,
+                                  dt.datetime(2015, 11, 1, 12))
+
+        self.assertTrue(dt.datetime(2016, 2, 1) < rising <
+                        dt.datetime(2016, 3, 1))
+
+        # Events that are not in the table are None
+        table.events[sun.EVENT_RISING] = []
+        table.end = dt.datetime(2016, 11, 1)
+
+        self.assertIsNone(table.next_event(sun.EVENT_RISING,
+                                           dt.datetime(2015, 11, 1, 12)))
+
+        # The state shows the sun up until it sets
+        self.hass.config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.hass.config_dir)
+
+        next_event = sun.SunTable.next_event
+
+        def no_rising(table, event, utc_now):
+            """ Sun that does not rise in the coming year. """
+            if event == sun.EVENT_RISING:
+                return None
+
+            return next_event(table, event, utc_now)
+
+        self.addCleanup(setattr, sun.SunTable, 'next_event', next_event)
+        sun.SunTable.next_event = no_rising
+
+        self.assertTrue(sun.setup(self.hass, {ha.DOMAIN: {
+            CONF_LATITUDE: '78.22', CONF_LONGITUDE: '15.65'}}))
+
+        self.assertTrue(sun.is_on(self.hass))
+        self.assertIsNone(sun.next_rising(self.hass))
+        self.assertIsNotNone(sun.next_setting(self.hass))
+
+    def test_cached_table_skips_ephem(self):
+        """ Test that ephem is not imported when the table is cached. """
+        self.hass.config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.hass.config_dir)
+
+        config = {ha.DOMAIN: {CONF_LATITUDE: '32.87336',
+                              CONF_LONGITUDE: '117.22743'}}
+
+        self.assertTrue(sun.setup(self.hass, config))
+
+        self.addCleanup(setattr, sun, 'ephem', sun.ephem)
+        sun.ephem = loader.lazy_import('ephem')
+
+        self.assertTrue(sun.setup(self.hass, config))
+        self.assertFalse(sun.ephem.loaded)
+
+        # Other notations are validated by ephem
+        self.assertTrue(sun.setup(self.hass, {ha.DOMAIN: {
+            CONF_LATITUDE: '32:52:24', CONF_LONGITUDE: '117.22743'}}))
+
     def test_state_change(self):
         """ Test if the state changes at next setting/rising. """
         self.assertTrue(sun.setup(
@@ -6,13 +6,16 @@ Tests switch component.
 """
 # pylint: disable=too-many-public-methods,protected-access
 import unittest
+import threading
+import http.server
+import urllib.request
 
 import homeassistant as ha
 import homeassistant.loader as loader
 from homeassistant.const import STATE_ON, STATE_OFF, CONF_PLATFORM
 import homeassistant.components.switch as switch
 
-from helpers import get_test_home_assistant
+from helpers import get_test_home_assistant, MockToggleDevice
 
 
 class TestSwitch(unittest.TestCase):
@@ -82,6 +85,145 @@ class TestSwitch(unittest.TestCase):
         self.assertTrue(switch.is_on(self.hass, self.switch_2.entity_id))
         self.assertTrue(switch.is_on(self.hass, self.switch_3.entity_id))
 
+    def test_wemo_io_per_update(self):
+        """ Benchmark the requests of a WeMo Insight state update. """
+        wemo = loader.get_component('switch.wemo')
+
+        class FakeInsight(object):
+            """ Counts the requests made to the switch. """
+            name = 'Fan'
+            model = 'Belkin Insight 1.0'
+            requests = []
+
+            def get_state(self, force_update=False):
+                """ State request. """
+                self.requests.append('get_state')
+                return 1
+
+            @property
+            def insight_params(self):
+                """ Power usage request. """
+                self.requests.append('insight_params')
+                return {'state': '8', 'currentpower': 1200, 'todaymw': 3000}
+
+        insight = FakeInsight()
+        fan = wemo.WemoSwitch(insight)
+        fan.entity_id = 'switch.fan'
+
+        fan.update_ha_state(self.hass)
+
+        # The Insight parameters include the state
+        self.assertEqual(['insight_params'], insight.requests)
+
+        state = self.hass.states.get('switch.fan')
+        self.assertEqual(STATE_ON, state.state)
+        self.assertEqual(1200,
+                         state.attributes[switch.ATTR_CURRENT_POWER_MWH])
+
+    def test_push_updates(self):
+        """ Test switches that report their state changes. """
+        platform = loader.get_component('switch.test')
+
+        class PushDevice(MockToggleDevice):
+            """ Switch that reports its state changes. """
+            callback = None
+
+            def subscribe(self, callback):
+                """ Remember callback. """
+                self.callback = callback
+                return True
+
+        push_switch = PushDevice('Pushing', STATE_OFF)
+        platform.init()
+        platform.DEVICES.append(push_switch)
+
+        self.assertTrue(switch.setup(
+            self.hass, {switch.DOMAIN: {CONF_PLATFORM: 'test'}}))
+
+        self.assertFalse(switch.is_on(self.hass, push_switch.entity_id))
+
+        # Switched by hand
+        push_switch.state = STATE_ON
+        push_switch.callback()
+
+        self.hass.pool.block_till_done()
+
+        self.assertTrue(switch.is_on(self.hass, push_switch.entity_id))
+
+    def test_wemo_subscription(self):
+        """ Test receiving the state changes of WeMo switches. """
+        wemo = loader.get_component('switch.wemo')
+
+        subscribe_requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """ Acts as the event service of a WeMo switch. """
+
+            def do_SUBSCRIBE(self):  # pylint: disable=invalid-name
+                """ Accept the subscription. """
+                subscribe_requests.append(dict(self.headers))
+                self.send_response(200)
+                self.send_header('SID', 'uuid:1')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            # pylint: disable=redefined-builtin
+            def log_message(self, format, *args):
+                """ Do not log requests. """
+
+        device = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=device.serve_forever, daemon=True).start()
+
+        class FakeWemo(object):
+            """ Switch at the address of the test server. """
+            host = '127.0.0.1'
+            port = device.server_port
+            name = 'Fan'
+            model = 'Belkin Plugin Socket 1.0'
+
+        registry = wemo.SubscriptionRegistry(self.hass)
+        fan = wemo.WemoSwitch(FakeWemo(), registry)
+        fan.entity_id = 'switch.fan'
+
+        try:
+            self.assertTrue(fan.subscribe(
+                lambda: fan.update_ha_state(self.hass)))
+
+            callback_url = subscribe_requests[0]['CALLBACK'].strip('<>')
+            self.assertEqual('upnp:event', subscribe_requests[0]['NT'])
+
+            # Renewals use the subscription id
+            registry.renew()
+            self.assertEqual('uuid:1', subscribe_requests[1]['SID'])
+
+            notify = urllib.request.Request(
+                callback_url, method='NOTIFY',
+                data=b'<e:propertyset '
+                     b'xmlns:e="urn:schemas-upnp-org:event-1-0"><e:property>'
+                     b'<BinaryState>1</BinaryState>'
+                     b'</e:property></e:propertyset>')
+            urllib.request.urlopen(notify).close()
+
+            self.assertEqual(STATE_ON,
+                             self.hass.states.get('switch.fan').state)
+
+            # Without a route to the switch it is polled instead
+            def no_route(host):
+                """ Fails like connecting to an unreachable network. """
+                raise OSError(101, 'Network is unreachable')
+
+            self.addCleanup(setattr, wemo, '_local_ip', wemo._local_ip)
+            wemo._local_ip = no_route
+
+            del subscribe_requests[:]
+            self.assertFalse(registry.subscribe(FakeWemo(), None))
+            self.assertEqual([], subscribe_requests)
+
+        finally:
+            registry.stop()
+            device.shutdown()
+            device.server_close()
+
     def test_setup(self):
         # Bogus config
         self.assertFalse(switch.setup(self.hass, {}))
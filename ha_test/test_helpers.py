@@ -5,14 +5,19 @@ ha_test.test_helpers
 Tests component helpers.
 """
 # pylint: disable=protected-access,too-many-public-methods
+import threading
+import time
 import unittest
 
-from helpers import get_test_home_assistant
+from helpers import get_test_home_assistant, MockToggleDevice
 
 import homeassistant as ha
 import homeassistant.loader as loader
+import homeassistant.helpers as ha_helpers
 from homeassistant.const import STATE_ON, STATE_OFF, ATTR_ENTITY_ID
-from homeassistant.helpers import extract_entity_ids
+from homeassistant.helpers import (
+    extract_entity_ids, DevicePoller, CommandQueue, CommandQueues,
+    BatchSender)
 
 
 class TestComponentsCore(unittest.TestCase):
@@ -47,3 +52,188 @@ class TestComponentsCore(unittest.TestCase):
 
         self.assertEqual(['light.Ceiling', 'light.Kitchen'],
                          extract_entity_ids(self.hass, call))
+
+    def test_device_poller(self):
+        """ Test polling devices concurrently. """
+        release = threading.Event()
+
+        # Only passes when all responsive devices are polled at once
+        barrier = threading.Barrier(4, timeout=5)
+
+        class SlowDevice(MockToggleDevice):
+            """ Device that waits for the others to report its state. """
+            def __init__(self, name, stuck=False):
+                super().__init__(name, STATE_ON)
+                self.stuck = stuck
+
+            def is_on(self):
+                """ Block before reporting the state. """
+                if self.stuck:
+                    release.wait()
+                else:
+                    barrier.wait()
+
+                return super().is_on()
+
+        devices = [SlowDevice('dev{}'.format(idx)) for idx in range(4)]
+        devices.append(SlowDevice('stuck', True))
+
+        for device in devices:
+            device.entity_id = 'switch.{}'.format(device.name)
+
+        poller = DevicePoller(self.hass, devices, 'switch',
+                              max_workers=5, timeout=0.5)
+
+        self.addCleanup(release.set)
+
+        # Devices are polled concurrently and the stuck one times out
+        self.assertEqual([devices[-1]], poller.poll())
+
+        for device in devices[:-1]:
+            self.assertTrue(self.hass.states.is_state(device.entity_id,
+                                                      STATE_ON))
+        self.assertIsNone(self.hass.states.get('switch.stuck'))
+
+        # Device that is still busy is skipped by the next poll
+        self.assertEqual([], poller.poll())
+        self.assertEqual(2, len(devices[0].calls))
+        self.assertEqual(0, len(devices[-1].calls))
+
+        release.set()
+
+    def test_command_queue(self):
+        """ Test coalescing and rate limiting of device commands. """
+        queue = CommandQueue(min_interval=0.2)
+        release = threading.Event()
+        calls = []
+
+        def command(**kwargs):
+            """ Blocks the first call until released. """
+            calls.append((time.time(), kwargs))
+            release.wait()
+
+        sender = threading.Thread(
+            target=queue.put, args=('turn_on', command, {'brightness': 10}))
+        sender.start()
+
+        while not calls:
+            time.sleep(0.01)
+
+        # Commands put while a command is being sent are coalesced
+        self.assertFalse(queue.put('turn_on', command, {'brightness': 20}))
+        self.assertFalse(queue.put('turn_on', command, {'xy_color': [1, 0]}))
+        self.assertEqual(2, queue.depth)
+
+        release.set()
+        sender.join()
+
+        self.assertEqual(
+            [{'brightness': 10}, {'brightness': 20, 'xy_color': [1, 0]}],
+            [kwargs for _, kwargs in calls])
+        self.assertEqual(2, queue.sent)
+        self.assertEqual(1, queue.coalesced)
+        self.assertEqual(0, queue.depth)
+
+        # Commands are rate limited
+        self.assertTrue(queue.put('turn_off', command, {}))
+        self.assertGreaterEqual(calls[2][0] - calls[1][0], 0.19)
+
+    def test_batch_sender(self):
+        """ Test coalescing and batching commands of a batch handler. """
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+
+        class Device(MockToggleDevice):
+            """ Records the commands sent to it alone. """
+            def turn_on(self, **kwargs):
+                """ Blocks the first command until released. """
+                calls.append(('single', self.entity_id, kwargs))
+                release.wait()
+
+        class Handler(object):
+            """ Records the commands sent to several devices. """
+            min_command_interval = 0.2
+
+            # pylint: disable=no-self-use
+            def turn_on(self, devices, **kwargs):
+                """ Turns devices on. """
+                calls.append(('batch', [dev.entity_id for dev in devices],
+                              kwargs))
+
+        devices = [Device('dev{}'.format(idx), STATE_OFF)
+                   for idx in range(3)]
+
+        for device in devices:
+            device.entity_id = 'light.' + device.name
+
+        sender = BatchSender(Handler(), CommandQueues())
+
+        thread = threading.Thread(
+            target=sender.put,
+            args=([devices[0]], 'turn_on', {'brightness': 1}))
+        thread.start()
+
+        while not calls:
+            time.sleep(0.01)
+
+        # Commands put while sending are coalesced per device and sent
+        # by the sending thread
+        for brightness in range(2, 10):
+            self.assertEqual(
+                [], sender.put([devices[0]], 'turn_on',
+                               {'brightness': brightness}))
+
+        self.assertEqual([], sender.put(devices[1:], 'turn_on',
+                                        {'brightness': 20}))
+
+        release.set()
+        thread.join()
+
+        self.assertEqual(
+            [('single', 'light.dev0', {'brightness': 1}),
+             ('single', 'light.dev0', {'brightness': 9}),
+             ('batch', ['light.dev1', 'light.dev2'], {'brightness': 20})],
+            calls)
+
+        # Only batches wait for the interval of the handler
+        sleeps = []
+
+        class FakeTime(object):
+            """ Records sleeps instead of sleeping. """
+            time = staticmethod(time.time)
+            sleep = staticmethod(sleeps.append)
+
+        self.addCleanup(setattr, ha_helpers, 'time', ha_helpers.time)
+        ha_helpers.time = FakeTime
+
+        sender.put(devices[:1], 'turn_on', {})
+        self.assertEqual([], sleeps)
+
+        self.assertEqual(devices[:2], sender.put(devices[:2], 'turn_on', {}))
+        self.assertEqual(1, len(sleeps))
+        self.assertTrue(0 < sleeps[0] <= Handler.min_command_interval)
+
+    def test_command_queues(self):
+        """ Test that idle command queues are removed. """
+        queues = CommandQueues()
+
+        with queues.hold('light.bowl') as queue:
+            queue.put('turn_on', lambda: None, {})
+
+            self.assertEqual(1, len(queues))
+
+        self.assertEqual(0, len(queues))
+
+        # Queues are kept while they limit the rate of commands
+        with queues.hold('light.ceiling', 0.2) as queue:
+            queue.put('turn_on', lambda: None, {})
+
+        self.assertEqual(1, len(queues))
+
+        time.sleep(0.2)
+
+        with queues.hold('light.bowl') as queue:
+            pass
+
+        self.assertEqual(0, len(queues))
@@ -6,6 +6,9 @@ Provides tests to verify that we can load components.
 """
 # pylint: disable=too-many-public-methods,protected-access
 import unittest
+import os
+import json
+import sys
 
 import homeassistant.loader as loader
 import homeassistant.components.http as http
@@ -85,3 +88,59 @@ class TestLoader(unittest.TestCase):
         self.assertEqual(
             ['group', 'mod2'],
             loader.load_order_components(['mod2', 'mod1']))
+
+    def test_component_index(self):
+        """ Test that prepare uses and invalidates the component index. """
+        index_path = self.hass.get_config_path(loader.COMPONENT_INDEX_FILE)
+
+        self.assertTrue(os.path.isfile(index_path))
+        self.assertIn('homeassistant.components.http',
+                      loader.AVAILABLE_COMPONENTS)
+        self.assertIn('custom_components.light',
+                      loader.AVAILABLE_COMPONENTS)
+
+        with open(index_path) as inp:
+            index = json.load(inp)
+
+        # A valid index is used without scanning the directories
+        index['components'].append('custom_components.from_index')
+
+        with open(index_path, 'w') as outp:
+            json.dump(index, outp)
+
+        loader.prepare(self.hass)
+
+        self.assertIn('custom_components.from_index',
+                      loader.AVAILABLE_COMPONENTS)
+
+        # An outdated index triggers a new scan
+        index['key'][0][1] = 0
+
+        with open(index_path, 'w') as outp:
+            json.dump(index, outp)
+
+        loader.prepare(self.hass)
+
+        self.assertNotIn('custom_components.from_index',
+                         loader.AVAILABLE_COMPONENTS)
+        self.assertIn('homeassistant.components.http',
+                      loader.AVAILABLE_COMPONENTS)
+
+    def test_lazy_import(self):
+        """ Test that lazy_import defers the import till first use. """
+        sys.modules.pop('colorsys', None)
+
+        colorsys = loader.lazy_import('colorsys')
+
+        self.assertTrue(colorsys.available)
+        self.assertFalse(colorsys.loaded)
+        self.assertNotIn('colorsys', sys.modules)
+
+        self.assertEqual((0, 0, 0), colorsys.rgb_to_hsv(0, 0, 0))
+        self.assertTrue(colorsys.loaded)
+        self.assertIn('colorsys', sys.modules)
+
+        missing = loader.lazy_import('non_existing_module.sub')
+
+        self.assertFalse(missing.available)
+        self.assertRaises(ImportError, getattr, missing, 'attr')
@@ -0,0 +1,104 @@
+"""
+ha_test.test_profiler
+~~~~~~~~~~~~~~~~~~~~~
+
+Tests the startup profiler.
+"""
+# pylint: disable=too-many-public-methods,protected-access
+import unittest
+import io
+import os
+import json
+import tempfile
+from contextlib import redirect_stdout
+
+import homeassistant.profiler as profiler
+import homeassistant.loader as loader
+import homeassistant.bootstrap as bootstrap
+import homeassistant.__main__ as ha_main
+
+from helpers import get_test_home_assistant
+
+
+class TestProfiler(unittest.TestCase):
+    """ Test the profiler module. """
+
+    def tearDown(self):  # pylint: disable=invalid-name
+        """ Stop down stuff we started. """
+        profiler.disable()
+
+    def test_disabled(self):
+        """ Test that nothing gets recorded when disabled. """
+        with profiler.timed(profiler.CATEGORY_PHASE, 'test'):
+            pass
+
+        self.assertFalse(profiler.is_enabled())
+        self.assertEqual([], profiler.report()['records'])
+
+    def test_timed(self):
+        """ Test recording a timing. """
+        profiler.enable()
+
+        with profiler.timed(profiler.CATEGORY_PHASE, 'test'):
+            pass
+
+        records = profiler.report()['records']
+
+        self.assertEqual(1, len(records))
+        self.assertEqual('test', records[0]['name'])
+        self.assertEqual(profiler.CATEGORY_PHASE, records[0]['category'])
+        self.assertGreaterEqual(records[0]['wall'], 0)
+
+    def test_bootstrap_report(self):
+        """ Test that bootstrap records phases, imports and setups. """
+        profiler.enable()
+
+        hass = get_test_home_assistant()
+
+        # Make sure the import is not already cached
+        loader._COMPONENT_CACHE.pop('sun', None)
+
+        bootstrap.from_config_dict({'sun': {}}, hass)
+
+        hass.stop()
+
+        names = {(rec['category'], rec['name'])
+                 for rec in profiler.report()['records']}
+
+        self.assertIn((profiler.CATEGORY_PHASE, 'loader.prepare'), names)
+        self.assertIn((profiler.CATEGORY_PHASE, 'components setup'), names)
+        self.assertIn(
+            (profiler.CATEGORY_IMPORT, 'homeassistant.components.sun'), names)
+        self.assertIn((profiler.CATEGORY_SETUP, 'sun'), names)
+
+        self.assertIn('sun', profiler.summary())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'report.json')
+
+            profiler.write_report(path)
+
+            with open(path) as inp:
+                self.assertEqual(
+                    len(profiler.report()['records']),
+                    len(json.load(inp)['records']))
+
+    def test_report_startup_profile(self):
+        """ Test the report printed and written at startup. """
+        profiler.enable()
+
+        with profiler.timed(profiler.CATEGORY_PHASE, 'start'):
+            pass
+
+        output = io.StringIO()
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                redirect_stdout(output):
+            ha_main.report_startup_profile(tmp_dir)
+
+            with open(os.path.join(tmp_dir, 'startup_profile.json')) as inp:
+                names = [rec['name'] for rec in json.load(inp)['records']]
+
+        self.assertIn('start', names)
+        self.assertIn('start', output.getvalue().split())
+        self.assertFalse(profiler.is_enabled())
@@ -122,6 +122,33 @@ class TestRemoteMethods(unittest.TestCase):
         self.assertEqual(hass.states.all(), remote.get_states(master_api))
         self.assertEqual([], remote.get_states(broken_api))
 
+    def test_iter_states(self):
+        """ Test Python API iter_states. """
+        self.assertEqual(hass.states.all(),
+                         list(remote.iter_states(master_api)))
+
+        self.assertRaises(ha.HomeAssistantError, list,
+                          remote.iter_states(broken_api))
+
+    def test_iter_json_array(self):
+        """ Test decoding a JSON array that arrives in chunks. """
+        data = '[{"a": 1}, "bé", 123, [4, 5], {"c": {"d": []}}] '
+        raw = data.encode('utf-8')
+        expected = [{"a": 1}, "bé", 123, [4, 5], {"c": {"d": []}}]
+
+        # Split the document at every possible position
+        for size in range(1, len(raw) + 1):
+            chunks = [raw[i:i+size] for i in range(0, len(raw), size)]
+
+            self.assertEqual(expected,
+                             list(remote._iter_json_array(chunks)))
+
+        self.assertEqual([], list(remote._iter_json_array([b' [ ] '])))
+
+        for invalid in (b'{"a": 1}', b'[1, 2', b'[{"a": 1}', b''):
+            self.assertRaises(ValueError, list,
+                              remote._iter_json_array([invalid]))
+
     def test_set_state(self):
         """ Test Python API set_state. """
         self.assertTrue(remote.set_state(master_api, 'test.test', 'set_test'))
@@ -6,7 +6,7 @@ import argparse
 import importlib
 
 try:
-    from homeassistant import bootstrap
+    from homeassistant import bootstrap, profiler
 
 except ImportError:
     # This is to add support to load Home Assistant using
@@ -15,7 +15,20 @@ except ImportError:
     # Insert the parent directory of this file into the module search path
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-    from homeassistant import bootstrap
+    from homeassistant import bootstrap, profiler
+
+
+def report_startup_profile(config_dir):
+    """ Prints and writes the startup profile, then stops recording. """
+    profile_path = os.path.join(config_dir, 'startup_profile.json')
+
+    # Disabling the profiler discards the records, report first
+    profiler.write_report(profile_path)
+
+    print(profiler.summary())
+    print("Startup profile written to {}".format(profile_path))
+
+    profiler.disable()
 
 
 def main():
@@ -28,6 +41,12 @@ def main():
         default="config",
         help="Directory that contains the Home Assistant configuration")
 
+    parser.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help=("Record import and setup timings of the startup and write "
+              "them to startup_profile.json in the config dir"))
+
     args = parser.parse_args()
 
     # Validate that all core dependencies are installed
@@ -68,8 +87,17 @@ def main():
                    'to write a default one to {}').format(config_path))
             sys.exit()
 
+    if args.profile_startup:
+        profiler.enable()
+
     hass = bootstrap.from_config_file(config_path)
-    hass.start()
+
+    with profiler.timed(profiler.CATEGORY_PHASE, 'start'):
+        hass.start()
+
+    if args.profile_startup:
+        report_startup_profile(config_dir)
+
     hass.block_till_stopped()
 
 if __name__ == "__main__":
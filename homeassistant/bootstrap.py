@@ -10,16 +10,21 @@ start by calling homeassistant.start_home_assistant(bus)
 """
 
 import os
+import time
 import configparser
 import logging
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import homeassistant
 import homeassistant.loader as loader
+import homeassistant.profiler as profiler
 import homeassistant.components as core_components
 
+# Maximum number of components that are set up at the same time
+SETUP_WORKERS = 8
+
 
-# pylint: disable=too-many-branches, too-many-statements
 def from_config_dict(config, hass=None):
     """
     Tries to configure Home Assistant from a config dict.
@@ -31,7 +36,8 @@ def from_config_dict(config, hass=None):
 
     logger = logging.getLogger(__name__)
 
-    loader.prepare(hass)
+    with profiler.timed(profiler.CATEGORY_PHASE, 'loader.prepare'):
+        loader.prepare(hass)
 
     # Make a copy because we are mutating it.
     # Convert it to defaultdict so components can always have config dict
@@ -41,7 +47,10 @@ def from_config_dict(config, hass=None):
     components = (key for key in config.keys()
                   if ' ' not in key and key != homeassistant.DOMAIN)
 
-    if not core_components.setup(hass, config):
+    with profiler.timed(profiler.CATEGORY_PHASE, 'core setup'):
+        core_initialized = core_components.setup(hass, config)
+
+    if not core_initialized:
         logger.error(("Home Assistant core failed to initialize. "
                       "Further initialization aborted."))
 
@@ -49,32 +58,118 @@ def from_config_dict(config, hass=None):
 
     logger.info("Home Assistant core initialized")
 
+    with profiler.timed(profiler.CATEGORY_PHASE, 'load order'):
+        load_order = list(loader.load_order_components(components))
+
     # Setup the components
+    with profiler.timed(profiler.CATEGORY_PHASE, 'components setup'):
+        _setup_components(hass, config, load_order, logger)
+
+    return hass
+
+
+# pylint: disable=too-many-locals
+def _setup_components(hass, config, load_order, logger):
+    """
+    Sets up the components in load_order.
+
+    Components whose dependencies have been set up are set up concurrently
+    on a bounded executor. The group component and everything ordered after
+    it only start once all components ordered before it are done.
+    """
+    if 'group' in load_order:
+        group_index = load_order.index('group')
+        batches = [load_order[:group_index], load_order[group_index:]]
+    else:
+        batches = [load_order]
 
     # We assume that all components that load before the group component loads
     # are components that poll devices. As their tasks are IO based, we will
     # add an extra worker for each of them.
     add_worker = True
 
-    for domain in loader.load_order_components(components):
-        component = loader.get_component(domain)
+    start = time.time()
+    timeline = []
 
-        try:
-            if component.setup(hass, config):
-                logger.info("component %s initialized", domain)
+    with ThreadPoolExecutor(max_workers=SETUP_WORKERS) as executor:
+        for batch in batches:
+            for domain, result, started, finished in _setup_batch(
+                    hass, config, batch, executor, logger):
 
-                add_worker = add_worker and domain != "group"
+                timeline.append((domain, started - start, finished - started))
 
-                if add_worker:
+                if result and add_worker:
                     hass.pool.add_worker()
 
-            else:
-                logger.error("component %s failed to initialize", domain)
+            add_worker = False
 
-        except Exception:  # pylint: disable=broad-except
-            logger.exception("Error during setup of component %s", domain)
+    for domain, started, duration in timeline:
+        logger.info("Setup of %s started at %.3fs and took %.3fs",
+                    domain, started, duration)
 
-    return hass
+
+def _setup_batch(hass, config, batch, executor, logger):
+    """
+    Generator that sets up a batch of components, each as soon as its
+    dependencies within the batch are done. Yields a tuple
+    (domain, result, started, finished) per component as it finishes.
+    """
+    # Dependencies outside of this batch have been set up already.
+    waiting_for = {
+        domain: set(loader.get_component(domain).DEPENDENCIES) & set(batch)
+        for domain in batch}
+
+    running = {}
+
+    while waiting_for or running:
+        for domain in [domain for domain in batch
+                       if not waiting_for.get(domain, True)]:
+            del waiting_for[domain]
+
+            running[executor.submit(
+                _setup_component, hass, config, domain, logger)] = domain
+
+        if not running:
+            # Can only happen if dependencies are unresolvable
+            logger.error("Unable to setup components with unresolved "
+                         "dependencies: %s", ", ".join(waiting_for))
+            return
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            domain = running.pop(future)
+
+            for dependencies in waiting_for.values():
+                dependencies.discard(domain)
+
+            yield (domain,) + future.result()
+
+
+def _setup_component(hass, config, domain, logger):
+    """
+    Sets up a single component.
+    Returns a tuple (result, started, finished).
+    """
+    component = loader.get_component(domain)
+
+    started = time.time()
+    result = False
+
+    try:
+        with profiler.timed(profiler.CATEGORY_SETUP, domain):
+            result = component.setup(hass, config)
+
+        if result:
+            logger.info("component %s initialized", domain)
+
+        else:
+            logger.error("component %s failed to initialize", domain)
+
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Error during setup of component %s", domain)
+
+    return bool(result), started, time.time()
 
 
 def from_config_file(config_path, hass=None, enable_logging=True):
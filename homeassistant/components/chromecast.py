@@ -5,9 +5,12 @@ homeassistant.components.chromecast
 Provides functionality to interact with Chromecasts.
 """
 import logging
+import threading
 
+import homeassistant as ha
 import homeassistant.util as util
-from homeassistant.helpers import extract_entity_ids
+from homeassistant.loader import lazy_import
+from homeassistant.helpers import extract_entity_ids, DevicePoller
 from homeassistant.const import (
     ATTR_ENTITY_ID, ATTR_FRIENDLY_NAME, SERVICE_TURN_OFF, SERVICE_VOLUME_UP,
     SERVICE_VOLUME_DOWN, SERVICE_MEDIA_PLAY_PAUSE, SERVICE_MEDIA_PLAY,
@@ -38,6 +41,15 @@ MEDIA_STATE_UNKNOWN = 'unknown'
 MEDIA_STATE_PLAYING = 'playing'
 MEDIA_STATE_STOPPED = 'stopped'
 
+# Scan the network for new Chromecasts every this many minutes
+DISCOVERY_MINUTES = 10
+
+# Seconds to wait for a Chromecast to report its status
+REFRESH_TIMEOUT = 5
+
+# Imported when connecting to the Chromecasts
+pychromecast = lazy_import('pychromecast')  # pylint: disable=invalid-name
+
 
 def is_on(hass, entity_id=None):
     """ Returns true if specified ChromeCast entity_id is on.
@@ -105,99 +117,172 @@ def media_prev_track(hass, entity_id=None):
     hass.services.call(DOMAIN, SERVICE_MEDIA_PREV_TRACK, data)
 
 
+class CastDevice(object):
+    """ Writes the state of a Chromecast to the state machine. """
+
+    def __init__(self, entity_id, cast):
+        self.entity_id = entity_id
+        self.cast = cast
+
+        # Status of the last update, used to skip unchanged casts
+        self.last_status = None
+
+    def get_status(self):
+        """ Returns a tuple that describes what the cast is doing. """
+        app = self.cast.app
+
+        if not app or app.app_id == pychromecast.APP_ID['HOME']:
+            return (STATE_NO_APP,)
+
+        ramp = self.cast.get_protocol(pychromecast.PROTOCOL_RAMP)
+
+        if not ramp or ramp.state == pychromecast.RAMP_STATE_UNKNOWN:
+            return (app.app_id,)
+
+        return (app.app_id, ramp.state, ramp.content_id, ramp.title,
+                ramp.artist, ramp.album, ramp.image_url, ramp.duration,
+                ramp.volume)
+
+    # pylint: disable=unused-argument
+    def update_ha_state(self, hass, force_refresh=True):
+        """ Retrieve state of Chromecast and update statemachine. """
+        self.cast.refresh()
+
+        status = self.get_status()
+
+        if status == self.last_status:
+            return
+
+        state_attr = {ATTR_FRIENDLY_NAME:
+                      self.cast.device.friendly_name}
+
+        if len(status) > 1:
+            (_, ramp_state, content_id, title, artist, album, image_url,
+             duration, volume) = status
+
+            if ramp_state == pychromecast.RAMP_STATE_PLAYING:
+                state_attr[ATTR_MEDIA_STATE] = MEDIA_STATE_PLAYING
+            else:
+                state_attr[ATTR_MEDIA_STATE] = MEDIA_STATE_STOPPED
+
+            if content_id:
+                state_attr[ATTR_MEDIA_CONTENT_ID] = content_id
+
+            if title:
+                state_attr[ATTR_MEDIA_TITLE] = title
+
+            if artist:
+                state_attr[ATTR_MEDIA_ARTIST] = artist
+
+            if album:
+                state_attr[ATTR_MEDIA_ALBUM] = album
+
+            if image_url:
+                state_attr[ATTR_MEDIA_IMAGE_URL] = image_url
+
+            if duration:
+                state_attr[ATTR_MEDIA_DURATION] = duration
+
+            state_attr[ATTR_MEDIA_VOLUME] = volume
+
+        hass.states.set(self.entity_id, status[0], state_attr)
+
+        self.last_status = status
+
+
 # pylint: disable=too-many-locals, too-many-branches
 def setup(hass, config):
     """ Listen for chromecast events. """
     logger = logging.getLogger(__name__)
 
-    try:
-        import pychromecast
-    except ImportError:
-        logger.exception(("Failed to import pychromecast. "
-                          "Did you maybe not install the 'pychromecast' "
-                          "dependency?"))
+    if not pychromecast.available:
+        logger.error(("Failed to import pychromecast. "
+                      "Did you maybe not install the 'pychromecast' "
+                      "dependency?"))
 
         return False
 
-    if CONF_HOSTS in config[DOMAIN]:
-        hosts = config[DOMAIN][CONF_HOSTS].split(",")
-
-    # If no hosts given, scan for chromecasts
-    else:
-        logger.info("Scanning for Chromecasts")
-        hosts = pychromecast.discover_chromecasts()
-
     casts = {}
+    devices = []
+    devices_by_entity_id = {}
+    lock = threading.Lock()
 
-    for host in hosts:
-        try:
-            cast = pychromecast.PyChromecast(host)
-
-            entity_id = util.ensure_unique_string(
-                ENTITY_ID_FORMAT.format(
-                    util.slugify(cast.device.friendly_name)),
-                casts.keys())
-
-            casts[entity_id] = cast
+    poller = DevicePoller(hass, devices, DOMAIN, timeout=REFRESH_TIMEOUT)
 
-        except pychromecast.ChromecastConnectionError:
-            pass
+    def add_casts(hosts):
+        """ Connects to the Chromecasts at hosts that are not known yet. """
+        with lock:
+            known_hosts = set(cast.host for cast in casts.values())
 
-    if not casts:
-        logger.error("Could not find Chromecasts")
-        return False
+        for host in hosts:
+            if host in known_hosts:
+                continue
 
-    def update_chromecast_state(entity_id, chromecast):
-        """ Retrieve state of Chromecast and update statemachine. """
-        chromecast.refresh()
+            try:
+                cast = pychromecast.PyChromecast(host)
 
-        status = chromecast.app
+            except pychromecast.ChromecastConnectionError:
+                continue
 
-        state_attr = {ATTR_FRIENDLY_NAME:
-                      chromecast.device.friendly_name}
+            with lock:
+                entity_id = util.ensure_unique_string(
+                    ENTITY_ID_FORMAT.format(
+                        util.slugify(cast.device.friendly_name)),
+                    casts.keys())
 
-        if status and status.app_id != pychromecast.APP_ID['HOME']:
-            state = status.app_id
+                casts[entity_id] = cast
 
-            ramp = chromecast.get_protocol(pychromecast.PROTOCOL_RAMP)
+                device = CastDevice(entity_id, cast)
+                devices.append(device)
+                devices_by_entity_id[entity_id] = device
 
-            if ramp and ramp.state != pychromecast.RAMP_STATE_UNKNOWN:
+            logger.info("Found Chromecast %s at %s", entity_id, host)
 
-                if ramp.state == pychromecast.RAMP_STATE_PLAYING:
-                    state_attr[ATTR_MEDIA_STATE] = MEDIA_STATE_PLAYING
-                else:
-                    state_attr[ATTR_MEDIA_STATE] = MEDIA_STATE_STOPPED
+            device.update_ha_state(hass)
 
-                if ramp.content_id:
-                    state_attr[ATTR_MEDIA_CONTENT_ID] = ramp.content_id
+    # pylint: disable=unused-argument
+    def discover_casts(now):
+        """ Scans the network for Chromecasts and adds the new ones. """
+        logger.info("Scanning for Chromecasts")
 
-                if ramp.title:
-                    state_attr[ATTR_MEDIA_TITLE] = ramp.title
+        add_casts(pychromecast.discover_chromecasts())
 
-                if ramp.artist:
-                    state_attr[ATTR_MEDIA_ARTIST] = ramp.artist
+    if CONF_HOSTS in config[DOMAIN]:
+        add_casts(config[DOMAIN][CONF_HOSTS].split(","))
 
-                if ramp.album:
-                    state_attr[ATTR_MEDIA_ALBUM] = ramp.album
+        if not casts:
+            logger.error("Could not find Chromecasts")
+            return False
 
-                if ramp.image_url:
-                    state_attr[ATTR_MEDIA_IMAGE_URL] = ramp.image_url
+    # If no hosts given, scan for chromecasts without blocking the startup
+    else:
+        hass.pool.add_job(ha.JobPriority.EVENT_DEFAULT,
+                          (discover_casts, None))
 
-                if ramp.duration:
-                    state_attr[ATTR_MEDIA_DURATION] = ramp.duration
+        hass.track_time_change(
+            discover_casts,
+            minute=list(range(0, 60, DISCOVERY_MINUTES)), second=0)
 
-                state_attr[ATTR_MEDIA_VOLUME] = ramp.volume
-        else:
-            state = STATE_NO_APP
+    # Only one poll at a time, casts that are slow to respond are skipped
+    # by the DevicePoller until they answer
+    polling = threading.Lock()
 
-        hass.states.set(entity_id, state, state_attr)
+    def update_chromecast_state(entity_id):
+        """ Retrieve state of Chromecast and update statemachine. """
+        devices_by_entity_id[entity_id].update_ha_state(hass)
 
     def update_chromecast_states(time):  # pylint: disable=unused-argument
         """ Updates all chromecast states. """
-        logger.info("Updating Chromecast status")
+        if not polling.acquire(False):
+            return
+
+        try:
+            logger.info("Updating Chromecast status")
+
+            poller.poll()
 
-        for entity_id, cast in casts.items():
-            update_chromecast_state(entity_id, cast)
+        finally:
+            polling.release()
 
     def _service_to_entities(service):
         """ Helper method to get entities from service. """
@@ -211,7 +296,10 @@ def setup(hass, config):
                     yield entity_id, cast
 
         else:
-            yield from casts.items()
+            with lock:
+                items = list(casts.items())
+
+            yield from items
 
     def turn_off_service(service):
         """ Service to exit any running app on the specified ChromeCast and
@@ -219,7 +307,7 @@ def setup(hass, config):
         """
         for entity_id, cast in _service_to_entities(service):
             cast.quit_app()
-            update_chromecast_state(entity_id, cast)
+            update_chromecast_state(entity_id)
 
     def volume_up_service(service):
         """ Service to send the chromecast the command for volume up. """
@@ -268,14 +356,14 @@ def setup(hass, config):
 
             if ramp:
                 next(ramp)
-                update_chromecast_state(entity_id, cast)
+                update_chromecast_state(entity_id)
 
     def play_youtube_video_service(service, video_id):
         """ Plays specified video_id on the Chromecast's YouTube channel. """
         if video_id:  # if service.data.get('video') returned None
             for entity_id, cast in _service_to_entities(service):
                 pychromecast.play_youtube_video(video_id, cast.host)
-                update_chromecast_state(entity_id, cast)
+                update_chromecast_state(entity_id)
 
     hass.track_time_change(update_chromecast_states)
 
@@ -8,15 +8,22 @@ import logging
 import threading
 import os
 import csv
+import time
+import sqlite3
+import urllib.parse
+from collections import namedtuple
 from datetime import datetime, timedelta
 
+import requests
+
+import homeassistant as ha
 from homeassistant.loader import get_component
-from homeassistant.helpers import validate_config
+from homeassistant.helpers import config_per_platform
 import homeassistant.util as util
+import homeassistant.profiler as profiler
 
 from homeassistant.const import (
-    STATE_HOME, STATE_NOT_HOME, ATTR_ENTITY_PICTURE, ATTR_FRIENDLY_NAME,
-    CONF_PLATFORM, CONF_TYPE)
+    STATE_HOME, STATE_NOT_HOME, ATTR_ENTITY_PICTURE, ATTR_FRIENDLY_NAME)
 from homeassistant.components import group
 
 DOMAIN = "device_tracker"
@@ -37,9 +44,36 @@ TIME_DEVICE_NOT_FOUND = timedelta(minutes=3)
 # Filename to save known devices to
 KNOWN_DEVICES_FILE = "known_devices.csv"
 
+# Filename of the indexed device registry backing the known devices file
+KNOWN_DEVICES_DB = "known_devices.db"
+
+# Optional per platform config: number of seconds between scans
+CONF_SCAN_INTERVAL = "scan_interval"
+
+# Scanners without scan_interval scan on every time event of the timer,
+# every TIMER_INTERVAL seconds, as they did before the option existed.
+# Scanners throttle their own scans if that is too often for them.
+DEFAULT_SCAN_INTERVAL = timedelta()
+
+# Maximum number of connections the HTTP client keeps open per host
+HTTP_MAX_CONNECTIONS_PER_HOST = 2
+
+# Default timeout for requests made with the HTTP client
+HTTP_TIMEOUT = 5
+
 
 _LOGGER = logging.getLogger(__name__)
 
+# Immutable result of a device scan.
+# devices: frozenset of found devices, scan_time: datetime the scan was
+# requested, duration: seconds the scan took.
+ScanResult = namedtuple('ScanResult', ['devices', 'scan_time', 'duration'])
+
+# Device found by a device scanner. Scanners keep these in a dict keyed by
+# MAC address. Only mac is required, the other fields default to None.
+ScannedDevice = namedtuple('ScannedDevice', ['mac', 'name', 'ip', 'signal'])
+ScannedDevice.__new__.__defaults__ = (None, None, None)
+
 
 def is_on(hass, entity_id=None):
     """ Returns if any or specified device is home. """
@@ -50,54 +84,81 @@ def is_on(hass, entity_id=None):
 
 def setup(hass, config):
     """ Sets up the device tracker. """
+    scan_loops = []
 
-    # CONF_TYPE is deprecated for CONF_PLATOFRM. We keep supporting it for now.
-    if not (validate_config(config, {DOMAIN: [CONF_PLATFORM]}, _LOGGER)
-            or validate_config(config, {DOMAIN: [CONF_TYPE]}, _LOGGER)):
+    for tracker_type, p_config in config_per_platform(config, DOMAIN, _LOGGER):
+        tracker_implementation = get_component(
+            'device_tracker.{}'.format(tracker_type))
 
-        return False
+        if tracker_implementation is None:
+            _LOGGER.error("Unknown device_tracker type specified: %s",
+                          tracker_type)
 
-    tracker_type = config[DOMAIN].get(CONF_PLATFORM)
+            continue
 
-    if tracker_type is None:
-        tracker_type = config[DOMAIN][CONF_TYPE]
+        # Scanners read their config from config[DOMAIN]
+        scanner_config = dict(config)
+        scanner_config[DOMAIN] = p_config
 
-        _LOGGER.warning((
-            "Please update your config for %s to use 'platform' "
-            "instead of 'type'"), tracker_type)
+        with profiler.timed(profiler.CATEGORY_PLATFORM,
+                            'device_tracker.{}'.format(tracker_type)):
+            device_scanner = tracker_implementation.get_scanner(
+                hass, scanner_config)
 
-    tracker_implementation = get_component(
-        'device_tracker.{}'.format(tracker_type))
+        if device_scanner is None:
+            _LOGGER.error("Failed to initialize device scanner for %s",
+                          tracker_type)
 
-    if tracker_implementation is None:
-        _LOGGER.error("Unknown device_tracker type specified.")
+            continue
 
-        return False
+        interval = util.convert(p_config.get(CONF_SCAN_INTERVAL), int)
 
-    device_scanner = tracker_implementation.get_scanner(hass, config)
+        scan_loops.append(ScanLoop(
+            hass, device_scanner,
+            name=util.ensure_unique_string(
+                tracker_type, (loop.name for loop in scan_loops)),
+            interval=DEFAULT_SCAN_INTERVAL if interval is None
+            else timedelta(seconds=interval)))
 
-    if device_scanner is None:
-        _LOGGER.error("Failed to initialize device scanner for %s",
-                      tracker_type)
+    if not scan_loops:
+        _LOGGER.error("No device scanners could be set up")
 
         return False
 
-    tracker = DeviceTracker(hass, device_scanner)
+    tracker = DeviceTracker(hass, scan_loops)
 
     # We only succeeded if we got to parse the known devices file
     return not tracker.invalid_known_devices_file
 
 
 class DeviceTracker(object):
-    """ Class that tracks which devices are home and which are not. """
+    """
+    Class that tracks which devices are home and which are not.
 
-    def __init__(self, hass, device_scanner):
+    Accepts a device scanner or a list of ScanLoops. The results of all
+    scanners are merged: a device is home if any of the scanners has seen
+    it in the last TIME_DEVICE_NOT_FOUND. The results of each scanner are
+    applied as soon as its scan finishes, so a fast scanner can mark a
+    device home without waiting for a slow one.
+    """
+
+    def __init__(self, hass, scan_loops):
         self.hass = hass
 
-        self.device_scanner = device_scanner
+        if not isinstance(scan_loops, list):
+            scan_loops = [ScanLoop(hass, scan_loops)]
+
+        self.scan_loops = scan_loops
+
+        for scan_loop in scan_loops:
+            scan_loop.result_callback = self._scan_finished
 
         self.lock = threading.Lock()
 
+        self.registry = DeviceRegistry(
+            hass.get_config_path(KNOWN_DEVICES_DB),
+            hass.get_config_path(KNOWN_DEVICES_FILE))
+
         # Dictionary to keep track of known devices and devices we track
         self.tracked = {}
         self.untracked_devices = set()
@@ -109,23 +170,47 @@ class DeviceTracker(object):
         # the bus by its __name__ attribute.
         def update_device_state(now):
             """ Triggers update of the device states. """
+            # Apply the last scan so devices that are gone time out even if
+            # the scanner is slow, then schedule a new scan.
             self.update_devices(now)
 
-        # pylint: disable=unused-argument
-        def reload_known_devices_service(service):
-            """ Reload known devices file. """
+            for scan_loop in self.scan_loops:
+                if scan_loop.is_due(now):
+                    scan_loop.request_scan(now)
+
+        def reload_known_devices(scan):
+            """ Reload known devices file, scan first if scan is True. """
             group.remove_group(self.hass, GROUP_NAME_ALL_DEVICES)
 
             self._read_known_devices_file()
 
-            self.update_devices(datetime.now())
+            now = datetime.now()
+
+            if scan:
+                for scan_loop in self.scan_loops:
+                    scan_loop.scan(now)
+
+            self.update_devices(now)
 
             if self.tracked:
                 group.setup_group(
                     self.hass, GROUP_NAME_ALL_DEVICES,
                     self.device_entity_ids, False)
 
-        reload_known_devices_service(None)
+        # pylint: disable=unused-argument
+        def reload_known_devices_service(service):
+            """ Reload known devices file. """
+            reload_known_devices(False)
+
+            # Scan through the scan loops so a scan that is already running
+            # is not run twice at the same time
+            now = datetime.now()
+
+            for scan_loop in self.scan_loops:
+                scan_loop.request_scan(now)
+
+        # No scan loop is running yet, scan right away
+        reload_known_devices(True)
 
         if self.invalid_known_devices_file:
             return
@@ -142,17 +227,13 @@ class DeviceTracker(object):
             that are being tracked. """
         return set(device['entity_id'] for device in self.tracked.values())
 
-    def _update_state(self, now, device, is_home):
+    def _update_state(self, now, device):
         """ Update the state of a device. """
         dev_info = self.tracked[device]
 
-        if is_home:
-            # Update last seen if at home
-            dev_info['last_seen'] = now
-        else:
-            # State remains at home if it has been seen in the last
-            # TIME_DEVICE_NOT_FOUND
-            is_home = now - dev_info['last_seen'] < TIME_DEVICE_NOT_FOUND
+        # State remains at home if it has been seen in the last
+        # TIME_DEVICE_NOT_FOUND
+        is_home = now - dev_info['last_seen'] < TIME_DEVICE_NOT_FOUND
 
         state = STATE_HOME if is_home else STATE_NOT_HOME
 
@@ -160,154 +241,546 @@ class DeviceTracker(object):
             dev_info['entity_id'], state,
             dev_info['state_attr'])
 
+    def _scan_finished(self, result):
+        """ Called by the scan loop when a new scan result is available. """
+        self.update_devices(result.scan_time)
+
     def update_devices(self, now):
-        """ Update device states based on the found devices. """
+        """
+        Update device states based on the devices found by the last scan.
+        Does not scan itself, see ScanLoop.
+        """
         self.lock.acquire()
 
-        found_devices = set(self.device_scanner.scan_devices())
+        found_devices = set()
 
-        for device in self.tracked:
-            is_home = device in found_devices
+        for scan_loop in self.scan_loops:
+            result = scan_loop.last_result
 
-            self._update_state(now, device, is_home)
+            found_devices.update(result.devices)
 
-            if is_home:
-                found_devices.remove(device)
+            for device in result.devices:
+                dev_info = self.tracked.get(device)
 
-        # Did we find any devices that we didn't know about yet?
-        new_devices = found_devices - self.untracked_devices
+                if dev_info is None:
+                    continue
 
-        if new_devices:
-            self.untracked_devices.update(new_devices)
+                # Scan results can be applied out of order, keep the latest
+                last_seen = dev_info['last_seen_by'].get(scan_loop.name)
 
-            # Write new devices to known devices file
-            if not self.invalid_known_devices_file:
+                if last_seen is None or result.scan_time > last_seen:
+                    dev_info['last_seen_by'][scan_loop.name] = \
+                        result.scan_time
 
-                known_dev_path = self.hass.get_config_path(KNOWN_DEVICES_FILE)
+                    dev_info['last_seen'] = max(dev_info['last_seen'],
+                                                result.scan_time)
 
-                try:
-                    # If file does not exist we will write the header too
-                    is_new_file = not os.path.isfile(known_dev_path)
+        for device in self.tracked:
+            self._update_state(now, device)
 
-                    with open(known_dev_path, 'a') as outp:
-                        _LOGGER.info(
-                            "Found %d new devices, updating %s",
-                            len(new_devices), known_dev_path)
+        found_devices.difference_update(self.tracked)
 
-                        writer = csv.writer(outp)
+        # Did we find any devices that we didn't know about yet?
+        new_devices = found_devices - self.untracked_devices
 
-                        if is_new_file:
-                            writer.writerow((
-                                "device", "name", "track", "picture"))
+        self.untracked_devices.update(new_devices)
 
-                        for device in new_devices:
-                            # See if the device scanner knows the name
-                            # else defaults to unknown device
-                            name = (self.device_scanner.get_device_name(device)
-                                    or "unknown_device")
+        self.lock.release()
 
-                            writer.writerow((device, name, 0, ""))
+        # Write new devices to the registry and known devices file
+        if new_devices and not self.invalid_known_devices_file:
+            _LOGGER.info("Found %d new devices, updating %s",
+                         len(new_devices), self.registry.csv_path)
 
-                except IOError:
-                    _LOGGER.exception(
-                        "Error updating %s with %d new devices",
-                        known_dev_path, len(new_devices))
+            # See if the device scanner knows the name
+            # else defaults to unknown device
+            self.registry.add_devices(
+                (device, self._get_device_name(device) or "unknown_device")
+                for device in new_devices)
 
-        self.lock.release()
+    def _get_device_name(self, device):
+        """ Returns the first name a device scanner knows for device. """
+        for scan_loop in self.scan_loops:
+            name = scan_loop.device_scanner.get_device_name(device)
+
+            if name:
+                return name
+
+        return None
 
-    # pylint: disable=too-many-branches
     def _read_known_devices_file(self):
-        """ Parse and process the known devices file. """
-        known_dev_path = self.hass.get_config_path(KNOWN_DEVICES_FILE)
+        """ Load the known devices and process them. """
+        known_dev_path = self.registry.csv_path
 
         # Return if no known devices file exists
         if not os.path.isfile(known_dev_path):
             return
 
-        self.lock.acquire()
+        with self.lock:
+            try:
+                devices = self.registry.load()
+
+            except KeyError:
+                self.invalid_known_devices_file = True
+
+                _LOGGER.warning(
+                    ("Invalid known devices file: %s. "
+                     "We won't update it with new found devices."),
+                    known_dev_path)
 
-        self.untracked_devices.clear()
+                return
+
+            self.untracked_devices.clear()
 
-        with open(known_dev_path) as inp:
             default_last_seen = datetime(1990, 1, 1)
 
             # To track which devices need an entity_id assigned
             need_entity_id = []
 
-            # All devices that are still in this set after we read the CSV file
+            # All devices that are still in this set after we read the devices
             # have been removed from the file and thus need to be cleaned up.
             removed_devices = set(self.tracked.keys())
 
+            for device, row in devices.items():
+                if row['track'] != '1':
+                    self.untracked_devices.add(device)
+                    continue
+
+                if device in self.tracked:
+                    # Device exists
+                    removed_devices.remove(device)
+                else:
+                    # We found a new device
+                    need_entity_id.append(device)
+
+                    # Only scans that finish after the device is tracked
+                    # count, results from before are skipped
+                    self.tracked[device] = {
+                        'name': row['name'],
+                        'last_seen': default_last_seen,
+                        'last_seen_by': {
+                            scan_loop.name: scan_loop.last_result.scan_time
+                            for scan_loop in self.scan_loops
+                            if scan_loop.last_result.scan_time is not None}
+                    }
+
+                # Update state_attr with latest from file
+                state_attr = {
+                    ATTR_FRIENDLY_NAME: row['name']
+                }
+
+                if row['picture']:
+                    state_attr[ATTR_ENTITY_PICTURE] = row['picture']
+
+                self.tracked[device]['state_attr'] = state_attr
+
+            # Remove existing devices that we no longer track
+            for device in removed_devices:
+                entity_id = self.tracked[device]['entity_id']
+
+                _LOGGER.info("Removing entity %s", entity_id)
+
+                self.hass.states.remove(entity_id)
+
+                self.tracked.pop(device)
+
+            # Setup entity_ids for the new devices
+            new_devices = set(need_entity_id)
+
+            used_entity_ids = set(info['entity_id'] for device, info
+                                  in self.tracked.items()
+                                  if device not in new_devices)
+
+            for device in need_entity_id:
+                name = self.tracked[device]['name']
+
+                entity_id = util.ensure_unique_string(
+                    ENTITY_ID_FORMAT.format(util.slugify(name)),
+                    used_entity_ids)
+
+                used_entity_ids.add(entity_id)
+
+                self.tracked[device]['entity_id'] = entity_id
+
+            if not self.tracked:
+                _LOGGER.warning(
+                    "No devices to track. Please update %s.",
+                    known_dev_path)
+
+            _LOGGER.info("Loaded devices from %s", known_dev_path)
+
+
+class ScanLoop(object):
+    """
+    Runs the scans of a device scanner as jobs in the worker pool.
+    Scans requested while a scan is running are coalesced into a single
+    follow-up scan so slow scanners cannot pile up jobs in the pool.
+    Every finished scan publishes an immutable ScanResult as last_result.
+    A scan is requested on every time event once interval has passed since
+    the last request.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, hass, device_scanner, result_callback=None,
+                 name=None, interval=DEFAULT_SCAN_INTERVAL):
+        self.hass = hass
+        self.device_scanner = device_scanner
+        self.result_callback = result_callback
+        self.name = name or 'scanner'
+        self.interval = interval
+
+        self.last_result = ScanResult(frozenset(), None, 0)
+        self.last_request = None
+
+        # Number of requested scans that were merged into another scan
+        self.coalesced_scans = 0
+
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = None
+
+    def is_due(self, now):
+        """ Returns if a scan should be requested according to interval. """
+        return self.last_request is None or \
+            now - self.last_request >= self.interval
+
+    def request_scan(self, now):
+        """ Schedules a scan unless one is already running. """
+        with self._lock:
+            self.last_request = now
+
+            if self._running:
+                # The first request becomes the follow-up scan, later ones
+                # are merged into it
+                if self._pending is not None:
+                    self.coalesced_scans += 1
+
+                self._pending = now
+                return
+
+            self._running = True
+
+        self._add_scan_job(now)
+
+    def scan(self, now):
+        """ Scans for devices, publishes and returns the ScanResult. """
+        self.last_request = now
+
+        start = time.time()
+
+        devices = frozenset(self.device_scanner.scan_devices())
+
+        result = ScanResult(devices, now, time.time() - start)
+
+        self.last_result = result
+
+        _LOGGER.info("%s found %d devices in %.2fs",
+                     self.name, len(devices), result.duration)
+
+        return result
+
+    def _add_scan_job(self, now):
+        """ Adds a scan job to the worker pool. """
+        self.hass.pool.add_job(ha.JobPriority.EVENT_DEFAULT,
+                               (self._scan_job, now))
+
+    def _scan_job(self, now):
+        """ Scans and schedules a follow-up scan if one was requested. """
+        try:
+            result = self.scan(now)
+
+            if self.result_callback:
+                self.result_callback(result)
+
+        finally:
+            with self._lock:
+                now, self._pending = self._pending, None
+
+                if now is None:
+                    self._running = False
+
+            if now is not None:
+                _LOGGER.info("Scan requested during running scan, "
+                             "%d scans coalesced so far",
+                             self.coalesced_scans)
+
+                self._add_scan_job(now)
+
+
+class DeviceRegistry(object):
+    """
+    Persistent registry of known devices, indexed by device id.
+
+    The devices are stored in an SQLite database and kept in memory in a
+    dict for constant time lookups. New devices are inserted incrementally.
+    The known devices CSV file remains the file users edit: it is only
+    parsed again when it has been changed since it was last read or written
+    by the registry. Use export_csv to rewrite it from the registry.
+    """
+
+    COLUMNS = ("device", "name", "track", "picture")
+
+    def __init__(self, db_path, csv_path):
+        self.db_path = db_path
+        self.csv_path = csv_path
+
+        self._lock = threading.Lock()
+        self._devices = {}
+
+        try:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._create_tables()
+
+        except sqlite3.Error:
+            _LOGGER.exception(
+                "Unable to open %s, keeping devices in memory", db_path)
+
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self._create_tables()
+
+    def __contains__(self, device):
+        return device in self._devices
+
+    def __len__(self):
+        return len(self._devices)
+
+    def get(self, device):
+        """ Returns a dict with the info of device or None. """
+        return self._devices.get(device)
+
+    def load(self):
+        """
+        Loads the devices, importing the CSV file if it has been changed.
+        Returns a dict mapping device => dict with the CSV columns.
+        Raises KeyError if the CSV file is missing required columns.
+        """
+        with self._lock:
+            signature = self._csv_signature()
+
+            if signature != self._get_meta('csv_signature'):
+                self._import_csv(signature)
+
+            else:
+                self._devices = {
+                    row[0]: dict(zip(self.COLUMNS, row)) for row
+                    in self._conn.execute(
+                        "SELECT device, name, track, picture FROM devices "
+                        "ORDER BY rowid")}
+
+            return dict(self._devices)
+
+    def add_devices(self, devices):
+        """
+        Adds new untracked devices, given as iterable of (device, name)
+        tuples, to the registry and appends them to the CSV file.
+        """
+        with self._lock:
+            rows = [{'device': device, 'name': name, 'track': '0',
+                     'picture': ''}
+                    for device, name in devices
+                    if device not in self._devices]
+
+            if not rows:
+                return
+
+            # If file does not exist we will write the header too
+            is_new_file = not os.path.isfile(self.csv_path)
+
+            # Only sync the CSV signature if we wrote all changes to it,
+            # otherwise we would not pick up edits made in the meantime.
+            csv_in_sync = self._csv_signature() == \
+                self._get_meta('csv_signature')
+
+            with self._conn:
+                if is_new_file:
+                    # The new file will only contain the new devices
+                    self._conn.execute("DELETE FROM devices")
+                    self._devices = {}
+
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO devices "
+                    "(device, name, track, picture) VALUES "
+                    "(:device, :name, :track, :picture)", rows)
+
+            for row in rows:
+                self._devices[row['device']] = row
+
             try:
+                with open(self.csv_path, 'a') as outp:
+                    writer = csv.writer(outp)
+
+                    if is_new_file:
+                        writer.writerow(self.COLUMNS)
+
+                    for row in rows:
+                        writer.writerow(
+                            [row[column] for column in self.COLUMNS])
+
+            except IOError:
+                _LOGGER.exception("Error updating %s with %d new devices",
+                                  self.csv_path, len(rows))
+
+                return
+
+            if csv_in_sync or is_new_file:
+                self._set_meta('csv_signature', self._csv_signature())
+
+    def export_csv(self, path=None):
+        """ Writes all devices to the CSV file or the given path. """
+        path = path or self.csv_path
+
+        with self._lock:
+            with open(path, 'w') as outp:
+                writer = csv.writer(outp)
+
+                writer.writerow(self.COLUMNS)
+
+                for row in self._devices.values():
+                    writer.writerow([row[column] for column in self.COLUMNS])
+
+            if path == self.csv_path:
+                self._set_meta('csv_signature', self._csv_signature())
+
+    def _create_tables(self):
+        """ Creates the tables if they do not exist. """
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS devices ("
+                "device TEXT PRIMARY KEY, name TEXT, track TEXT, "
+                "picture TEXT)")
+
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                "key TEXT PRIMARY KEY, value TEXT)")
+
+    def _import_csv(self, signature):
+        """ Replaces all devices with the devices in the CSV file. """
+        devices = {}
+
+        if signature is not None:
+            with open(self.csv_path) as inp:
                 for row in csv.DictReader(inp):
-                    device = row['device']
+                    devices[row['device']] = {
+                        column: row[column] for column in self.COLUMNS}
 
-                    if row['track'] == '1':
-                        if device in self.tracked:
-                            # Device exists
-                            removed_devices.remove(device)
-                        else:
-                            # We found a new device
-                            need_entity_id.append(device)
+        with self._conn:
+            self._conn.execute("DELETE FROM devices")
 
-                            self.tracked[device] = {
-                                'name': row['name'],
-                                'last_seen': default_last_seen
-                            }
+            self._conn.executemany(
+                "INSERT INTO devices (device, name, track, picture) VALUES "
+                "(:device, :name, :track, :picture)", devices.values())
 
-                        # Update state_attr with latest from file
-                        state_attr = {
-                            ATTR_FRIENDLY_NAME: row['name']
-                        }
+        self._devices = devices
 
-                        if row['picture']:
-                            state_attr[ATTR_ENTITY_PICTURE] = row['picture']
+        self._set_meta('csv_signature', signature)
 
-                        self.tracked[device]['state_attr'] = state_attr
+        _LOGGER.info("Imported %d devices from %s",
+                     len(devices), self.csv_path)
 
-                    else:
-                        self.untracked_devices.add(device)
+    def _csv_signature(self):
+        """ Returns a string identifying the version of the CSV file. """
+        try:
+            stat = os.stat(self.csv_path)
+        except OSError:
+            return None
 
-                # Remove existing devices that we no longer track
-                for device in removed_devices:
-                    entity_id = self.tracked[device]['entity_id']
+        return "{}-{}".format(stat.st_mtime_ns, stat.st_size)
 
-                    _LOGGER.info("Removing entity %s", entity_id)
+    def _get_meta(self, key):
+        """ Returns a value from the meta table. """
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
 
-                    self.hass.states.remove(entity_id)
+        return row[0] if row else None
 
-                    self.tracked.pop(device)
+    def _set_meta(self, key, value):
+        """ Stores a value in the meta table. """
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, value))
 
-                # Setup entity_ids for the new devices
-                used_entity_ids = [info['entity_id'] for device, info
-                                   in self.tracked.items()
-                                   if device not in need_entity_id]
 
-                for device in need_entity_id:
-                    name = self.tracked[device]['name']
+class HttpClient(object):
+    """
+    Keep-alive HTTP client for scanners that query a router over HTTP.
+    Connections are pooled and reused between scans with a limit on the
+    number of connections per host. The latency of the last request to each
+    host is available in latency.
+    """
 
-                    entity_id = util.ensure_unique_string(
-                        ENTITY_ID_FORMAT.format(util.slugify(name)),
-                        used_entity_ids)
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+                 timeout=HTTP_TIMEOUT):
+        self.timeout = timeout
 
-                    used_entity_ids.append(entity_id)
+        # Dict mapping lower case host name => seconds the last request took
+        self.latency = {}
 
-                    self.tracked[device]['entity_id'] = entity_id
+        self.session = requests.Session()
 
-                if not self.tracked:
-                    _LOGGER.warning(
-                        "No devices to track. Please update %s.",
-                        known_dev_path)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=max_connections, pool_block=True)
 
-                _LOGGER.info("Loaded devices from %s", known_dev_path)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
-            except KeyError:
-                self.invalid_known_devices_file = True
+    def request(self, method, url, **kwargs):
+        """ Makes a request. Accepts the arguments of requests.request. """
+        kwargs.setdefault('timeout', self.timeout)
 
-                _LOGGER.warning(
-                    ("Invalid known devices file: %s. "
-                     "We won't update it with new found devices."),
-                    known_dev_path)
+        return self._timed(url, self.session.request, method, url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """ Makes a POST request. """
+        return self.request('POST', url, **kwargs)
+
+    def send(self, prepared_request, **kwargs):
+        """ Sends a prepared request. """
+        kwargs.setdefault('timeout', self.timeout)
+
+        return self._timed(prepared_request.url, self.session.send,
+                           prepared_request, **kwargs)
+
+    def get_latency(self, host):
+        """ Returns the latency of the last request to host or None. Host
+            can be given with or without scheme and port. """
+        return self.latency.get(_host_key(host))
+
+    def _timed(self, url, func, *args, **kwargs):
+        """ Calls func and records the latency for the host of url. """
+        start = time.time()
+
+        try:
+            return func(*args, **kwargs)
+
+        finally:
+            host = _host_key(url)
+
+            self.latency[host] = time.time() - start
+
+            _LOGGER.debug("Request to %s took %.3fs",
+                          host, self.latency[host])
+
+
+def _host_key(url):
+    """ Returns the lower case host name of a url or a host. """
+    if '//' not in url:
+        url = '//' + url
+
+    return urllib.parse.urlsplit(url).hostname or url
+
+
+_HTTP_CLIENT = None
+_HTTP_CLIENT_LOCK = threading.Lock()
+
+
+def get_http_client():
+    """ Returns the HttpClient shared by all device scanners. """
+    global _HTTP_CLIENT  # pylint: disable=global-statement
+
+    with _HTTP_CLIENT_LOCK:
+        if _HTTP_CLIENT is None:
+            _HTTP_CLIENT = HttpClient()
 
-            finally:
-                self.lock.release()
+        return _HTTP_CLIENT
@@ -1,7 +1,7 @@
 """ Supports scanning a OpenWRT router. """
 import logging
 import json
-from datetime import timedelta
+from datetime import datetime, timedelta
 import re
 import threading
 import requests
@@ -9,11 +9,15 @@ import requests
 from homeassistant.const import CONF_HOST, CONF_USERNAME, CONF_PASSWORD
 from homeassistant.helpers import validate_config
 from homeassistant.util import Throttle
-from homeassistant.components.device_tracker import DOMAIN
+from homeassistant.components.device_tracker import (
+    DOMAIN, ScannedDevice, get_http_client)
 
 # Return cached results if last scan was less then this time ago
 MIN_TIME_BETWEEN_SCANS = timedelta(seconds=5)
 
+# Refresh the device names with a scan if they are older than this
+NAME_CACHE_TTL = timedelta(minutes=10)
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -41,7 +45,8 @@ class LuciDeviceScanner(object):
     The API is described here:
     http://luci.subsignal.org/trac/wiki/Documentation/JsonRpcHowTo
 
-    (Currently, we do only wifi iwscan, and no DHCP lease access.)
+    The ARP table and the device names (static hosts and DHCP leases)
+    are fetched in a single batch request when the router supports it.
     """
 
     def __init__(self, config):
@@ -54,10 +59,17 @@ class LuciDeviceScanner(object):
 
         self.last_results = {}
 
-        self.token = _get_token(host, username, password)
         self.host = host
+        self.username = username
+        self.password = password
+
+        self.token = _get_token(host, username, password)
+
+        # Set to False when the router does not understand batch requests
+        self.batch_supported = True
 
         self.mac2name = None
+        self.names_updated = None
         self.success_init = self.token is not None
 
     def scan_devices(self):
@@ -66,26 +78,45 @@ class LuciDeviceScanner(object):
 
         self._update_info()
 
-        return self.last_results
+        return list(self.last_results)
 
     def get_device_name(self, device):
-        """ Returns the name of the given device or None if we don't know. """
+        """ Returns the name of the given device or None if we don't know.
+            Expired names are refreshed together with the next scan. """
 
         with self.lock:
             if self.mac2name is None:
-                url = 'http://{}/cgi-bin/luci/rpc/uci'.format(self.host)
-                result = _req_json_rpc(url, 'get_all', 'dhcp',
-                                       params={'auth': self.token})
-                if result:
-                    hosts = [x for x in result.values()
-                             if x['.type'] == 'host' and
-                             'mac' in x and 'name' in x]
-                    mac2name_list = [(x['mac'], x['name']) for x in hosts]
-                    self.mac2name = dict(mac2name_list)
-                else:
+                self._update_names(self._rpc('sys', 'net.mac_hints'))
+
+                if self.mac2name is None:
                     # Error, handled in the _req_json_rpc
                     return
-            return self.mac2name.get(device, None)
+
+            return self.mac2name.get(device.upper(), None)
+
+    def _names_expired(self):
+        """ Returns if the cached device names should be refreshed. """
+        return (self.names_updated is None or
+                datetime.now() - self.names_updated > NAME_CACHE_TTL)
+
+    def _update_names(self, mac_hints):
+        """ Updates the name cache from the [mac, name] pairs of the router.
+            Falls back to the static DHCP hosts if there are no hints. """
+        if mac_hints is not None:
+            self.mac2name = {mac.upper(): name for mac, name in mac_hints}
+
+        else:
+            result = self._rpc('uci', 'get_all', 'dhcp')
+
+            if not result:
+                return
+
+            self.mac2name = {x['mac'].upper(): x['name']
+                             for x in result.values()
+                             if x['.type'] == 'host' and
+                             'mac' in x and 'name' in x}
+
+        self.names_updated = datetime.now()
 
     @Throttle(MIN_TIME_BETWEEN_SCANS)
     def _update_info(self):
@@ -97,40 +128,171 @@ class LuciDeviceScanner(object):
         with self.lock:
             _LOGGER.info("Checking ARP")
 
-            url = 'http://{}/cgi-bin/luci/rpc/sys'.format(self.host)
-            result = _req_json_rpc(url, 'net.arptable',
-                                   params={'auth': self.token})
-            if result:
-                self.last_results = [x['HW address'] for x in result]
+            calls = [('net.arptable', ())]
+
+            refresh_names = self._names_expired()
+
+            if refresh_names:
+                calls.append(('net.mac_hints', ()))
+
+            results = self._rpc_batch('sys', calls)
+
+            if refresh_names:
+                self._update_names(results[1])
+
+            if results[0]:
+                names = self.mac2name or {}
+
+                self.last_results = {
+                    x['HW address']: ScannedDevice(
+                        x['HW address'], names.get(x['HW address'].upper()),
+                        x.get('IP address'))
+                    for x in results[0]}
+
+                latency = get_http_client().get_latency(self.host)
+
+                if latency is not None:
+                    _LOGGER.info("Router responded in %.3fs", latency)
 
                 return True
 
             return False
 
+    def _rpc(self, library, method, *args):
+        """ Performs a JSON RPC call on library. """
+        url = 'http://{}/cgi-bin/luci/rpc/{}'.format(self.host, library)
+
+        return self._authorized(
+            lambda auth: _req_json_rpc(url, method, *args, params=auth))
+
+    def _rpc_batch(self, library, calls):
+        """
+        Performs a list of (method, args) JSON RPC calls on library in a
+        single request. Returns a list with a result for each call. Falls
+        back to one request per call if the router does not support batches.
+        """
+        if self.batch_supported:
+            url = 'http://{}/cgi-bin/luci/rpc/{}'.format(self.host, library)
+
+            try:
+                results = self._authorized(
+                    lambda auth: _req_json_rpc_batch(url, calls, params=auth))
+
+                return results or [None] * len(calls)
+
+            except BatchNotSupportedError:
+                _LOGGER.info("Router does not support batch requests")
+
+                self.batch_supported = False
+
+        return [self._rpc(library, method, *args) for method, args in calls]
+
+    def _authorized(self, request):
+        """
+        Calls request with the auth params of the current token.
+        Logs in again and retries once if the token has expired.
+        """
+        try:
+            return request({'auth': self.token})
+
+        except InvalidTokenError:
+            _LOGGER.info("Token expired, logging in again")
+
+            self.token = _get_token(self.host, self.username, self.password)
+
+            if self.token is None:
+                return None
+
+            try:
+                return request({'auth': self.token})
+
+            except InvalidTokenError:
+                _LOGGER.error("New token was not accepted by luci")
+
+                return None
+
+
+class InvalidTokenError(Exception):
+    """ Raised when luci did not accept the authentication token. """
+
+
+class BatchNotSupportedError(Exception):
+    """ Raised when luci did not answer a batch request with a batch. """
+
 
 def _req_json_rpc(url, method, *args, **kwargs):
-    """ Perform one JSON RPC operation. """
-    data = json.dumps({'method': method, 'params': args})
+    """
+    Perform one JSON RPC operation.
+    Raises InvalidTokenError if the call was not authorized.
+    """
+    result = _post_json_rpc(
+        url, json.dumps({'method': method, 'params': args}), **kwargs)
+
+    if result is None:
+        return
+
+    try:
+        return result['result']
+    except (KeyError, TypeError):
+        _LOGGER.error("No result in response from luci")
+        return
+
+
+def _req_json_rpc_batch(url, calls, **kwargs):
+    """
+    Perform a list of (method, args) JSON RPC operations in one request.
+    Returns a list with the result of each call or None on failure.
+    Raises InvalidTokenError if the calls were not authorized and
+    BatchNotSupportedError if luci does not understand batch requests.
+    """
+    data = json.dumps([{'id': idx, 'method': method, 'params': args}
+                       for idx, (method, args) in enumerate(calls)])
+
+    response = _post_json_rpc(url, data, **kwargs)
+
+    if response is None:
+        return
+
+    if not isinstance(response, list):
+        raise BatchNotSupportedError()
+
+    results = [None] * len(calls)
+
+    for entry in response:
+        try:
+            results[entry['id']] = entry.get('result')
+        except (KeyError, IndexError, TypeError, AttributeError):
+            _LOGGER.error("Invalid entry in batch response from luci")
+
+    return results
+
+
+def _post_json_rpc(url, data, **kwargs):
+    """
+    Posts a JSON RPC request and returns the decoded response.
+    Raises InvalidTokenError if the request was not authorized.
+    """
     try:
-        res = requests.post(url, data=data, timeout=5, **kwargs)
+        res = get_http_client().post(url, data=data, **kwargs)
     except requests.exceptions.Timeout:
         _LOGGER.exception("Connection to the router timed out")
         return
+    except requests.exceptions.ConnectionError:
+        _LOGGER.exception("Failed to connect to the router")
+        return
     if res.status_code == 200:
         try:
-            result = res.json()
+            return res.json()
         except ValueError:
             # If json decoder could not parse the response
             _LOGGER.exception("Failed to parse response from luci")
             return
-        try:
-            return result['result']
-        except KeyError:
-            _LOGGER.exception("No result in response from luci")
-            return
+    elif res.status_code in (401, 403) and 'params' in kwargs:
+        # Token is not (or no longer) valid
+        raise InvalidTokenError()
     elif res.status_code == 401:
         # Authentication error
-        _LOGGER.exception(
+        _LOGGER.error(
             "Failed to authenticate, "
             "please check your username and password")
         return
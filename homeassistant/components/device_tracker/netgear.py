@@ -6,7 +6,7 @@ import threading
 from homeassistant.const import CONF_HOST, CONF_USERNAME, CONF_PASSWORD
 from homeassistant.helpers import validate_config
 from homeassistant.util import Throttle
-from homeassistant.components.device_tracker import DOMAIN
+from homeassistant.components.device_tracker import DOMAIN, ScannedDevice
 
 # Return cached results if last scan was less then this time ago
 MIN_TIME_BETWEEN_SCANS = timedelta(seconds=5)
@@ -34,7 +34,7 @@ class NetgearDeviceScanner(object):
         host = config[CONF_HOST]
         username, password = config[CONF_USERNAME], config[CONF_PASSWORD]
 
-        self.last_results = []
+        self.last_results = {}
 
         try:
             # Pylint does not play nice if not every folders has an __init__.py
@@ -69,27 +69,37 @@ class NetgearDeviceScanner(object):
 
         self._update_info()
 
-        return [device.mac for device in self.last_results]
+        return list(self.last_results)
 
     def get_device_name(self, mac):
         """ Returns the name of the given device or None if we don't know. """
 
-        filter_named = [device.name for device in self.last_results
-                        if device.mac == mac]
+        device = self.last_results.get(mac)
 
-        if filter_named:
-            return filter_named[0]
-        else:
-            return None
+        return device.name if device else None
 
     @Throttle(MIN_TIME_BETWEEN_SCANS)
     def _update_info(self):
         """ Retrieves latest information from the Netgear router.
             Returns boolean if scanning successful. """
         if not self.success_init:
-            return
+            return False
 
         with self.lock:
             _LOGGER.info("Scanning")
 
-            self.last_results = self._api.get_attached_devices()
+            devices = self._api.get_attached_devices()
+
+            if devices is None:
+                _LOGGER.error("Failed to retrieve the attached devices")
+
+                self.last_results = {}
+
+                return False
+
+            self.last_results = {
+                device.mac: ScannedDevice(device.mac, device.name, device.ip,
+                                          device.signal)
+                for device in devices}
+
+            return True
@@ -2,23 +2,45 @@
 import logging
 from datetime import timedelta
 import threading
-from collections import namedtuple
 import subprocess
 import re
+import ipaddress
 
-from libnmap.process import NmapProcess
-from libnmap.parser import NmapParser, NmapParserException
-
+from homeassistant.loader import lazy_import
 from homeassistant.const import CONF_HOSTS
 from homeassistant.helpers import validate_config
 from homeassistant.util import Throttle
-from homeassistant.components.device_tracker import DOMAIN
+from homeassistant.components.device_tracker import DOMAIN, ScannedDevice
 
 # Return cached results if last scan was less then this time ago
 MIN_TIME_BETWEEN_SCANS = timedelta(seconds=5)
 
+# Kernel neighbor table on Linux
+PROC_NET_ARP = '/proc/net/arp'
+
+# Flag in the kernel neighbor table indicating a complete entry
+ATF_COM = 0x2
+
+# Optional config to select how the network is scanned
+CONF_MODE = 'mode'
+
+# Port scan of the full range on every scan
+MODE_PORT_SCAN = 'ports'
+
+# Presence detection: the first scan pings the full range, after that every
+# scan pings the devices that are home and one slice of the range, so the
+# full range is swept once every SWEEP_SLICES scans
+MODE_PRESENCE = 'presence'
+
+SWEEP_SLICES = 6
+
 _LOGGER = logging.getLogger(__name__)
 
+# Imported on first scan
+# pylint: disable=invalid-name
+libnmap_process = lazy_import('libnmap.process')
+libnmap_parser = lazy_import('libnmap.parser')
+
 
 # pylint: disable=unused-argument
 def get_scanner(hass, config):
@@ -27,12 +49,14 @@ def get_scanner(hass, config):
                            _LOGGER):
         return None
 
+    if not libnmap_process.available:
+        _LOGGER.error("Error while importing dependency python-libnmap.")
+        return None
+
     scanner = NmapDeviceScanner(config[DOMAIN])
 
     return scanner if scanner.success_init else None
 
-Device = namedtuple("Device", ["mac", "name"])
-
 
 def _arp(ip_address):
     """ Get the MAC address for a given IP """
@@ -46,14 +70,88 @@ def _arp(ip_address):
     return ''
 
 
+def _sweep_slices(hosts, count):
+    """
+    Splits the nmap targets in hosts into at most count lists of targets
+    of about equal size. Networks in CIDR notation are split in count
+    consecutive parts of about the same number of addresses. Other targets,
+    and networks too small to split, are spread over the lists as is.
+    """
+    slices = [[] for _ in range(count)]
+    index = 0
+
+    for target in hosts.split():
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+
+            # Split in more subnets than slices so the parts can be close
+            # to equal
+            prefixlen_diff = min((count - 1).bit_length() + 2,
+                                 network.max_prefixlen - network.prefixlen)
+
+            subnets = list(network.subnets(prefixlen_diff=prefixlen_diff))
+
+        except ValueError:
+            # Not a network, ie an address range or host name
+            subnets = [target]
+
+        if len(subnets) < count:
+            for subnet in subnets:
+                slices[index % count].append(str(subnet))
+                index += 1
+
+            continue
+
+        for part in range(count):
+            chunk = subnets[len(subnets) * part // count:
+                            len(subnets) * (part + 1) // count]
+
+            slices[part].extend(
+                str(subnet) for subnet in ipaddress.collapse_addresses(chunk))
+
+    return [targets for targets in slices if targets]
+
+
+def _read_arp_table(path=PROC_NET_ARP):
+    """
+    Reads the kernel neighbor table into a dict mapping IP => MAC.
+    Returns None if the table is not available.
+    """
+    try:
+        with open(path) as inp:
+            # Skip the header line
+            next(inp, None)
+
+            table = {}
+
+            for line in inp:
+                fields = line.split()
+
+                # Fields: IP, HW type, flags, HW address, mask, device
+                if len(fields) >= 4 and int(fields[2], 16) & ATF_COM:
+                    table[fields[0]] = fields[3]
+
+            return table
+
+    except (IOError, ValueError):
+        # IOError if not on Linux, ValueError if the format is unexpected
+        return None
+
+
 class NmapDeviceScanner(object):
     """ This class scans for devices using nmap """
 
     def __init__(self, config):
-        self.last_results = []
+        self.last_results = {}
 
         self.lock = threading.Lock()
         self.hosts = config[CONF_HOSTS]
+        self.mode = config.get(CONF_MODE, MODE_PORT_SCAN)
+
+        self._sweep_slices = _sweep_slices(self.hosts, SWEEP_SLICES)
+
+        # Next slice to sweep, the first presence scan sweeps the full range
+        self._sweep_index = None
 
         self.success_init = True
         self._update_info()
@@ -65,18 +163,46 @@ class NmapDeviceScanner(object):
 
         self._update_info()
 
-        return [device.mac for device in self.last_results]
+        return list(self.last_results)
 
     def get_device_name(self, mac):
         """ Returns the name of the given device or None if we don't know. """
 
-        filter_named = [device.name for device in self.last_results
-                        if device.mac == mac]
+        device = self.last_results.get(mac)
+
+        return device.name if device else None
+
+    def _presence_targets(self):
+        """
+        Returns the targets for the next presence scan: the full range the
+        first time, after that the devices that were home during the last
+        scan and the next slice of the range.
+        """
+        if self._sweep_index is None:
+            self._sweep_index = 0
+
+            return self.hosts.split()
+
+        targets = [device.ip for device in self.last_results.values()]
+
+        if self._sweep_slices:
+            sweep = self._sweep_slices[
+                self._sweep_index % len(self._sweep_slices)]
+
+            self._sweep_index += 1
 
-        if filter_named:
-            return filter_named[0]
-        else:
-            return None
+            targets.extend(target for target in sweep
+                           if target not in targets)
+
+        return targets
+
+    def _nmap_process(self):
+        """ Returns the nmap process for the next scan. """
+        if self.mode == MODE_PRESENCE:
+            return libnmap_process.NmapProcess(
+                targets=self._presence_targets(), options="-sn")
+
+        return libnmap_process.NmapProcess(targets=self.hosts, options="-F")
 
     @Throttle(MIN_TIME_BETWEEN_SCANS)
     def _update_info(self):
@@ -88,36 +214,56 @@ class NmapDeviceScanner(object):
         with self.lock:
             _LOGGER.info("Scanning")
 
-            nmap = NmapProcess(targets=self.hosts, options="-F")
-
+            nmap = self._nmap_process()
             nmap.run()
 
-            if nmap.rc == 0:
-                try:
-                    results = NmapParser.parse(nmap.stdout)
-                    self.last_results = []
-                    for host in results.hosts:
-                        if host.is_up():
-                            if host.hostnames:
-                                name = host.hostnames[0]
-                            else:
-                                name = host.ipv4
-                            if host.mac:
-                                mac = host.mac
-                            else:
-                                mac = _arp(host.ipv4)
-                            if mac:
-                                device = Device(mac, name)
-                                self.last_results.append(device)
-                    _LOGGER.info("nmap scan successful")
-                    return True
-                except NmapParserException as parse_exc:
-                    _LOGGER.error("failed to parse nmap results: %s",
-                                  parse_exc.msg)
-                    self.last_results = []
-                    return False
-
-            else:
-                self.last_results = []
+            if nmap.rc != 0:
+                self.last_results = {}
                 _LOGGER.error(nmap.stderr)
                 return False
+
+            try:
+                results = libnmap_parser.NmapParser.parse(nmap.stdout)
+
+            except libnmap_parser.NmapParserException as parse_exc:
+                _LOGGER.error("failed to parse nmap results: %s",
+                              parse_exc.msg)
+                self.last_results = {}
+                return False
+
+            self.last_results = _parse_hosts(results.hosts)
+
+            _LOGGER.info("nmap scan successful")
+            return True
+
+
+def _parse_hosts(hosts):
+    """ Returns a dict mapping MAC => ScannedDevice for the nmap hosts
+        that are up. """
+    devices = {}
+
+    # Read once, used for hosts that nmap has no MAC for
+    arp_table, arp_read = None, False
+
+    for host in hosts:
+        if not host.is_up():
+            continue
+
+        mac = host.mac
+
+        if not mac:
+            if not arp_read:
+                arp_table = _read_arp_table()
+                arp_read = True
+
+            if arp_table is not None:
+                mac = arp_table.get(host.ipv4, '')
+            else:
+                mac = _arp(host.ipv4)
+
+        if mac:
+            name = host.hostnames[0] if host.hostnames else host.ipv4
+
+            devices[mac] = ScannedDevice(mac, name, host.ipv4)
+
+    return devices
@@ -10,7 +10,8 @@ import requests
 from homeassistant.const import CONF_HOST, CONF_USERNAME, CONF_PASSWORD
 from homeassistant.helpers import validate_config
 from homeassistant.util import Throttle
-from homeassistant.components.device_tracker import DOMAIN
+from homeassistant.components.device_tracker import (
+    DOMAIN, ScannedDevice, get_http_client)
 
 # Return cached results if last scan was less then this time ago
 MIN_TIME_BETWEEN_SCANS = timedelta(seconds=5)
@@ -39,6 +40,7 @@ class TomatoDeviceScanner(object):
     A description of the Tomato API can be found on
     http://paulusschoutsen.nl/blog/2013/10/tomato-api-documentation/
     """
+    # pylint: disable=too-many-instance-attributes
 
     def __init__(self, config):
         host, http_id = config[CONF_HOST], config[CONF_HTTP_ID]
@@ -56,7 +58,10 @@ class TomatoDeviceScanner(object):
         self.logger = logging.getLogger("{}.{}".format(__name__, "Tomato"))
         self.lock = threading.Lock()
 
-        self.last_results = {"wldev": [], "dhcpd_lease": []}
+        self.host = host
+        self.http = get_http_client()
+
+        self.last_results = {}
 
         self.success_init = self._update_tomato_info()
 
@@ -66,18 +71,14 @@ class TomatoDeviceScanner(object):
 
         self._update_tomato_info()
 
-        return [item[1] for item in self.last_results['wldev']]
+        return list(self.last_results)
 
-    def get_device_name(self, device):
+    def get_device_name(self, mac):
         """ Returns the name of the given device or None if we don't know. """
 
-        filter_named = [item[0] for item in self.last_results['dhcpd_lease']
-                        if item[2] == device]
+        device = self.last_results.get(mac)
 
-        if not filter_named or not filter_named[0]:
-            return None
-        else:
-            return filter_named[0]
+        return device.name if device else None
 
     @Throttle(MIN_TIME_BETWEEN_SCANS)
     def _update_tomato_info(self):
@@ -88,21 +89,30 @@ class TomatoDeviceScanner(object):
             self.logger.info("Scanning")
 
             try:
-                response = requests.Session().send(self.req, timeout=3)
+                response = self.http.send(self.req, timeout=3)
+
+                latency = self.http.get_latency(self.host)
+
+                if latency is not None:
+                    self.logger.info("Router responded in %.3fs", latency)
 
                 # Calling and parsing the Tomato api here. We only need the
                 # wldev and dhcpd_lease values. For API description see:
                 # http://paulusschoutsen.nl/
                 #   blog/2013/10/tomato-api-documentation/
                 if response.status_code == 200:
+                    values = {"wldev": [], "dhcpd_lease": []}
 
                     for param, value in \
                             self.parse_api_pattern.findall(response.text):
 
-                        if param == 'wldev' or param == 'dhcpd_lease':
-                            self.last_results[param] = \
+                        if param in values:
+                            values[param] = \
                                 json.loads(value.replace("'", '"'))
 
+                    self.last_results = _parse_devices(
+                        values['wldev'], values['dhcpd_lease'])
+
                     return True
 
                 elif response.status_code == 401:
@@ -136,3 +146,28 @@ class TomatoDeviceScanner(object):
                     "Failed to parse response from router")
 
                 return False
+
+
+def _parse_devices(wldev, dhcpd_lease):
+    """
+    Combines the wireless devices with their DHCP lease into a dict of
+    ScannedDevice keyed by MAC address.
+    wldev items: [interface, mac, rssi, ...]
+    dhcpd_lease items: [name, ip, mac, lease time]
+    """
+    leases = {item[2]: item for item in dhcpd_lease}
+
+    devices = {}
+
+    for item in wldev:
+        mac = item[1]
+        signal = item[2] if len(item) > 2 else None
+
+        if mac in leases:
+            name, ip_address = leases[mac][0] or None, leases[mac][1]
+        else:
+            name, ip_address = None, None
+
+        devices[mac] = ScannedDevice(mac, name, ip_address, signal)
+
+    return devices
@@ -3,136 +3,432 @@ homeassistant.components.downloader
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 Provides functionality to download files.
+
+Downloads are queued and handled by a fixed number of worker threads. The
+queue is stored in the config dir so downloads that did not finish are picked
+up again after a restart. Files are downloaded to a .part file first; an
+interrupted download is resumed with a HTTP Range request.
+
+The progress of the downloads is available as the state of the
+downloader.downloader entity.
 """
 import os
+import json
 import logging
 import re
 import threading
+import time
+import itertools
 
+import homeassistant as ha
+import homeassistant.util as util
 from homeassistant.helpers import validate_config
+from homeassistant.loader import lazy_import
 from homeassistant.util import sanitize_filename
 
 DOMAIN = "downloader"
 DEPENDENCIES = []
 
+ENTITY_ID = "downloader.downloader"
+
 SERVICE_DOWNLOAD_FILE = "download_file"
 
 ATTR_URL = "url"
 ATTR_SUBDIR = "subdir"
 
+# State attributes with the queued and the active downloads
+ATTR_QUEUED = "queued"
+ATTR_DOWNLOADS = "downloads"
+
+STATE_IDLE = "idle"
+STATE_DOWNLOADING = "downloading"
+
 CONF_DOWNLOAD_DIR = 'download_dir'
+CONF_MAX_CONCURRENT = 'max_concurrent'
+
+DEFAULT_MAX_CONCURRENT = 2
+
+# File in the config dir with the downloads that did not finish yet
+QUEUE_FILE = ".downloader_queue.json"
+
+# Files are written to path + PART_SUFFIX until they are complete
+PART_SUFFIX = ".part"
+
+# Number of bytes read from the connection and written to disk at once
+CHUNK_SIZE = 64 * 1024
+
+TIMEOUT = 10
+
+# Times a download is resumed after the connection failed
+MAX_RETRIES = 3
+
+# Minimum number of seconds between progress updates of the state
+PROGRESS_INTERVAL = 1
+
+_LOGGER = logging.getLogger(__name__)
+
+requests = lazy_import('requests')  # pylint: disable=invalid-name
 
 
-# pylint: disable=too-many-branches
 def setup(hass, config):
     """ Listens for download events to download files. """
 
-    logger = logging.getLogger(__name__)
-
-    try:
-        import requests
-    except ImportError:
-        logger.exception(("Failed to import requests. "
-                          "Did you maybe not execute 'pip install requests'?"))
+    if not requests.available:
+        _LOGGER.error(("Failed to import requests. "
+                       "Did you maybe not execute 'pip install requests'?"))
 
         return False
 
-    if not validate_config(config, {DOMAIN: [CONF_DOWNLOAD_DIR]}, logger):
+    if not validate_config(config, {DOMAIN: [CONF_DOWNLOAD_DIR]}, _LOGGER):
         return False
 
     download_path = config[DOMAIN][CONF_DOWNLOAD_DIR]
 
     if not os.path.isdir(download_path):
 
-        logger.error(
+        _LOGGER.error(
             "Download path %s does not exist. File Downloader not active.",
             download_path)
 
         return False
 
+    try:
+        max_concurrent = int(config[DOMAIN].get(CONF_MAX_CONCURRENT,
+                                                DEFAULT_MAX_CONCURRENT))
+    except ValueError:
+        _LOGGER.error("Invalid value for %s given", CONF_MAX_CONCURRENT)
+
+        return False
+
+    manager = DownloadManager(hass, download_path, max_concurrent,
+                              hass.get_config_path(QUEUE_FILE))
+
+    hass.bus.listen_once(ha.EVENT_HOMEASSISTANT_STOP,
+                         lambda event: manager.stop())
+
     def download_file(service):
-        """ Starts thread to download file specified in the url. """
+        """ Queues the file specified in the url for download. """
 
         if ATTR_URL not in service.data:
-            logger.error("Service called but 'url' parameter not specified.")
+            _LOGGER.error("Service called but 'url' parameter not specified.")
+            return
+
+        manager.add(service.data[ATTR_URL], service.data.get(ATTR_SUBDIR))
+
+    hass.services.register(DOMAIN, SERVICE_DOWNLOAD_FILE,
+                           download_file)
+
+    return True
+
+
+class DownloadManager(object):
+    """
+    Downloads files with at most max_concurrent downloads at the same time.
+    Queued downloads are stored in queue_path if given.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, hass, download_path,
+                 max_concurrent=DEFAULT_MAX_CONCURRENT, queue_path=None):
+        self.hass = hass
+        self.download_path = download_path
+        self.queue_path = queue_path
+
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+
+        # Downloads that did not finish, in the order they were added. Each
+        # download is a dict with the url, subdir, path and retries.
+        self._jobs = []
+
+        # Bytes downloaded and total bytes per active download
+        self._progress = {}
+
+        self._last_progress = 0
+
+        # Priority of the next job, first in first out
+        self._counter = itertools.count(1)
+
+        self._pool = util.ThreadPool(self._handle_job, max_concurrent)
+
+        for job in self._load():
+            self._queue(job, True)
+
+        self._update_state()
+
+    def add(self, url, subdir=None):
+        """ Queues a file for download. """
+        if subdir:
+            subdir = sanitize_filename(subdir)
+
+        self._queue({'url': url, 'subdir': subdir, 'path': None,
+                     'retries': 0}, True)
+
+        self._update_state()
+
+    def block_till_done(self):
+        """ Blocks till all queued downloads are done. """
+        self._pool.block_till_done()
+
+    def stop(self):
+        """
+        Stops downloading. Downloads that did not finish stay in the queue
+        file and are resumed the next time.
+        """
+        self._stop.set()
+        self._pool.stop()
+
+        self._save()
+
+    def _queue(self, job, new=False):
+        """ Adds job to the queue, new jobs also to the queue file. """
+        if new:
+            with self._lock:
+                self._jobs.append(job)
+                self._save()
+
+        self._pool.add_job(next(self._counter), job)
+
+    def _handle_job(self, job):
+        """ Downloads a queued file. Called from a worker thread. """
+        if self._stop.is_set():
+            return
+
+        url = job['url']
+
+        try:
+            done = self._download(job)
+
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError):
+
+            if self._stop.is_set():
+                return
+
+            if job['retries'] < MAX_RETRIES:
+                _LOGGER.warning("Downloading of %s failed, resuming", url)
+
+                job['retries'] += 1
+
+                with self._lock:
+                    self._progress.pop(id(job), None)
+                    self._save()
+
+                self._queue(job)
+                self._update_state()
+                return
+
+            _LOGGER.exception("ConnectionError occured for %s", url)
+            done = False
+
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error while downloading %s", url)
+            done = False
+
+        if self._stop.is_set():
             return
 
-        def do_download():
-            """ Downloads the file. """
+        # Remove file if we started downloading but failed
+        if not done and job['path'] and \
+           os.path.isfile(job['path'] + PART_SUFFIX):
+            os.remove(job['path'] + PART_SUFFIX)
+
+        with self._lock:
+            # Jobs for the same url are equal, remove this one
+            self._jobs = [other for other in self._jobs if other is not job]
+            self._progress.pop(id(job), None)
+            self._save()
+
+        self._update_state()
+
+    def _download(self, job):
+        """ Downloads job, resuming it if it was interrupted. """
+        url = job['url']
+        offset = 0
+        headers = {}
+
+        if job['path']:
             try:
-                url = service.data[ATTR_URL]
+                offset = os.path.getsize(job['path'] + PART_SUFFIX)
+            except OSError:
+                # Nothing written yet
+                pass
 
-                subdir = service.data.get(ATTR_SUBDIR)
+        if offset:
+            headers['Range'] = 'bytes={}-'.format(offset)
 
-                if subdir:
-                    subdir = sanitize_filename(subdir)
+        req = requests.get(url, stream=True, timeout=TIMEOUT,
+                           headers=headers)
 
-                final_path = None
+        if offset and req.status_code == 416:
+            # Range not satisfiable, the file changed on the server
+            req.close()
+            offset = 0
 
-                req = requests.get(url, stream=True, timeout=10)
+            req = requests.get(url, stream=True, timeout=TIMEOUT)
 
-                if req.status_code == 200:
-                    filename = None
+        if req.status_code == 200:
+            offset = 0
 
-                    if 'content-disposition' in req.headers:
-                        match = re.findall(r"filename=(\S+)",
-                                           req.headers['content-disposition'])
+        elif req.status_code != 206 or not offset:
+            _LOGGER.error("Downloading of %s failed with status %d",
+                          url, req.status_code)
+            req.close()
+            return False
 
-                        if len(match) > 0:
-                            filename = match[0].strip("'\" ")
+        if not job['path']:
+            job['path'] = self._reserve_path(url, job['subdir'], req.headers)
 
-                    if not filename:
-                        filename = os.path.basename(
-                            url).strip()
+            # Store the path so the download resumes there after a restart
+            self._save()
 
-                    if not filename:
-                        filename = "ha_download"
+            _LOGGER.info("%s -> %s", url, job['path'])
 
-                    # Remove stuff to ruin paths
-                    filename = sanitize_filename(filename)
+        length = req.headers.get('content-length')
+        total = offset + int(length) if length else None
 
-                    # Do we want to download to subdir, create if needed
-                    if subdir:
-                        subdir_path = os.path.join(download_path, subdir)
+        part_path = job['path'] + PART_SUFFIX
 
-                        # Ensure subdir exist
-                        if not os.path.isdir(subdir_path):
-                            os.makedirs(subdir_path)
+        with open(part_path, 'ab' if offset else 'wb') as fil:
+            for chunk in req.iter_content(CHUNK_SIZE):
+                if self._stop.is_set():
+                    req.close()
+                    return False
 
-                        final_path = os.path.join(subdir_path, filename)
+                fil.write(chunk)
+                offset += len(chunk)
 
-                    else:
-                        final_path = os.path.join(download_path, filename)
+                self._set_progress(job, offset, total)
 
-                    path, ext = os.path.splitext(final_path)
+        os.rename(part_path, job['path'])
 
-                    # If file exist append a number.
-                    # We test filename, filename_2..
-                    tries = 1
-                    final_path = path + ext
-                    while os.path.isfile(final_path):
-                        tries += 1
+        _LOGGER.info("Downloading of %s done", url)
 
-                        final_path = "{}_{}.{}".format(path, tries, ext)
+        return True
 
-                    logger.info("%s -> %s", url, final_path)
+    def _reserve_path(self, url, subdir, headers):
+        """ Returns a path that does not exist yet to download url to. """
+        filename = None
 
-                    with open(final_path, 'wb') as fil:
-                        for chunk in req.iter_content(1024):
-                            fil.write(chunk)
+        if 'content-disposition' in headers:
+            match = re.findall(r"filename=(\S+)",
+                               headers['content-disposition'])
 
-                    logger.info("Downloading of %s done", url)
+            if len(match) > 0:
+                filename = match[0].strip("'\" ")
 
-            except requests.exceptions.ConnectionError:
-                logger.exception("ConnectionError occured for %s", url)
+        if not filename:
+            filename = os.path.basename(url).strip()
 
-                # Remove file if we started downloading but failed
-                if final_path and os.path.isfile(final_path):
-                    os.remove(final_path)
+        if not filename:
+            filename = "ha_download"
 
-        threading.Thread(target=do_download).start()
+        # Remove stuff to ruin paths
+        filename = sanitize_filename(filename)
 
-    hass.services.register(DOMAIN, SERVICE_DOWNLOAD_FILE,
-                           download_file)
+        # Do we want to download to subdir, create if needed
+        if subdir:
+            subdir_path = os.path.join(self.download_path, subdir)
 
-    return True
+            # Ensure subdir exist
+            if not os.path.isdir(subdir_path):
+                os.makedirs(subdir_path)
+
+            final_path = os.path.join(subdir_path, filename)
+
+        else:
+            final_path = os.path.join(self.download_path, filename)
+
+        path, ext = os.path.splitext(final_path)
+
+        # If file exist append a number.
+        # We test filename, filename_2..
+        with self._lock:
+            tries = 1
+            final_path = path + ext
+            while os.path.isfile(final_path) or \
+                    os.path.isfile(final_path + PART_SUFFIX):
+                tries += 1
+
+                final_path = "{}_{}{}".format(path, tries, ext)
+
+            # Create the part file so other downloads skip this path
+            open(final_path + PART_SUFFIX, 'wb').close()
+
+        return final_path
+
+    def _set_progress(self, job, downloaded, total):
+        """ Updates the progress of job, updates the state once in a while. """
+        with self._lock:
+            self._progress[id(job)] = (downloaded, total)
+
+            now = time.time()
+
+            if now - self._last_progress < PROGRESS_INTERVAL:
+                return
+
+            self._last_progress = now
+
+        self._update_state()
+
+    def _update_state(self):
+        """ Publishes the queue and the progress as state. """
+        with self._lock:
+            downloads = []
+
+            for job in self._jobs:
+                if id(job) in self._progress:
+                    downloaded, total = self._progress[id(job)]
+
+                    downloads.append({
+                        ATTR_URL: job['url'],
+                        'downloaded': downloaded,
+                        'total': total,
+                    })
+
+            attributes = {
+                ATTR_QUEUED: len(self._jobs) - len(downloads),
+                ATTR_DOWNLOADS: downloads,
+            }
+
+            self.hass.states.set(
+                ENTITY_ID, STATE_DOWNLOADING if self._jobs else STATE_IDLE,
+                attributes)
+
+    def _load(self):
+        """ Returns the downloads stored in the queue file. """
+        if self.queue_path is None or not os.path.isfile(self.queue_path):
+            return []
+
+        try:
+            with open(self.queue_path) as inp:
+                jobs = [job for job in json.load(inp)
+                        if isinstance(job, dict) and 'url' in job]
+
+        except (IOError, ValueError):
+            _LOGGER.exception("Unable to load download queue %s",
+                              self.queue_path)
+
+            return []
+
+        for job in jobs:
+            job.setdefault('subdir', None)
+            job.setdefault('path', None)
+            job['retries'] = 0
+
+        return jobs
+
+    def _save(self):
+        """ Writes the queued downloads to the queue file. """
+        if self.queue_path is None:
+            return
+
+        with self._lock:
+            try:
+                with open(self.queue_path, 'w') as outp:
+                    json.dump(self._jobs, outp)
+
+            except IOError:
+                _LOGGER.exception("Unable to save download queue %s",
+                                  self.queue_path)
@@ -6,6 +6,8 @@ Provides functionality to group devices that can be turned on or off.
 """
 
 import logging
+import threading
+import weakref
 
 import homeassistant as ha
 import homeassistant.util as util
@@ -24,6 +26,11 @@ _GROUP_TYPES = [(STATE_ON, STATE_OFF), (STATE_HOME, STATE_NOT_HOME)]
 
 _GROUPS = {}
 
+# GroupIndex per Home Assistant instance
+_INDEXES = weakref.WeakKeyDictionary()
+
+_LOGGER = logging.getLogger(__name__)
+
 
 def _get_group_on_off(state):
     """ Determine the group on/off states based on a state. """
@@ -50,45 +57,164 @@ def is_on(hass, entity_id):
 def expand_entity_ids(hass, entity_ids):
     """ Returns the given list of entity ids and expands group ids into
         the entity ids it represents if found. """
-    found_ids = []
+    return _get_index(hass).expand(entity_ids)
 
-    for entity_id in entity_ids:
-        try:
-            # If entity_id points at a group, expand it
-            domain, _ = util.split_entity_id(entity_id)
 
-            if domain == DOMAIN:
-                found_ids.extend(
-                    ent_id for ent_id
-                    in get_entity_ids(hass, entity_id)
-                    if ent_id not in found_ids)
+def get_entity_ids(hass, entity_id, domain_filter=None):
+    """ Get the entity ids that make up this group. """
+    entity_ids = _get_index(hass).members(entity_id)
+
+    if domain_filter:
+        return [ent_id for ent_id in entity_ids
+                if ent_id.startswith(domain_filter)]
+    else:
+        return list(entity_ids)
+
+
+def _get_index(hass):
+    """ Returns the GroupIndex of hass. """
+    try:
+        return _INDEXES[hass]
+
+    except KeyError:
+        return _INDEXES.setdefault(hass, GroupIndex(hass))
+
+
+def _is_group(entity_id):
+    """ Returns if entity_id is the entity id of a group. """
+    return util.split_entity_id(entity_id)[0] == DOMAIN
+
+
+class GroupIndex(object):
+    """
+    Keeps the members of the groups set up by this component and caches
+    their expansion into entity ids. Nested groups are expanded, a group
+    that contains itself is expanded once. The cache is cleared when the
+    members of a group change.
+    """
+
+    def __init__(self, hass):
+        self.hass = hass
+
+        # Members per group id as passed to setup_group
+        self._members = {}
+
+        # Tuple of expanded entity ids per group id
+        self._expanded = {}
+
+        # Groups we warned about that they contain themselves
+        self._cycles = set()
+
+        self._lock = threading.Lock()
+
+    def set_members(self, group_id, entity_ids):
+        """ Sets the members of group_id. """
+        with self._lock:
+            self._members[group_id] = list(entity_ids)
+            self._expanded.clear()
+            self._cycles.clear()
+
+    def remove(self, group_id):
+        """ Removes group_id from the index. """
+        with self._lock:
+            if self._members.pop(group_id, None) is not None:
+                self._expanded.clear()
+                self._cycles.clear()
+
+    def members(self, group_id):
+        """ Returns a tuple with the expanded entity ids of group_id. """
+        with self._lock:
+            return self._expand_group(group_id, set())[0]
+
+    def expand(self, entity_ids):
+        """ Returns the entity ids with the group ids expanded. Each entity
+            id occurs once, in the order it is first found. """
+        found_ids = []
+        seen = set()
+
+        for entity_id in entity_ids:
+            try:
+                if _is_group(entity_id):
+                    expanded = self.members(entity_id)
+                else:
+                    expanded = (entity_id,)
+
+            except AttributeError:
+                # Raised by util.split_entity_id if entity_id is not a string
+                continue
+
+            for ent_id in expanded:
+                if ent_id not in seen:
+                    seen.add(ent_id)
+                    found_ids.append(ent_id)
+
+        return found_ids
+
+    def _expand_group(self, group_id, visiting):
+        """
+        Returns a tuple with the expanded entity ids of group_id and if the
+        expansion can be cached. visiting contains the groups that are being
+        expanded and is used to detect groups that contain themselves.
+        """
+        if group_id in self._expanded:
+            return self._expanded[group_id], True
+
+        members = self._members.get(group_id)
+
+        # Groups that are not set up by us can change without us knowing
+        cacheable = members is not None
+
+        if members is None:
+            members = self._read_members(group_id)
+
+        visiting.add(group_id)
+
+        found_ids = []
+        seen = set()
+
+        for entity_id in members:
+            if not _is_group(entity_id):
+                expanded = (entity_id,)
+
+            elif entity_id in visiting:
+                if entity_id not in self._cycles:
+                    self._cycles.add(entity_id)
+
+                    _LOGGER.warning("Group %s contains itself", entity_id)
+
+                # The expansion depends on where we started
+                cacheable = False
+                continue
 
             else:
-                if entity_id not in found_ids:
-                    found_ids.append(entity_id)
+                expanded, sub_cacheable = self._expand_group(
+                    entity_id, visiting)
 
-        except AttributeError:
-            # Raised by util.split_entity_id if entity_id is not a string
-            pass
+                cacheable = cacheable and sub_cacheable
 
-    return found_ids
+            for ent_id in expanded:
+                if ent_id not in seen:
+                    seen.add(ent_id)
+                    found_ids.append(ent_id)
 
+        visiting.discard(group_id)
 
-def get_entity_ids(hass, entity_id, domain_filter=None):
-    """ Get the entity ids that make up this group. """
-    try:
-        entity_ids = hass.states.get(entity_id).attributes[ATTR_ENTITY_ID]
+        found_ids = tuple(found_ids)
 
-        if domain_filter:
-            return [ent_id for ent_id in entity_ids
-                    if ent_id.startswith(domain_filter)]
-        else:
-            return entity_ids
+        if cacheable:
+            self._expanded[group_id] = found_ids
+
+        return found_ids, cacheable
+
+    def _read_members(self, group_id):
+        """ Returns the members of a group that we did not set up. """
+        try:
+            return self.hass.states.get(group_id).attributes[ATTR_ENTITY_ID]
 
-    except (AttributeError, KeyError):
-        # AttributeError if state did not exist
-        # KeyError if key did not exist in attributes
-        return []
+        except (AttributeError, KeyError):
+            # AttributeError if state did not exist
+            # KeyError if key did not exist in attributes
+            return []
 
 
 def setup(hass, config):
@@ -101,6 +227,7 @@ def setup(hass, config):
     return True
 
 
+# pylint: disable=too-many-locals
 def setup_group(hass, name, entity_ids, user_defined=True):
     """ Sets up a group state that is the combined state of
         several states. Supports ON/OFF and DEVICE_HOME/DEVICE_NOT_HOME. """
@@ -122,7 +249,6 @@ def setup_group(hass, name, entity_ids, user_defined=True):
     warnings = []
     group_ids = []
     group_on, group_off = None, None
-    group_state = False
 
     for entity_id in entity_ids:
         state = hass.states.get(entity_id)
@@ -153,9 +279,6 @@ def setup_group(hass, name, entity_ids, user_defined=True):
         else:
             group_ids.append(entity_id)
 
-            # Keep track of the group state to init later on
-            group_state = group_state or state.state == group_on
-
     # If none of the entities could be found during setup
     if not group_ids:
         logger.error('Unable to find any entities to track for group %s', name)
@@ -168,36 +291,50 @@ def setup_group(hass, name, entity_ids, user_defined=True):
             name, ", ".join(warnings))
 
     group_entity_id = ENTITY_ID_FORMAT.format(util.slugify(name))
-    state = group_on if group_state else group_off
     state_attr = {ATTR_ENTITY_ID: group_ids, ATTR_AUTO: not user_defined}
 
-    # pylint: disable=unused-argument
-    def update_group_state(entity_id, old_state, new_state):
-        """ Updates the group state based on a state change by
-            a tracked entity. """
-
-        cur_gr_state = hass.states.get(group_entity_id).state
+    # Members that are in the on-state, the group is on if there are any.
+    # Kept up to date from the state changes so an update is O(1).
+    on_ids = set()
 
-        # if cur_gr_state = OFF and new_state = ON: set ON
-        # if cur_gr_state = ON and new_state = OFF: research
-        # else: ignore
+    lock = threading.Lock()
 
-        if cur_gr_state == group_off and new_state.state == group_on:
+    def set_group_state():
+        """ Sets the group state if it differs from the current one. """
+        state = group_on if on_ids else group_off
+        current = hass.states.get(group_entity_id)
 
-            hass.states.set(group_entity_id, group_on, state_attr)
+        # Compare with the state machine so a group state that was set
+        # from somewhere else is corrected too
+        if current is None or current.state != state or \
+           current.attributes != state_attr:
+            hass.states.set(group_entity_id, state, state_attr)
 
-        elif cur_gr_state == group_on and new_state.state == group_off:
+    # pylint: disable=unused-argument
+    def update_group_state(entity_id, old_state, new_state):
+        """ Updates the group state based on a state change by
+            a tracked entity. """
+        with lock:
+            if new_state.state == group_on:
+                on_ids.add(entity_id)
+            else:
+                on_ids.discard(entity_id)
 
-            # Check if any of the other states is still on
-            if not any([hass.states.is_state(ent_id, group_on)
-                        for ent_id in group_ids
-                        if entity_id != ent_id]):
-                hass.states.set(group_entity_id, group_off, state_attr)
+            set_group_state()
 
     _GROUPS[group_entity_id] = hass.states.track_change(
         group_ids, update_group_state)
 
-    hass.states.set(group_entity_id, state, state_attr)
+    _get_index(hass).set_members(group_entity_id, group_ids)
+
+    # Count the members that are on after we started listening so no change
+    # is missed. Changes handled before this are counted here too.
+    with lock:
+        on_ids.clear()
+        on_ids.update(ent_id for ent_id in group_ids
+                      if hass.states.is_state(ent_id, group_on))
+
+        set_group_state()
 
     return True
 
@@ -209,6 +346,8 @@ def remove_group(hass, name):
     if hass.states.get(group_entity_id) is not None:
         hass.states.remove(group_entity_id)
 
+    _get_index(hass).remove(group_entity_id)
+
     if group_entity_id in _GROUPS:
         hass.bus.remove_listener(
             ha.EVENT_STATE_CHANGED, _GROUPS.pop(group_entity_id))
@@ -52,11 +52,13 @@ import logging
 import os
 import csv
 
+import homeassistant as ha
 import homeassistant.util as util
 from homeassistant.const import (
     STATE_ON, SERVICE_TURN_ON, SERVICE_TURN_OFF, ATTR_ENTITY_ID)
 from homeassistant.helpers import (
-    extract_entity_ids, platform_devices_from_config)
+    extract_entity_ids, platform_devices_from_config, DevicePoller,
+    CommandQueues, BatchSender)
 from homeassistant.components import group
 
 
@@ -90,6 +92,10 @@ FLASH_LONG = "long"
 
 LIGHT_PROFILES_FILE = "light_profiles.csv"
 
+# Lights that report their state changes are polled every this many
+# minutes to catch up on changes that did not get reported
+PUSH_POLL_MINUTES = 5
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -131,11 +137,9 @@ def turn_off(hass, entity_id=None, transition=None):
     hass.services.call(DOMAIN, SERVICE_TURN_OFF, data)
 
 
-# pylint: disable=too-many-branches, too-many-locals
-def setup(hass, config):
-    """ Exposes light control via statemachine and services. """
-
-    # Load built-in profiles and custom profiles
+def _load_profiles(hass):
+    """ Loads the built-in and the custom light profiles. Returns a dict
+        with profile id to (x, y, brightness) or None on errors. """
     profile_paths = [os.path.join(os.path.dirname(__file__),
                                   LIGHT_PROFILES_FILE),
                      hass.get_config_path(LIGHT_PROFILES_FILE)]
@@ -161,7 +165,119 @@ def setup(hass, config):
                     _LOGGER.error(
                         "Error parsing light profiles from %s", profile_path)
 
-                    return False
+                    return None
+
+    return profiles
+
+
+# pylint: disable=too-many-branches
+def _service_params(service, profiles):
+    """ Returns the arguments for the light methods from a service call. """
+    dat = service.data
+
+    params = {}
+
+    transition = util.convert(dat.get(ATTR_TRANSITION), int)
+
+    if transition is not None:
+        params[ATTR_TRANSITION] = transition
+
+    if service.service == SERVICE_TURN_ON:
+        # Processing extra data for turn light on request
+
+        # We process the profile first so that we get the desired
+        # behavior that extra service data attributes overwrite
+        # profile values
+        profile = profiles.get(dat.get(ATTR_PROFILE))
+
+        if profile:
+            *params[ATTR_XY_COLOR], params[ATTR_BRIGHTNESS] = profile
+
+        if ATTR_BRIGHTNESS in dat:
+            # We pass in the old value as the default parameter if parsing
+            # of the new one goes wrong.
+            params[ATTR_BRIGHTNESS] = util.convert(
+                dat.get(ATTR_BRIGHTNESS), int, params.get(ATTR_BRIGHTNESS))
+
+        if ATTR_XY_COLOR in dat:
+            try:
+                # xy_color should be a list containing 2 floats
+                xycolor = dat.get(ATTR_XY_COLOR)
+
+                # Without this check, a xycolor with value '99' would work
+                if not isinstance(xycolor, str):
+                    params[ATTR_XY_COLOR] = [float(val) for val in xycolor]
+
+            except (TypeError, ValueError):
+                # TypeError if xy_color is not iterable
+                # ValueError if value could not be converted to float
+                pass
+
+        if ATTR_RGB_COLOR in dat:
+            try:
+                # rgb_color should be a list containing 3 ints
+                rgb_color = dat.get(ATTR_RGB_COLOR)
+
+                if len(rgb_color) == 3:
+                    params[ATTR_XY_COLOR] = \
+                        util.color_RGB_to_xy(int(rgb_color[0]),
+                                             int(rgb_color[1]),
+                                             int(rgb_color[2]))
+
+            except (TypeError, ValueError):
+                # TypeError if rgb_color is not iterable
+                # ValueError if not all values can be converted to int
+                pass
+
+        if ATTR_FLASH in dat:
+            if dat[ATTR_FLASH] == FLASH_SHORT:
+                params[ATTR_FLASH] = FLASH_SHORT
+
+            elif dat[ATTR_FLASH] == FLASH_LONG:
+                params[ATTR_FLASH] = FLASH_LONG
+
+    return params
+
+
+def _group_by_batch_handler(lights):
+    """
+    Groups lights that can be controlled together by their platform.
+
+    A light platform supports batch commands by giving its lights a
+    batch_handler attribute. The handler has the methods turn_on(lights,
+    **kwargs), turn_off(lights, **kwargs) and update() to refresh the state
+    of its lights once.
+
+    Returns a list of (handler, lights) tuples. Lights without handler are
+    returned as (None, [light]).
+    """
+    batches = []
+    handlers = {}
+
+    for light in lights:
+        handler = getattr(light, 'batch_handler', None)
+
+        if handler is None:
+            batches.append((None, [light]))
+
+        elif handler in handlers:
+            handlers[handler].append(light)
+
+        else:
+            handlers[handler] = [light]
+            batches.append((handler, handlers[handler]))
+
+    return batches
+
+
+# pylint: disable=too-many-locals, too-many-statements
+def setup(hass, config):
+    """ Exposes light control via statemachine and services. """
+
+    profiles = _load_profiles(hass)
+
+    if profiles is None:
+        return False
 
     lights = platform_devices_from_config(config, DOMAIN, hass, _LOGGER)
 
@@ -186,23 +302,45 @@ def setup(hass, config):
         light.entity_id = entity_id
         ent_to_light[entity_id] = light
 
+    def state_changed_callback(light):
+        """ Returns a callback that writes the state of light. """
+        return lambda: hass.pool.add_job(
+            ha.JobPriority.EVENT_STATE, (light.update_ha_state, hass))
+
+    pushing = [light for light in lights
+               if light.subscribe(state_changed_callback(light))]
+
+    poller = DevicePoller(
+        hass, [light for light in lights if light not in pushing], DOMAIN)
+
+    push_poller = DevicePoller(hass, pushing, DOMAIN)
+
     # pylint: disable=unused-argument
     def update_lights_state(now):
-        """ Update the states of all the lights. """
-        for light in lights:
-            light.update_ha_state(hass)
+        """ Update the states of the lights that do not report changes. """
+        poller.poll()
+
+    def update_pushing_lights_state(now):
+        """ Update the states of the lights that report changes. """
+        push_poller.poll()
 
     update_lights_state(None)
+    update_pushing_lights_state(None)
 
     # Track all lights in a group
     group.setup_group(
         hass, GROUP_NAME_ALL_LIGHTS, ent_to_light.keys(), False)
 
+    # Command queues by entity id, lights with a batch handler are sent
+    # their commands by the BatchSender of the handler
+    queues = CommandQueues()
+
+    senders = {handler: BatchSender(handler, queues)
+               for handler, _ in _group_by_batch_handler(lights)
+               if handler is not None}
+
     def handle_light_service(service):
         """ Hande a turn light on or off service call. """
-        # Get and validate data
-        dat = service.data
-
         # Convert the entity ids to valid light ids
         lights = [ent_to_light[entity_id] for entity_id
                   in extract_entity_ids(hass, service)
@@ -211,82 +349,57 @@ def setup(hass, config):
         if not lights:
             lights = list(ent_to_light.values())
 
-        params = {}
+        params = _service_params(service, profiles)
 
-        transition = util.convert(dat.get(ATTR_TRANSITION), int)
+        # Batches of which this thread sent the commands
+        sent = []
 
-        if transition is not None:
-            params[ATTR_TRANSITION] = transition
+        for handler, batch in _group_by_batch_handler(lights):
+            if handler is None:
+                with queues.hold(batch[0].entity_id,
+                                 batch[0].min_command_interval) as queue:
 
-        if service.service == SERVICE_TURN_OFF:
-            for light in lights:
-                # pylint: disable=star-args
-                light.turn_off(**params)
+                    if queue.put(service.service,
+                                 getattr(batch[0], service.service), params):
+                        sent.append((handler, batch))
 
-        else:
-            # Processing extra data for turn light on request
-
-            # We process the profile first so that we get the desired
-            # behavior that extra service data attributes overwrite
-            # profile values
-            profile = profiles.get(dat.get(ATTR_PROFILE))
+                    _LOGGER.debug("Command queue for %s: depth %d, %d sent, "
+                                  "%d coalesced", batch[0].entity_id,
+                                  queue.depth, queue.sent, queue.coalesced)
 
-            if profile:
-                *params[ATTR_XY_COLOR], params[ATTR_BRIGHTNESS] = profile
+                continue
 
-            if ATTR_BRIGHTNESS in dat:
-                # We pass in the old value as the default parameter if parsing
-                # of the new one goes wrong.
-                params[ATTR_BRIGHTNESS] = util.convert(
-                    dat.get(ATTR_BRIGHTNESS), int, params.get(ATTR_BRIGHTNESS))
+            # The sending thread gets the lights it sent commands to
+            batch = senders[handler].put(batch, service.service, params)
 
-            if ATTR_XY_COLOR in dat:
-                try:
-                    # xy_color should be a list containing 2 floats
-                    xycolor = dat.get(ATTR_XY_COLOR)
+            if batch:
+                sent.append((handler, batch))
 
-                    # Without this check, a xycolor with value '99' would work
-                    if not isinstance(xycolor, str):
-                        params[ATTR_XY_COLOR] = [float(val) for val in xycolor]
+        # Commands that were queued behind another thread are refreshed
+        # by that thread. Lights that push their state write it when the
+        # refresh finds them changed.
+        for handler, batch in sent:
+            if handler is None:
+                if batch[0] in pushing:
+                    batch[0].update()
+                else:
+                    batch[0].update_ha_state(hass, True)
 
-                except (TypeError, ValueError):
-                    # TypeError if xy_color is not iterable
-                    # ValueError if value could not be converted to float
-                    pass
+            else:
+                handler.update()
 
-            if ATTR_RGB_COLOR in dat:
-                try:
-                    # rgb_color should be a list containing 3 ints
-                    rgb_color = dat.get(ATTR_RGB_COLOR)
-
-                    if len(rgb_color) == 3:
-                        params[ATTR_XY_COLOR] = \
-                            util.color_RGB_to_xy(int(rgb_color[0]),
-                                                 int(rgb_color[1]),
-                                                 int(rgb_color[2]))
-
-                except (TypeError, ValueError):
-                    # TypeError if rgb_color is not iterable
-                    # ValueError if not all values can be converted to int
-                    pass
-
-            if ATTR_FLASH in dat:
-                if dat[ATTR_FLASH] == FLASH_SHORT:
-                    params[ATTR_FLASH] = FLASH_SHORT
-
-                elif dat[ATTR_FLASH] == FLASH_LONG:
-                    params[ATTR_FLASH] = FLASH_LONG
-
-            for light in lights:
-                # pylint: disable=star-args
-                light.turn_on(**params)
-
-        for light in lights:
-            light.update_ha_state(hass, True)
+                for light in batch:
+                    if light not in pushing:
+                        light.update_ha_state(hass)
 
     # Update light state every 30 seconds
     hass.track_time_change(update_lights_state, second=[0, 30])
 
+    if pushing:
+        hass.track_time_change(
+            update_pushing_lights_state,
+            minute=list(range(0, 60, PUSH_POLL_MINUTES)), second=0)
+
     # Listen for light on and light off service calls
     hass.services.register(DOMAIN, SERVICE_TURN_ON,
                            handle_light_service)
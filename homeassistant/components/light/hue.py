@@ -1,11 +1,18 @@
 """ Support for Hue lights. """
 import logging
+import re
 import socket
-from datetime import timedelta
+import threading
+import weakref
+from datetime import datetime, timedelta
+from types import MappingProxyType
 
+import homeassistant as ha
 import homeassistant.util as util
-from homeassistant.helpers import ToggleDevice
-from homeassistant.const import ATTR_FRIENDLY_NAME, CONF_HOST
+from homeassistant.loader import lazy_import
+from homeassistant.helpers import ToggleDevice, DeviceSnapshot
+from homeassistant.const import (
+    ATTR_FRIENDLY_NAME, CONF_HOST, STATE_ON, STATE_OFF)
 from homeassistant.components.light import (
     ATTR_BRIGHTNESS, ATTR_XY_COLOR, ATTR_TRANSITION,
     ATTR_FLASH, FLASH_LONG, FLASH_SHORT)
@@ -13,16 +20,38 @@ from homeassistant.components.light import (
 MIN_TIME_BETWEEN_SCANS = timedelta(seconds=10)
 MIN_TIME_BETWEEN_FORCED_SCANS = timedelta(seconds=1)
 
+# The bridge is polled every MIN_POLL_INTERVAL after a command or a change
+# and the interval doubles with every poll that finds no changes. Polls are
+# driven by the time events of the timer, so they cannot come more often
+# than every TIMER_INTERVAL seconds.
+MIN_POLL_INTERVAL = timedelta(seconds=ha.TIMER_INTERVAL)
+MAX_POLL_INTERVAL = timedelta(seconds=60)
+
 PHUE_CONFIG_FILE = "phue.conf"
 
+# Commands for at least this many lights are sent to a bridge group
+BATCH_GROUP_MIN_LIGHTS = 3
+
+# Name of the bridge groups created for batch commands
+BATCH_GROUP_NAME = "Home Assistant {}"
+BATCH_GROUP_NAME_RE = re.compile(r"^Home Assistant \d+$")
+
+# Bridges support a limited number of groups, once this many groups are
+# created for batch commands the least recently used one is reused
+MAX_BATCH_GROUPS = 4
+
+# Imported when connecting to the bridge
+phue = lazy_import('phue')  # pylint: disable=invalid-name
+
+# AdaptivePollers of the bridges per Home Assistant instance
+_POLLERS = weakref.WeakKeyDictionary()
+
 
 def get_devices(hass, config):
     """ Gets the Hue lights. """
     logger = logging.getLogger(__name__)
-    try:
-        import phue
-    except ImportError:
-        logger.exception("Error while importing dependency phue.")
+    if not phue.available:
+        logger.error("Error while importing dependency phue.")
 
         return []
 
@@ -56,85 +85,437 @@ def get_devices(hass, config):
             logger.error("Got unexpected result from Hue API")
             return
 
+        changed = []
+
         for light_id, info in api_states.items():
             if light_id not in lights:
                 lights[light_id] = HueLight(int(light_id), info,
                                             bridge, update_lights)
-            else:
-                lights[light_id].info = info
+                lights[light_id].batch_handler = batch_handler
+                lights[light_id].poller = poller
+
+            elif lights[light_id].info != info:
+                lights[light_id].set_info(info)
+
+                changed.append(lights[light_id])
+
+        for light in changed:
+            light.state_changed()
+
+        return changed
+
+    batch_handler = HueBatchHandler(bridge, lights, update_lights)
+
+    poller = batch_handler.poller = AdaptivePoller(
+        lambda: update_lights(no_throttle=True))
 
     update_lights()
 
+    _track_poller(hass, poller)
+
     return list(lights.values())
 
 
+def _track_poller(hass, poller):
+    """
+    Checks on every time event of the timer, every TIMER_INTERVAL seconds,
+    if poller should refresh its bridge. The bridges share one time listener
+    that only queues a job for the bridges that are due, the refreshes run
+    concurrently in the worker pool.
+    """
+    if hass not in _POLLERS:
+        pollers = _POLLERS[hass] = []
+
+        def poll_due(now):
+            """ Queues a refresh of the bridges that are due. """
+            for due in pollers:
+                if due.start_poll(now):
+                    hass.pool.add_job(ha.JobPriority.EVENT_STATE,
+                                      (due.poll, now))
+
+        hass.track_time_change(poll_due)
+
+    _POLLERS[hass].append(poller)
+
+
+def _turn_on_command(kwargs):
+    """ Returns the bridge command to turn lights on. """
+    command = {'on': True}
+
+    if ATTR_TRANSITION in kwargs:
+        # Transition time is in 1/10th seconds and cannot exceed
+        # 900 seconds.
+        command['transitiontime'] = min(9000, kwargs[ATTR_TRANSITION] * 10)
+
+    if ATTR_BRIGHTNESS in kwargs:
+        command['bri'] = kwargs[ATTR_BRIGHTNESS]
+
+    if ATTR_XY_COLOR in kwargs:
+        command['xy'] = kwargs[ATTR_XY_COLOR]
+
+    flash = kwargs.get(ATTR_FLASH)
+
+    if flash == FLASH_LONG:
+        command['alert'] = 'lselect'
+    elif flash == FLASH_SHORT:
+        command['alert'] = 'select'
+    else:
+        command['alert'] = 'none'
+
+    return command
+
+
+def _turn_off_command(kwargs):
+    """ Returns the bridge command to turn lights off. """
+    command = {'on': False}
+
+    if ATTR_TRANSITION in kwargs:
+        # Transition time is in 1/10th seconds and cannot exceed
+        # 900 seconds.
+        command['transitiontime'] = min(9000, kwargs[ATTR_TRANSITION] * 10)
+
+    return command
+
+
+def _has_error(response):
+    """ Returns if a bridge response contains an error. """
+    if isinstance(response, list):
+        return any(_has_error(item) for item in response)
+
+    return isinstance(response, dict) and 'error' in response
+
+
+class HueBatchHandler(object):
+    """
+    Sends one command to multiple lights of a bridge. Uses group 0 if all
+    lights of the bridge are targeted and an existing or newly created
+    bridge group otherwise, so the bridge changes them in one request.
+    Created groups are named after BATCH_GROUP_NAME and reused after a
+    restart.
+    """
+
+    # The bridge handles about one group command per second
+    min_command_interval = 1
+
+    # Maximum number of groups created for batch commands
+    max_groups = MAX_BATCH_GROUPS
+
+    # AdaptivePoller of the bridge
+    poller = None
+
+    def __init__(self, bridge, lights, update_lights):
+        self.bridge = bridge
+        self.lights = lights
+        self.update_lights = update_lights
+
+        # Maps frozensets of light ids to bridge group ids
+        self.groups = None
+
+        # Names of the bridge groups
+        self.group_names = set()
+
+        # Ids of the groups created for batch commands, least recently
+        # used first
+        self.own_groups = []
+
+    def turn_on(self, lights, **kwargs):
+        """ Turns lights on. """
+        self._send(lights, _turn_on_command(kwargs))
+
+    def turn_off(self, lights, **kwargs):
+        """ Turns lights off. """
+        self._send(lights, _turn_off_command(kwargs))
+
+    def update(self):
+        """ Synchronize state of all lights with the bridge. """
+        self.update_lights(no_throttle=True)
+
+    def _send(self, lights, command):
+        """ Sends command to lights using a group if possible. """
+        light_ids = frozenset(light.light_id for light in lights)
+
+        if self.poller is not None:
+            self.poller.command_sent()
+
+        group_id = self._get_group(light_ids)
+
+        if group_id is not None and not self._send_group(group_id, command):
+            # Groups can be changed with other apps, read them again and
+            # retry once before falling back to single lights
+            self._load_groups()
+
+            group_id = self._get_group(light_ids)
+
+            if group_id is not None and \
+               not self._send_group(group_id, command):
+                group_id = None
+
+        if group_id is None:
+            for light_id in sorted(light_ids):
+                self.bridge.set_light(light_id, command)
+
+    def _send_group(self, group_id, command):
+        """ Sends command to a group. Returns if the bridge accepted it. """
+        try:
+            return not _has_error(self.bridge.set_group(group_id, command))
+
+        except socket.error:
+            # socket.error when we cannot reach Hue
+            logging.getLogger(__name__).exception(
+                "Unable to send a command to group %s", group_id)
+
+            return False
+
+    def _get_group(self, light_ids):
+        """ Returns the id of a group with light_ids or None. """
+        if len(light_ids) < 2:
+            return None
+
+        if light_ids == {int(light_id) for light_id in self.lights}:
+            return 0
+
+        if self.groups is None:
+            self._load_groups()
+
+        group_id = self.groups.get(light_ids)
+
+        if group_id is None and len(light_ids) >= BATCH_GROUP_MIN_LIGHTS:
+            group_id = self._create_group(light_ids)
+
+        if group_id in self.own_groups:
+            self.own_groups.remove(group_id)
+            self.own_groups.append(group_id)
+
+        return group_id
+
+    def _load_groups(self):
+        """ Reads the groups of the bridge. """
+        self.groups = {}
+        self.group_names = set()
+        self.own_groups = []
+
+        try:
+            groups = self.bridge.get_group()
+
+            for group_id, group in sorted(groups.items(),
+                                          key=lambda item: int(item[0])):
+                self.groups[frozenset(int(light_id) for light_id
+                                      in group['lights'])] = int(group_id)
+                self.group_names.add(group['name'])
+
+                if BATCH_GROUP_NAME_RE.match(group['name']):
+                    self.own_groups.append(int(group_id))
+
+        except (socket.error, AttributeError, KeyError, ValueError):
+            # socket.error when we cannot reach Hue
+            # others when we get an unexpected response
+            logging.getLogger(__name__).exception(
+                "Unable to read the groups of the bridge")
+
+    def _create_group(self, light_ids):
+        """
+        Creates a bridge group with light_ids or changes the least recently
+        used group created before. Returns its id.
+        """
+        if len(self.own_groups) < self.max_groups:
+            group_id = self._new_group(light_ids)
+
+            if group_id is not None or not self.own_groups:
+                return group_id
+
+        # Reuse a group instead of taking another slot of the bridge
+        group_id = self.own_groups[0]
+
+        try:
+            self.bridge.set_group(group_id, 'lights', sorted(light_ids))
+
+        except socket.error:
+            logging.getLogger(__name__).exception(
+                "Unable to change group %s", group_id)
+
+            return None
+
+        self.groups = {lights: other_id for lights, other_id
+                       in self.groups.items() if other_id != group_id}
+        self.groups[light_ids] = group_id
+
+        return group_id
+
+    def _new_group(self, light_ids):
+        """ Creates a new bridge group with light_ids. Returns its id. """
+        # Pick a name not used by any group of the bridge
+        number = 1
+
+        while BATCH_GROUP_NAME.format(number) in self.group_names:
+            number += 1
+
+        name = BATCH_GROUP_NAME.format(number)
+        response = None
+
+        try:
+            response = self.bridge.create_group(name, sorted(light_ids))
+
+            group_id = int(response[0]['success']['id'])
+
+        except (socket.error, IndexError, KeyError, TypeError, ValueError):
+            # socket.error when we cannot reach Hue
+            # others when the bridge refused to create the group,
+            # for example because it reached the maximum number of groups
+            logging.getLogger(__name__).error(
+                "Unable to create a group for lights %s: %s",
+                sorted(light_ids), response)
+
+            return None
+
+        self.groups[light_ids] = group_id
+        self.group_names.add(name)
+        self.own_groups.append(group_id)
+
+        return group_id
+
+
+class AdaptivePoller(object):
+    """
+    Decides when to refresh the lights of a bridge. Polls every
+    MIN_POLL_INTERVAL after a command or a change and backs off to
+    MAX_POLL_INTERVAL while nothing changes.
+    """
+
+    def __init__(self, refresh):
+        # Refreshes the lights, returns the changed lights
+        self.refresh = refresh
+        self.interval = MAX_POLL_INTERVAL
+        self.next_poll = datetime.now() + self.interval
+
+        self._lock = threading.Lock()
+
+        # If a refresh is queued or running
+        self._polling = False
+
+    def command_sent(self):
+        """ Polls quickly to pick up the result of a command. """
+        with self._lock:
+            self.interval = MIN_POLL_INTERVAL
+            self.next_poll = datetime.now() + self.interval
+
+    def start_poll(self, now):
+        """
+        Returns True if a refresh is due at now and no refresh is running.
+        The refresh is then marked as running until poll is called.
+        """
+        with self._lock:
+            if self._polling or now < self.next_poll:
+                return False
+
+            self._polling = True
+
+            return True
+
+    # pylint: disable=unused-argument
+    def poll(self, now=None):
+        """ Refreshes the lights, to be called after start_poll. """
+        changed = None
+
+        try:
+            changed = self.refresh()
+
+        finally:
+            with self._lock:
+                if changed:
+                    self.interval = MIN_POLL_INTERVAL
+                else:
+                    self.interval = min(self.interval * 2, MAX_POLL_INTERVAL)
+
+                self.next_poll = datetime.now() + self.interval
+                self._polling = False
+
+
 class HueLight(ToggleDevice):
     """ Represents a Hue light """
 
+    batch_handler = None
+    poller = None
+
+    # The bridge handles about ten light commands per second
+    min_command_interval = 0.1
+
     def __init__(self, light_id, info, bridge, update_lights):
         self.light_id = light_id
-        self.info = info
         self.bridge = bridge
         self.update_lights = update_lights
 
+        self.info = None
+        self.snapshot = None
+        self.set_info(info)
+
+        # Called when a refresh finds the light changed
+        self.callback = None
+
     def get_name(self):
         """ Get the mame of the Hue light. """
         return self.info['name']
 
     def turn_on(self, **kwargs):
         """ Turn the specified or all lights on. """
-        command = {'on': True}
+        self.command_sent()
+        self.bridge.set_light(self.light_id, _turn_on_command(kwargs))
 
-        if ATTR_TRANSITION in kwargs:
-            # Transition time is in 1/10th seconds and cannot exceed
-            # 900 seconds.
-            command['transitiontime'] = min(9000, kwargs[ATTR_TRANSITION] * 10)
+    def turn_off(self, **kwargs):
+        """ Turn the specified or all lights off. """
+        self.command_sent()
+        self.bridge.set_light(self.light_id, _turn_off_command(kwargs))
 
-        if ATTR_BRIGHTNESS in kwargs:
-            command['bri'] = kwargs[ATTR_BRIGHTNESS]
+    def subscribe(self, callback):
+        """ Calls callback when a refresh of the bridge finds the light
+            changed. """
+        self.callback = callback
 
-        if ATTR_XY_COLOR in kwargs:
-            command['xy'] = kwargs[ATTR_XY_COLOR]
+        return True
 
-        flash = kwargs.get(ATTR_FLASH)
+    def state_changed(self):
+        """ Called when a refresh of the bridge found the light changed. """
+        if self.callback is not None:
+            self.callback()
 
-        if flash == FLASH_LONG:
-            command['alert'] = 'lselect'
-        elif flash == FLASH_SHORT:
-            command['alert'] = 'select'
-        else:
-            command['alert'] = 'none'
+    def command_sent(self):
+        """ Tells the poller of the bridge that a command was sent. """
+        if self.poller is not None:
+            self.poller.command_sent()
 
-        self.bridge.set_light(self.light_id, command)
+    def set_info(self, info):
+        """ Sets the info the bridge reported and the snapshot of the state
+            derived from it. Called once per refresh of the bridge. """
+        attr = {
+            ATTR_FRIENDLY_NAME: info['name']
+        }
 
-    def turn_off(self, **kwargs):
-        """ Turn the specified or all lights off. """
-        command = {'on': False}
+        if info['state']['reachable'] and info['state']['on']:
+            attr[ATTR_BRIGHTNESS] = info['state']['bri']
+            attr[ATTR_XY_COLOR] = info['state']['xy']
+
+            state = STATE_ON
+
+        else:
+            state = STATE_OFF
 
-        if ATTR_TRANSITION in kwargs:
-            # Transition time is in 1/10th seconds and cannot exceed
-            # 900 seconds.
-            command['transitiontime'] = min(9000, kwargs[ATTR_TRANSITION] * 10)
+        self.info = info
 
-        self.bridge.set_light(self.light_id, command)
+        # Replaced as a whole so readers always see a consistent state
+        self.snapshot = DeviceSnapshot(state, MappingProxyType(attr))
 
     def is_on(self):
         """ True if device is on. """
-        self.update_lights()
-
-        return self.info['state']['reachable'] and self.info['state']['on']
+        return self.snapshot.state == STATE_ON
 
     def get_state_attributes(self):
         """ Returns optional state attributes. """
-        attr = {
-            ATTR_FRIENDLY_NAME: self.get_name()
-        }
+        return dict(self.snapshot.attributes)
 
-        if self.is_on():
-            attr[ATTR_BRIGHTNESS] = self.info['state']['bri']
-            attr[ATTR_XY_COLOR] = self.info['state']['xy']
+    def get_snapshot(self):
+        """ Returns the state of the light as of the last refresh. """
+        snapshot = self.snapshot
 
-        return attr
+        return DeviceSnapshot(snapshot.state, dict(snapshot.attributes))
 
     def update(self):
         """ Synchronize state with bridge. """
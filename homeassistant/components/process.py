@@ -9,6 +9,7 @@ Author: Markus Stenberg <fingon@iki.fi>
 """
 
 import os
+import re
 
 from homeassistant.const import STATE_ON, STATE_OFF
 import homeassistant.util as util
@@ -19,6 +20,9 @@ ENTITY_ID_FORMAT = DOMAIN + '.{}'
 
 PS_STRING = 'ps awx'
 
+# Directory with a subdirectory per process on Linux
+PROC_PATH = '/proc'
+
 
 def setup(hass, config):
     """ Sets up a check if specified processes are running.
@@ -30,19 +34,150 @@ def setup(hass, config):
     entities = {ENTITY_ID_FORMAT.format(util.slugify(pname)): pstring
                 for pname, pstring in config[DOMAIN].items()}
 
+    scanner = ProcessScanner(entities)
+
+    # Last published state per entity id
+    states = {}
+
     # pylint: disable=unused-argument
     def update_process_states(time):
-        """ Check ps for currently running processes and update states. """
-        with os.popen(PS_STRING, 'r') as psfile:
-            lines = list(psfile)
+        """ Check for currently running processes and update states. """
+        running = scanner.scan()
 
-        for entity_id, pstring in entities.items():
-            state = STATE_ON if any(pstring in l for l in lines) else STATE_OFF
+        for entity_id in entities:
+            state = STATE_ON if entity_id in running else STATE_OFF
+
+            if states.get(entity_id) != state:
+                states[entity_id] = state
 
-            hass.states.set(entity_id, state)
+                hass.states.set(entity_id, state)
 
     update_process_states(None)
 
     hass.track_time_change(update_process_states, second=[0, 30])
 
     return True
+
+
+class ProcessMatcher(object):
+    """
+    Finds which of a set of substrings occur in a text in a single pass,
+    using one regular expression with an alternative per substring.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, entities):
+        """ entities: dict mapping entity id to substring. """
+        # Entity ids per substring
+        self._entities = {}
+
+        for entity_id, pstring in entities.items():
+            self._entities.setdefault(pstring, set()).add(entity_id)
+
+        # Longest substring first so each position matches the longest one
+        pstrings = sorted(self._entities, key=len, reverse=True)
+
+        # The lookahead makes the expression try every position, also the
+        # ones inside an earlier match
+        self._regex = re.compile('(?=({}))'.format(
+            '|'.join(re.escape(pstring) for pstring in pstrings)))
+
+        # A shorter substring that starts where a longer one matched is not
+        # reported by the expression, so a match implies all substrings that
+        # are contained in it
+        self._implied = {
+            pstring: set.union(*(self._entities[other] for other in pstrings
+                                 if other in pstring))
+            for pstring in pstrings}
+
+    def match(self, text):
+        """ Returns the set of entity ids whose substring occurs in text. """
+        found = set()
+
+        if not self._entities:
+            return found
+
+        for pstring in set(self._regex.findall(text)):
+            found.update(self._implied[pstring])
+
+        return found
+
+
+class ProcessScanner(object):
+    """
+    Finds the running processes that match the configured substrings.
+    Reads the command lines from /proc and only matches the command lines
+    that changed since the last scan, a process can change its command line
+    by exec or by rewriting its arguments. Falls back to ps if there is no
+    /proc file system.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, entities, proc_path=PROC_PATH):
+        self.matcher = ProcessMatcher(entities)
+        self.proc_path = proc_path
+
+        # Command line and matching entity ids per pid
+        self._processes = {}
+
+    def scan(self):
+        """ Returns the set of entity ids that have a running process. """
+        try:
+            pids = [pid for pid in os.listdir(self.proc_path)
+                    if pid.isdigit()]
+
+        except OSError:
+            pids = None
+
+        if not pids:
+            # No /proc file system, ie not on Linux
+            running = set()
+
+            with os.popen(PS_STRING, 'r') as psfile:
+                for line in psfile:
+                    running.update(self.matcher.match(line))
+
+            return running
+
+        processes = {}
+        running = set()
+
+        for pid in pids:
+            try:
+                cmdline = _read_cmdline(os.path.join(self.proc_path, pid))
+
+            except OSError:
+                # Process exited while we were looking at it
+                continue
+
+            known = self._processes.get(pid)
+
+            # A reused pid with the same command line matches the same
+            if known is not None and known[0] == cmdline:
+                matched = known[1]
+
+            else:
+                matched = self.matcher.match(cmdline)
+
+            processes[pid] = (cmdline, matched)
+            running.update(matched)
+
+        self._processes = processes
+
+        return running
+
+
+def _read_cmdline(path):
+    """
+    Returns the command line of the process with /proc directory path.
+    Kernel threads have no command line, like ps we use their name in
+    brackets.
+    """
+    with open(os.path.join(path, 'cmdline'), 'rb') as inp:
+        cmdline = inp.read().replace(b'\0', b' ').strip()
+
+    if not cmdline:
+        with open(os.path.join(path, 'comm'), 'rb') as inp:
+            cmdline = b'[' + inp.read().strip() + b']'
+
+    return cmdline.decode('utf-8', 'replace')
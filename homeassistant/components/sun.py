@@ -5,11 +5,16 @@ homeassistant.components.sun
 Provides functionality to keep track of the sun.
 """
 import logging
+import json
+import bisect
+import calendar
+import functools
 from datetime import datetime, timedelta
 
 import homeassistant as ha
 from homeassistant.const import CONF_LATITUDE, CONF_LONGITUDE
 from homeassistant.helpers import validate_config
+from homeassistant.loader import lazy_import
 from homeassistant.util import str_to_datetime, datetime_to_str
 
 DEPENDENCIES = []
@@ -21,6 +26,30 @@ STATE_BELOW_HORIZON = "below_horizon"
 
 STATE_ATTR_NEXT_RISING = "next_rising"
 STATE_ATTR_NEXT_SETTING = "next_setting"
+STATE_ATTR_NEXT_DAWN = "next_dawn"
+STATE_ATTR_NEXT_DUSK = "next_dusk"
+
+# Table with the times of the sun events, stored in the config dir
+SUN_TABLE_FILE = ".sun_table.json"
+
+# Number of days the table is computed for
+TABLE_DAYS = 366
+
+# The table is computed again when it covers less than this many days
+TABLE_MIN_DAYS = 30
+
+EVENT_RISING = "rising"
+EVENT_SETTING = "setting"
+EVENT_DAWN = "dawn"
+EVENT_DUSK = "dusk"
+
+# Civil twilight: the sun is 6 degrees below the horizon
+TWILIGHT_HORIZON = '-6'
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Imported when the sun state is calculated for the first time
+ephem = lazy_import('ephem')  # pylint: disable=invalid-name
 
 
 def is_on(hass, entity_id=None):
@@ -32,30 +61,238 @@ def is_on(hass, entity_id=None):
 
 def next_setting(hass, entity_id=None):
     """ Returns the datetime object representing the next sun setting. """
-    entity_id = entity_id or ENTITY_ID
+    return _get_datetime_attr(hass, entity_id, STATE_ATTR_NEXT_SETTING)
+
+
+def next_rising(hass, entity_id=None):
+    """ Returns the datetime object representing the next sun rising. """
+    return _get_datetime_attr(hass, entity_id, STATE_ATTR_NEXT_RISING)
+
+
+def next_dawn(hass, entity_id=None):
+    """ Returns the datetime object representing the next dawn. """
+    return _get_datetime_attr(hass, entity_id, STATE_ATTR_NEXT_DAWN)
+
+
+def next_dusk(hass, entity_id=None):
+    """ Returns the datetime object representing the next dusk. """
+    return _get_datetime_attr(hass, entity_id, STATE_ATTR_NEXT_DUSK)
+
 
-    state = hass.states.get(ENTITY_ID)
+def _get_datetime_attr(hass, entity_id, attribute):
+    """ Returns the datetime in a state attribute or None. """
+    state = hass.states.get(entity_id or ENTITY_ID)
 
     try:
-        return str_to_datetime(state.attributes[STATE_ATTR_NEXT_SETTING])
+        return _parse_datetime(state.attributes[attribute])
     except (AttributeError, KeyError):
         # AttributeError if state is None
-        # KeyError if STATE_ATTR_NEXT_SETTING does not exist
+        # KeyError if the attribute does not exist
         return None
 
 
-def next_rising(hass, entity_id=None):
-    """ Returns the datetime object representing the next sun rising. """
-    entity_id = entity_id or ENTITY_ID
+# The attributes only change a few times a day, parse each value once
+_parse_datetime = functools.lru_cache(maxsize=16)(str_to_datetime)
+
+
+def _to_timestamp(utc_dt):
+    """ Converts a naive UTC datetime to microseconds since the epoch. """
+    return (utc_dt - _EPOCH) // timedelta(microseconds=1)
 
-    state = hass.states.get(ENTITY_ID)
 
+def _from_timestamp(timestamp):
+    """ Converts microseconds since the epoch to a naive UTC datetime. """
+    return _EPOCH + timedelta(microseconds=timestamp)
+
+
+def _utc_to_local(utc_dt):
+    """ Converts a naive UTC datetime to a naive local datetime. """
+    return datetime.fromtimestamp(calendar.timegm(utc_dt.timetuple())) + \
+        timedelta(microseconds=utc_dt.microsecond)
+
+
+class SunTable(object):
+    """
+    Table with the times of the sun events at a location for the coming
+    TABLE_DAYS days. Times are naive UTC datetimes. The table is cached in a
+    file so it is only computed when it runs out or the location changes.
+    """
+
+    def __init__(self, latitude, longitude, path=None):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.path = path
+
+        # Sorted list of event times per event
+        self.events = None
+
+        # Time until which all events are in the table
+        self.end = None
+
+    @property
+    def key(self):
+        """ Key of the location of this table in the cache file. """
+        return "{},{}".format(self.latitude, self.longitude)
+
+    def next_event(self, event, utc_now):
+        """
+        Returns the first time of event after utc_now or None if the event
+        does not happen in the coming TABLE_DAYS days, like a sun rising
+        close to the poles.
+        """
+        self.ensure(utc_now)
+
+        index = bisect.bisect_right(self.events[event], utc_now)
+
+        # The event does not happen before the end of the table, a table
+        # that starts now may reach it
+        if index == len(self.events[event]) and \
+           self.end < utc_now + timedelta(days=TABLE_DAYS - 1):
+            self.compute(utc_now)
+            self.save()
+
+            index = bisect.bisect_right(self.events[event], utc_now)
+
+        times = self.events[event]
+
+        return times[index] if index < len(times) else None
+
+    def ensure(self, utc_now):
+        """ Makes sure the table covers at least TABLE_MIN_DAYS days. """
+        min_end = utc_now + timedelta(days=TABLE_MIN_DAYS)
+
+        if self.end is not None and self.end >= min_end:
+            return
+
+        if self.events is None:
+            self.load()
+
+            # The table has to start before utc_now, events can be
+            # missing at polar latitudes so use the time it was computed
+            if self.end is not None and self.end >= min_end and \
+               self.end - timedelta(days=TABLE_DAYS) <= utc_now:
+                return
+
+        self.compute(utc_now)
+        self.save()
+
+    def compute(self, utc_start):
+        """ Computes the table starting at utc_start. """
+        sun = ephem.Sun()  # pylint: disable=no-member
+
+        observer = ephem.Observer()
+        observer.lat = self.latitude  # pylint: disable=assigning-non-slot
+        observer.long = self.longitude  # pylint: disable=assigning-non-slot
+
+        twilight = ephem.Observer()
+        twilight.lat = self.latitude  # pylint: disable=assigning-non-slot
+        twilight.long = self.longitude  # pylint: disable=assigning-non-slot
+        # pylint: disable=assigning-non-slot
+        twilight.horizon = TWILIGHT_HORIZON
+
+        # Start a day early so utc_start has a previous event
+        start = utc_start - timedelta(days=1)
+
+        self.end = utc_start + timedelta(days=TABLE_DAYS)
+
+        self.events = {
+            EVENT_RISING: _event_times(
+                lambda date: observer.next_rising(sun, start=date),
+                start, self.end),
+            EVENT_SETTING: _event_times(
+                lambda date: observer.next_setting(sun, start=date),
+                start, self.end),
+            EVENT_DAWN: _event_times(
+                lambda date: twilight.next_rising(sun, start=date,
+                                                  use_center=True),
+                start, self.end),
+            EVENT_DUSK: _event_times(
+                lambda date: twilight.next_setting(sun, start=date,
+                                                   use_center=True),
+                start, self.end),
+        }
+
+    def load(self):
+        """ Loads the table for this location from the cache file. """
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path) as inp:
+                data = json.load(inp)[self.key]
+
+            self.events = {event: [_from_timestamp(timestamp)
+                                   for timestamp in timestamps]
+                           for event, timestamps in data['events'].items()}
+            self.end = _from_timestamp(data['end'])
+
+        except (IOError, ValueError, KeyError, TypeError):
+            # IOError if the file does not exist yet
+            # Others if the file is corrupt or for another location
+            self.events = self.end = None
+
+    def save(self):
+        """ Saves the table to the cache file. """
+        if self.path is None:
+            return
+
+        data = {self.key: {
+            'end': _to_timestamp(self.end),
+            'events': {event: [_to_timestamp(time) for time in times]
+                       for event, times in self.events.items()}
+        }}
+
+        try:
+            with open(self.path, 'w') as outp:
+                json.dump(data, outp)
+
+        except IOError:
+            logging.getLogger(__name__).exception(
+                "Unable to save the sun table to %s", self.path)
+
+
+def _event_times(next_event, start, end):
+    """
+    Returns the times of an event between start and end. next_event returns
+    the ephem date of the first event after the given date.
+    """
+    times = []
+    date = start
+
+    while date < end:
+        try:
+            time = next_event(date).datetime()
+
+        except (ephem.AlwaysUpError, ephem.NeverUpError):
+            # Polar day or night, try again the next day
+            date += timedelta(days=1)
+            continue
+
+        times.append(time)
+
+        # Events are about a day apart
+        date = time + timedelta(hours=1)
+
+    return times
+
+
+def _valid_coordinate(value, limit):
+    """ Returns if value is a valid latitude or longitude. """
     try:
-        return str_to_datetime(state.attributes[STATE_ATTR_NEXT_RISING])
-    except (AttributeError, KeyError):
-        # AttributeError if state is None
-        # KeyError if STATE_ATTR_NEXT_RISING does not exist
-        return None
+        return -limit <= float(value) <= limit
+
+    except ValueError:
+        pass
+
+    # Other notations, like degrees:minutes:seconds, are checked by ephem.
+    # Decimal degrees are checked without it so ephem is only imported when
+    # the sun table has to be computed.
+    try:
+        ephem.degrees(value)
+        return True
+
+    except ValueError:
+        return False
 
 
 def setup(hass, config):
@@ -67,52 +304,44 @@ def setup(hass, config):
                            logger):
         return False
 
-    try:
-        import ephem
-    except ImportError:
-        logger.exception("Error while importing dependency ephem.")
+    if not ephem.available:
+        logger.error("Error while importing dependency ephem.")
         return False
 
-    sun = ephem.Sun()  # pylint: disable=no-member
-
     latitude = config[ha.DOMAIN][CONF_LATITUDE]
     longitude = config[ha.DOMAIN][CONF_LONGITUDE]
 
     # Validate latitude and longitude
-    observer = ephem.Observer()
-
     errors = []
 
-    try:
-        observer.lat = latitude  # pylint: disable=assigning-non-slot
-    except ValueError:
+    if not _valid_coordinate(latitude, 90):
         errors.append("invalid value for latitude given: {}".format(latitude))
 
-    try:
-        observer.long = longitude  # pylint: disable=assigning-non-slot
-    except ValueError:
-        errors.append("invalid value for latitude given: {}".format(latitude))
+    if not _valid_coordinate(longitude, 180):
+        errors.append(
+            "invalid value for longitude given: {}".format(longitude))
 
     if errors:
         logger.error("Error setting up: %s", ", ".join(errors))
         return False
 
+    table = SunTable(latitude, longitude,
+                     hass.get_config_path(SUN_TABLE_FILE))
+
     def update_sun_state(now):
         """ Method to update the current state of the sun and
             set time of next setting and rising. """
         utc_offset = datetime.utcnow() - datetime.now()
         utc_now = now + utc_offset
 
-        observer = ephem.Observer()
-        observer.lat = latitude  # pylint: disable=assigning-non-slot
-        observer.long = longitude  # pylint: disable=assigning-non-slot
-
-        next_rising_dt = ephem.localtime(
-            observer.next_rising(sun, start=utc_now))
-        next_setting_dt = ephem.localtime(
-            observer.next_setting(sun, start=utc_now))
+        next_rising_dt, next_setting_dt, next_dawn_dt, next_dusk_dt = (
+            _utc_to_local(time) if time is not None else None for time
+            in (table.next_event(event, utc_now) for event
+                in (EVENT_RISING, EVENT_SETTING, EVENT_DAWN, EVENT_DUSK)))
 
-        if next_rising_dt > next_setting_dt:
+        # Close to the poles the sun can stay up or down for months
+        if next_setting_dt is not None and \
+           (next_rising_dt is None or next_rising_dt > next_setting_dt):
             new_state = STATE_ABOVE_HORIZON
             next_change = next_setting_dt
 
@@ -120,13 +349,23 @@ def setup(hass, config):
             new_state = STATE_BELOW_HORIZON
             next_change = next_rising_dt
 
-        logger.info("%s. Next change: %s",
-                    new_state, next_change.strftime("%H:%M"))
+        if next_change is None:
+            logger.info("%s. No change in the coming year", new_state)
+
+            # Check again tomorrow
+            next_change = now + timedelta(days=1)
+
+        else:
+            logger.info("%s. Next change: %s",
+                        new_state, next_change.strftime("%H:%M"))
 
         state_attributes = {
-            STATE_ATTR_NEXT_RISING: datetime_to_str(next_rising_dt),
-            STATE_ATTR_NEXT_SETTING: datetime_to_str(next_setting_dt)
-        }
+            attr: datetime_to_str(time) for attr, time in (
+                (STATE_ATTR_NEXT_RISING, next_rising_dt),
+                (STATE_ATTR_NEXT_SETTING, next_setting_dt),
+                (STATE_ATTR_NEXT_DAWN, next_dawn_dt),
+                (STATE_ATTR_NEXT_DUSK, next_dusk_dt))
+            if time is not None}
 
         hass.states.set(ENTITY_ID, new_state, state_attributes)
 
@@ -6,11 +6,13 @@ Component to interface with various switches that can be controlled remotely.
 import logging
 from datetime import timedelta
 
+import homeassistant as ha
 import homeassistant.util as util
 from homeassistant.const import (
     STATE_ON, SERVICE_TURN_ON, SERVICE_TURN_OFF, ATTR_ENTITY_ID)
 from homeassistant.helpers import (
-    extract_entity_ids, platform_devices_from_config)
+    extract_entity_ids, platform_devices_from_config, DevicePoller,
+    CommandQueues)
 from homeassistant.components import group
 
 DOMAIN = 'switch'
@@ -27,6 +29,10 @@ ATTR_CURRENT_POWER_MWH = "current_power_mwh"
 
 MIN_TIME_BETWEEN_SCANS = timedelta(seconds=10)
 
+# Switches that report their state changes are polled every this many
+# minutes to catch up on changes that did not get reported
+PUSH_POLL_MINUTES = 5
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -51,6 +57,7 @@ def turn_off(hass, entity_id=None):
     hass.services.call(DOMAIN, SERVICE_TURN_OFF, data)
 
 
+# pylint: disable=too-many-locals
 def setup(hass, config):
     """ Track states and offer events for switches. """
     logger = logging.getLogger(__name__)
@@ -79,17 +86,38 @@ def setup(hass, config):
         switch.entity_id = entity_id
         ent_to_switch[entity_id] = switch
 
+    def state_changed_callback(switch):
+        """ Returns a callback that writes the state of switch. """
+        return lambda: hass.pool.add_job(
+            ha.JobPriority.EVENT_STATE, (switch.update_ha_state, hass))
+
+    pushing = [switch for switch in switches
+               if switch.subscribe(state_changed_callback(switch))]
+
+    poller = DevicePoller(
+        hass, [switch for switch in switches if switch not in pushing],
+        DOMAIN)
+
+    push_poller = DevicePoller(hass, pushing, DOMAIN)
+
     # pylint: disable=unused-argument
     @util.Throttle(MIN_TIME_BETWEEN_SCANS)
     def update_states(now):
-        """ Update states of all switches. """
+        """ Update states of all switches that do not report changes. """
 
         logger.info("Updating switch states")
 
-        for switch in switches:
-            switch.update_ha_state(hass)
+        poller.poll()
+
+    def update_pushing_states(now):
+        """ Update states of all switches that report changes. """
+        push_poller.poll()
 
     update_states(None)
+    update_pushing_states(None)
+
+    # Command queues by entity id
+    queues = CommandQueues()
 
     def handle_switch_service(service):
         """ Handles calls to the switch services. """
@@ -101,12 +129,18 @@ def setup(hass, config):
             devices = switches
 
         for switch in devices:
-            if service.service == SERVICE_TURN_ON:
-                switch.turn_on()
-            else:
-                switch.turn_off()
+            with queues.hold(switch.entity_id,
+                             switch.min_command_interval) as queue:
+
+                # Commands queued behind another thread are sent by that
+                # thread
+                if queue.put(service.service,
+                             getattr(switch, service.service), {}):
+                    switch.update_ha_state(hass)
 
-            switch.update_ha_state(hass)
+                logger.debug("Command queue for %s: depth %d, %d sent, "
+                             "%d coalesced", switch.entity_id, queue.depth,
+                             queue.sent, queue.coalesced)
 
     # Track all switches in a group
     group.setup_group(hass, GROUP_NAME_ALL_SWITCHES,
@@ -115,6 +149,13 @@ def setup(hass, config):
     # Update state every 30 seconds
     hass.track_time_change(update_states, second=[0, 30])
 
+    if pushing:
+        logger.info("%d switches report their state changes", len(pushing))
+
+        hass.track_time_change(
+            update_pushing_states,
+            minute=list(range(0, 60, PUSH_POLL_MINUTES)), second=0)
+
     hass.services.register(DOMAIN, SERVICE_TURN_OFF, handle_switch_service)
 
     hass.services.register(DOMAIN, SERVICE_TURN_ON, handle_switch_service)
@@ -24,7 +24,7 @@ def get_devices(hass, config):
     core = telldus.TelldusCore()
     switches = core.devices()
 
-    return [TellstickSwitch(switch) for switch in switches]
+    return [TellstickSwitch(switch, core) for switch in switches]
 
 
 class TellstickSwitch(ToggleDevice):
@@ -32,8 +32,9 @@ class TellstickSwitch(ToggleDevice):
     last_sent_command_mask = (tc_constants.TELLSTICK_TURNON |
                               tc_constants.TELLSTICK_TURNOFF)
 
-    def __init__(self, tellstick):
+    def __init__(self, tellstick, core=None):
         self.tellstick = tellstick
+        self.core = core
         self.state_attr = {ATTR_FRIENDLY_NAME: tellstick.name}
 
     def get_name(self):
@@ -50,6 +51,21 @@ class TellstickSwitch(ToggleDevice):
         """ Turns the switch off. """
         self.tellstick.turn_off()
 
+    def subscribe(self, callback):
+        """ Calls callback when the switch is switched, also by a remote. """
+        if self.core is None:
+            return False
+
+        # pylint: disable=unused-argument
+        def device_event(id_, method, data, cid):
+            """ Called by tellcore for events of all devices. """
+            if id_ == self.tellstick.id:
+                callback()
+
+        self.core.register_device_event(device_event)
+
+        return True
+
     def is_on(self):
         """ True if switch is on. """
         last_command = self.tellstick.last_sent_command(
@@ -1,11 +1,29 @@
 """ Support for WeMo switchces. """
 import logging
+import socket
+import threading
+import http.server
+import socketserver
+import urllib.parse
+import xml.etree.ElementTree as ET
 
-from homeassistant.helpers import ToggleDevice
-from homeassistant.const import ATTR_FRIENDLY_NAME, CONF_HOSTS
+import requests
+
+from homeassistant.helpers import ToggleDevice, DeviceSnapshot
+from homeassistant.const import (
+    ATTR_FRIENDLY_NAME, CONF_HOSTS, STATE_ON, STATE_OFF,
+    EVENT_HOMEASSISTANT_STOP)
 from homeassistant.components.switch import (
     ATTR_TODAY_MWH, ATTR_CURRENT_POWER_MWH)
 
+# Seconds an event subscription lasts if it is not renewed
+SUBSCRIPTION_TIMEOUT = 600
+
+# Subscriptions are renewed every this many minutes
+SUBSCRIPTION_RENEW_MINUTES = 5
+
+_LOGGER = logging.getLogger(__name__)
+
 
 # pylint: disable=unused-argument
 def get_devices(hass, config):
@@ -32,14 +50,226 @@ def get_devices(hass, config):
         switches = pywemo.discover_devices()
 
     # Filter out the switches and wrap in WemoSwitch object
-    return [WemoSwitch(switch) for switch in switches
-            if isinstance(switch, pywemo.Switch)]
+    switches = [switch for switch in switches
+                if isinstance(switch, pywemo.Switch)]
+
+    # Receives the state changes reported by the switches
+    registry = SubscriptionRegistry(hass) if switches else None
+
+    return [WemoSwitch(switch, registry) for switch in switches]
+
+
+def _device_address(wemo):
+    """ Returns host and port of a pywemo device. """
+    try:
+        return wemo.host, int(wemo.port)
+
+    except AttributeError:
+        url = urllib.parse.urlparse(wemo.url)
+
+        return url.hostname, url.port or 49153
+
+
+def _local_ip(host):
+    """ Returns the IP address of the interface that connects to host. """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    try:
+        # Connecting an UDP socket does not send anything
+        sock.connect((host, 1900))
+
+        return sock.getsockname()[0]
+
+    finally:
+        sock.close()
+
+
+def _parse_binary_state(body):
+    """
+    Returns the state from the body of a WeMo event or None if the event is
+    not about the state. Insight switches report 8 when on in standby.
+    """
+    try:
+        root = ET.fromstring(body)
+
+    except ET.ParseError:
+        return None
+
+    for element in root.iter():
+        if element.tag.rsplit('}', 1)[-1] == 'BinaryState' and element.text:
+            return element.text.split('|', 1)[0] != '0'
+
+    return None
+
+
+class SubscriptionRegistry(object):
+    """
+    Subscribes to the UPnP events of WeMo devices and receives them on a
+    local HTTP server. Subscriptions are renewed while Home Assistant runs.
+    """
+
+    def __init__(self, hass):
+        # Event path => callback, state event URL, subscription ID
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+        registry = self
+
+        class EventHandler(http.server.BaseHTTPRequestHandler):
+            """ Handles the event notifications of the devices. """
+
+            def do_NOTIFY(self):  # pylint: disable=invalid-name
+                """ Handles an event notification. """
+                body = self.rfile.read(
+                    int(self.headers.get('Content-Length', 0)))
+
+                registry.notify(self.path, body)
+
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            # pylint: disable=redefined-builtin
+            def log_message(self, format, *args):
+                """ Log requests at debug level. """
+                _LOGGER.debug(format, *args)
+
+        class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            """ Handles each notification in its own thread. """
+            daemon_threads = True
+
+        self.server = Server(('', 0), EventHandler)
+        self.port = self.server.server_port
+
+        threading.Thread(target=self.server.serve_forever, daemon=True,
+                         name="WemoEventReceiver").start()
+
+        hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, self.stop)
+
+        hass.track_time_change(
+            self.renew,
+            minute=list(range(0, 60, SUBSCRIPTION_RENEW_MINUTES)), second=0)
+
+    def subscribe(self, wemo, callback):
+        """
+        Subscribes to state changes of wemo. callback is called with True or
+        False when the switch reports it turned on or off.
+        Returns if subscribing succeeded.
+        """
+        host, port = _device_address(wemo)
+
+        path = '/wemo/{}/{}'.format(host, port)
+        url = 'http://{}:{}/upnp/event/basicevent1'.format(host, port)
+
+        with self._lock:
+            self._subscriptions[path] = [callback, url, None]
+
+        return self._subscribe(path)
+
+    def notify(self, path, body):
+        """ Handles an event received for path. """
+        with self._lock:
+            subscription = self._subscriptions.get(path)
+
+        state = _parse_binary_state(body)
+
+        if subscription is not None and state is not None:
+            subscription[0](state)
+
+    # pylint: disable=unused-argument
+    def renew(self, now=None):
+        """ Renews all subscriptions. """
+        with self._lock:
+            paths = list(self._subscriptions)
+
+        for path in paths:
+            self._subscribe(path)
+
+    # pylint: disable=unused-argument
+    def stop(self, event=None):
+        """ Cancels the subscriptions and stops the server. """
+        with self._lock:
+            subscriptions = list(self._subscriptions.values())
+            self._subscriptions.clear()
+
+        for _, url, sid in subscriptions:
+            if sid is not None:
+                try:
+                    requests.request('UNSUBSCRIBE', url, headers={'SID': sid},
+                                     timeout=5)
+                except requests.exceptions.RequestException:
+                    pass
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _subscribe(self, path):
+        """ Subscribes or renews the subscription for path. """
+        with self._lock:
+            if path not in self._subscriptions:
+                return False
+
+            _, url, sid = self._subscriptions[path]
+
+        headers = {'TIMEOUT': 'Second-{}'.format(SUBSCRIPTION_TIMEOUT)}
+
+        if sid is not None:
+            headers['SID'] = sid
+
+        else:
+            host = urllib.parse.urlparse(url).hostname
+
+            try:
+                local_ip = _local_ip(host)
+
+            except OSError:
+                # No route to the device, the switch will be polled
+                _LOGGER.warning("Unable to find the local address for %s",
+                                host)
+
+                return False
+
+            headers['NT'] = 'upnp:event'
+            headers['CALLBACK'] = '<http://{}:{}{}>'.format(
+                local_ip, self.port, path)
+
+        try:
+            res = requests.request('SUBSCRIBE', url, headers=headers,
+                                   timeout=5)
+
+        except requests.exceptions.RequestException:
+            _LOGGER.warning("Unable to subscribe to %s", url)
+
+            return False
+
+        if res.status_code == 412 and sid is not None:
+            # Subscription expired, start a new one
+            with self._lock:
+                if path in self._subscriptions:
+                    self._subscriptions[path][2] = None
+
+            return self._subscribe(path)
+
+        if res.status_code != 200 or 'SID' not in res.headers:
+            _LOGGER.warning("Subscribing to %s failed: %s", url, res)
+
+            return False
+
+        with self._lock:
+            if path in self._subscriptions:
+                self._subscriptions[path][2] = res.headers['SID']
+
+        return True
 
 
 class WemoSwitch(ToggleDevice):
     """ represents a WeMo switch within home assistant. """
-    def __init__(self, wemo):
+    def __init__(self, wemo, registry=None):
         self.wemo = wemo
+        self.registry = registry
+
+        # State reported by the last event, used by the next update
+        self.reported_state = None
 
     def get_name(self):
         """ Returns the name of the switch if any. """
@@ -57,15 +287,59 @@ class WemoSwitch(ToggleDevice):
         """ True if switch is on. """
         return self.wemo.get_state(True)
 
-    def get_state_attributes(self):
-        """ Returns optional state attributes. """
-        if self.wemo.model.startswith('Belkin Insight'):
+    def subscribe(self, callback):
+        """ Subscribes to the state change events of the switch. """
+        if self.registry is None:
+            return False
+
+        def state_reported(state):
+            """ Called when the switch reports its state. """
+            self.reported_state = state
+
+            callback()
+
+        return self.registry.subscribe(self.wemo, state_reported)
+
+    def get_snapshot(self):
+        """ Returns the state of the switch. Uses the reported state if the
+            switch reported a change since the last update. Insight switches
+            report their state with the power usage in one request. """
+        reported_state, self.reported_state = self.reported_state, None
+
+        if self.is_insight:
             cur_info = self.wemo.insight_params
+            attributes = self._insight_attributes(cur_info)
+
+            if reported_state is None:
+                # Insight switches report 8 when on in standby
+                reported_state = str(cur_info['state']) != '0'
+
+        else:
+            attributes = self.get_state_attributes()
+
+            if reported_state is None:
+                reported_state = self.is_on()
 
-            return {
-                ATTR_FRIENDLY_NAME: self.wemo.name,
-                ATTR_CURRENT_POWER_MWH: cur_info['currentpower'],
-                ATTR_TODAY_MWH: cur_info['todaymw']
-            }
+        return DeviceSnapshot(STATE_ON if reported_state else STATE_OFF,
+                              attributes)
+
+    @property
+    def is_insight(self):
+        """ True if the switch is an Insight switch that reports its power
+            usage. """
+        return self.wemo.model.startswith('Belkin Insight')
+
+    def get_state_attributes(self):
+        """ Returns optional state attributes. """
+        if self.is_insight:
+            return self._insight_attributes(self.wemo.insight_params)
         else:
             return {ATTR_FRIENDLY_NAME: self.wemo.name}
+
+    def _insight_attributes(self, cur_info):
+        """ Returns the state attributes from the Insight parameters. """
+        return {
+            ATTR_FRIENDLY_NAME: self.wemo.name,
+            ATTR_CURRENT_POWER_MWH: cur_info['currentpower'],
+            ATTR_TODAY_MWH: cur_info['todaymw']
+        }
@@ -25,6 +25,7 @@ datatype_mask=127 # show all sensor values
 import logging
 from collections import namedtuple
 
+import homeassistant as ha
 import homeassistant.util as util
 from homeassistant.const import ATTR_FRIENDLY_NAME, ATTR_UNIT_OF_MEASUREMENT
 
@@ -40,6 +41,10 @@ ENTITY_ID_FORMAT = DOMAIN + '.{}'
 
 DatatypeDescription = namedtuple("DatatypeDescription", ['name', 'unit'])
 
+# Sensors report new values themselves, they are polled every this many
+# minutes to catch up on missed values
+POLL_MINUTES = 5
+
 
 def setup(hass, config):
     """ Register services or listen for events that your component needs. """
@@ -135,8 +140,20 @@ def setup(hass, config):
         for sensor in sensors:
             update_sensor_state(sensor)
 
+    # pylint: disable=unused-argument, too-many-arguments
+    def sensor_event(protocol, model, id_, datatype, value, timestamp, cid):
+        """ Called by tellcore when a sensor reports a new value. """
+        for sensor in sensors:
+            if sensor.id == id_:
+                # Telldus functions may not be called from its callbacks
+                hass.pool.add_job(ha.JobPriority.EVENT_STATE,
+                                  (update_sensor_state, sensor))
+
     update_sensors_state(None)
 
-    hass.track_time_change(update_sensors_state, second=[0, 30])
+    core.register_sensor_event(sensor_event)
+
+    hass.track_time_change(update_sensors_state,
+                           minute=list(range(0, 60, POLL_MINUTES)), second=0)
 
     return True
@@ -1,13 +1,34 @@
 """
 Helper methods for components within Home Assistant.
 """
+import logging
+import functools
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from homeassistant import NoEntitySpecifiedError
 
 from homeassistant.loader import get_component
+import homeassistant.profiler as profiler
 from homeassistant.const import (
-    ATTR_ENTITY_ID, STATE_ON, STATE_OFF, CONF_PLATFORM, CONF_TYPE)
+    ATTR_ENTITY_ID, STATE_ON, STATE_OFF, CONF_PLATFORM, CONF_TYPE,
+    EVENT_HOMEASSISTANT_STOP)
+
+# Maximum number of devices a DevicePoller polls at the same time
+POLL_WORKERS = 8
+
+# Seconds a DevicePoller waits for a single device to report its state
+POLL_TIMEOUT = 10
+
+_LOGGER = logging.getLogger(__name__)
+
+# State of a toggle device at one point in time.
+# state: STATE_ON or STATE_OFF, attributes: dict with state attributes.
+DeviceSnapshot = namedtuple('DeviceSnapshot', ['state', 'attributes'])
 
 
 def extract_entity_ids(hass, service):
@@ -15,8 +36,6 @@ def extract_entity_ids(hass, service):
     Helper method to extract a list of entity ids from a service call.
     Will convert group entity ids to the entity ids it represents.
     """
-    entity_ids = []
-
     if service.data and ATTR_ENTITY_ID in service.data:
         group = get_component('group')
 
@@ -27,12 +46,10 @@ def extract_entity_ids(hass, service):
         else:
             ent_ids = [service_ent_id]
 
-        entity_ids.extend(
-            ent_id for ent_id
-            in group.expand_entity_ids(hass, ent_ids)
-            if ent_id not in entity_ids)
+        # Returns each entity id once
+        return group.expand_entity_ids(hass, ent_ids)
 
-    return entity_ids
+    return []
 
 
 # pylint: disable=too-few-public-methods, attribute-defined-outside-init
@@ -125,7 +142,9 @@ def platform_devices_from_config(config, domain, hass, logger):
 
         else:
             try:
-                p_devices = platform.get_devices(hass, p_config)
+                with profiler.timed(profiler.CATEGORY_PLATFORM,
+                                    '{}.{}'.format(domain, p_type)):
+                    p_devices = platform.get_devices(hass, p_config)
             except AttributeError:
                 # DEPRECATED, still supported for now
                 logger.warning(
@@ -155,6 +174,9 @@ class ToggleDevice(object):
 
     entity_id = None
 
+    # Minimum number of seconds between two commands sent to the device
+    min_command_interval = 0
+
     def get_name(self):
         """ Returns the name of the device if any. """
         return None
@@ -179,6 +201,25 @@ class ToggleDevice(object):
         """ Retrieve latest state from the real device. """
         pass
 
+    # pylint: disable=unused-argument
+    def subscribe(self, callback):
+        """
+        Asks the device to call callback without arguments whenever its
+        state changes. Returns True if the device supports this, the
+        component will then only poll it occasionally to catch up on
+        missed changes.
+        """
+        return False
+
+    def get_snapshot(self):
+        """
+        Returns a DeviceSnapshot with the state and the state attributes.
+        Devices that need I/O to determine their state should override this
+        to fetch all the information they need only once.
+        """
+        return DeviceSnapshot(STATE_ON if self.is_on() else STATE_OFF,
+                              self.get_state_attributes())
+
     def update_ha_state(self, hass, force_refresh=False):
         """
         Updates Home Assistant with current state of device.
@@ -191,7 +232,409 @@ class ToggleDevice(object):
         if force_refresh:
             self.update()
 
-        state = STATE_ON if self.is_on() else STATE_OFF
+        snapshot = self.get_snapshot()
+
+        return hass.states.set(self.entity_id, snapshot.state,
+                               snapshot.attributes)
+
+
+class DevicePoller(object):
+    """
+    Polls the state of toggle devices concurrently using a bounded pool of
+    threads. The state of each device is written to the state machine as
+    soon as the device reports it.
+
+    A device that does not report within timeout seconds is given up on for
+    that poll. It is skipped by the next polls until its update returns.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, hass, devices, name,
+                 max_workers=POLL_WORKERS, timeout=POLL_TIMEOUT):
+        self.hass = hass
+        self.devices = devices
+        self.name = name
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._lock = threading.Lock()
+
+        # Devices of which an update is still running
+        self._busy = set()
+
+        # Start time of updates that are running, by device
+        self._started = {}
+
+        hass.bus.listen_once(
+            EVENT_HOMEASSISTANT_STOP,
+            lambda event: self._executor.shutdown(wait=False))
+
+    def poll(self):
+        """
+        Updates the state of all devices and blocks until they reported or
+        timed out. Returns a list of the devices that did not report.
+        """
+        futures = {}
+
+        with self._lock:
+            for device in self.devices:
+                if device in self._busy:
+                    _LOGGER.warning(
+                        "%s: still waiting for %s, skipping it",
+                        self.name, device.entity_id)
+                    continue
+
+                self._busy.add(device)
+
+                future = self._executor.submit(self._update, device)
+                future.add_done_callback(
+                    lambda fut, device=device: self._done(fut, device))
+
+                futures[future] = device
+
+        # Queued updates get their own timeout once they start, but a
+        # stuck pool should not block the poll forever
+        deadline = time.time() + self.timeout * (
+            len(futures) // self.max_workers + 1)
+
+        pending = set(futures)
+        failed = []
+
+        while pending:
+            now = time.time()
+
+            with self._lock:
+                started = {future: self._started[futures[future]]
+                           for future in pending
+                           if futures[future] in self._started}
+
+            expired = [future for future, start in started.items()
+                       if start + self.timeout <= now]
+
+            if now >= deadline:
+                expired = list(pending)
+
+            for future in expired:
+                pending.remove(future)
+                future.cancel()
+                failed.append(futures[future])
+
+                _LOGGER.warning("%s: %s did not respond within %s seconds",
+                                self.name, futures[future].entity_id,
+                                self.timeout)
+
+            if not pending:
+                break
+
+            wait_until = min([start + self.timeout for future, start
+                              in started.items() if future in pending] +
+                             [deadline])
+
+            done, pending = wait(pending, max(wait_until - now, 0),
+                                 FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is not None:
+                    failed.append(futures[future])
+
+        return failed
+
+    def _update(self, device):
+        """ Updates a single device. Runs in the pool. """
+        with self._lock:
+            self._started[device] = time.time()
+
+        device.update_ha_state(self.hass)
+
+    def _done(self, future, device):
+        """ Called when the update of a device finished or got cancelled. """
+        with self._lock:
+            self._busy.discard(device)
+            self._started.pop(device, None)
+
+        if not future.cancelled() and future.exception() is not None:
+            _LOGGER.error("%s: error updating %s: %s", self.name,
+                          device.entity_id, future.exception())
+
+
+class CommandQueue(object):
+    """
+    Sends the commands for one device one at a time and at most once per
+    min_interval seconds.
+
+    A command that is still waiting when a newer command is put is replaced
+    by the newer one. If both are the same command, the arguments of the
+    newer one are merged into the waiting one. The waiting command is sent
+    by the thread that is sending the commands, the other threads return
+    immediately.
+    """
+
+    def __init__(self, min_interval=0):
+        self.min_interval = min_interval
+
+        self._lock = threading.Lock()
+
+        # (name, func, kwargs) of the command that is waiting to be sent
+        self._pending = None
+
+        self._sending = False
+        self._last_sent = 0
+
+        self.sent = 0
+        self.coalesced = 0
+
+    @property
+    def depth(self):
+        """ Number of commands that are waiting or being sent. """
+        return int(self._pending is not None) + int(self._sending)
+
+    @property
+    def idle(self):
+        """ True if nothing is waiting and the next command can be sent
+            right away. """
+        with self._lock:
+            return self._pending is None and not self._sending and \
+                self._last_sent + self.min_interval <= time.time()
+
+    def put(self, name, func, kwargs):
+        """
+        Queues calling func(**kwargs). Returns True if the calling thread
+        sent the queued commands and False if another thread will.
+        """
+        with self._lock:
+            self._set_pending(name, func, kwargs)
+
+            if self._sending:
+                return False
+
+            self._sending = True
+
+        self._send_pending()
+
+        return True
+
+    def offer(self, name, func, kwargs):
+        """
+        Makes func(**kwargs) the waiting command like put, without sending
+        it. The command is sent by the thread that takes it.
+        """
+        with self._lock:
+            self._set_pending(name, func, kwargs)
+
+    def take(self):
+        """ Removes and returns the waiting (name, func, kwargs) or None. """
+        with self._lock:
+            pending, self._pending = self._pending, None
+
+            return pending
+
+    def send_delay(self):
+        """ Seconds to wait before the next command can be sent. """
+        with self._lock:
+            return self._last_sent + self.min_interval - time.time()
+
+    def command_sent(self):
+        """ Records that a command was sent. """
+        with self._lock:
+            self._last_sent = time.time()
+            self.sent += 1
+
+    def _set_pending(self, name, func, kwargs):
+        """ Replaces or merges into the waiting command. Call with the
+            lock held. """
+        if self._pending is not None:
+            self.coalesced += 1
+
+            if self._pending[0] == name:
+                kwargs = dict(self._pending[2], **kwargs)
+
+        self._pending = (name, func, kwargs)
+
+    def _send_pending(self):
+        """ Sends commands until there are no commands waiting. """
+        while True:
+            with self._lock:
+                if self._pending is None:
+                    self._sending = False
+                    return
+
+            delay = self.send_delay()
+
+            if delay > 0:
+                # Commands that arrive while we wait replace the pending one
+                time.sleep(delay)
+
+            with self._lock:
+                name, func, kwargs = self._pending
+                self._pending = None
+
+            try:
+                func(**kwargs)  # pylint: disable=star-args
+
+            except Exception:  # pylint: disable=broad-except
+                # Keep sending, a newer command might succeed
+                _LOGGER.exception("Error sending command %s", name)
+
+            self.command_sent()
+
+
+class BatchSender(object):
+    """
+    Sends the commands for devices that share a batch handler, like the
+    lights of one bridge. The handler has a method per command that takes
+    the list of devices and the arguments, for example turn_on(lights,
+    **kwargs), and sends the command to all of them at once.
+
+    Commands wait in the CommandQueue of each device, where a newer command
+    replaces or is merged into a waiting one. One thread at a time takes the
+    waiting commands and sends devices with the same command as one batch
+    command, at most once per min_command_interval of the handler. Commands
+    that end up for a single device are sent to the device itself.
+    """
+
+    def __init__(self, handler, queues):
+        self.handler = handler
+        self.queues = queues
+
+        self._lock = threading.Lock()
+
+        # Decides which thread sends, its waiting command sends the waiting
+        # commands of the devices
+        self._queue = CommandQueue()
+
+        # Devices with a waiting command and devices sent a command
+        self._waiting = set()
+        self._sent = []
+
+        self._last_batch = 0
+
+    def put(self, devices, name, kwargs):
+        """
+        Queues the command name(**kwargs) for devices. Returns the devices
+        the calling thread sent commands to, an empty list if another
+        thread sends them.
+        """
+        with self._lock:
+            for device in devices:
+                with self.queues.hold(device.entity_id,
+                                      device.min_command_interval) as queue:
+                    queue.offer(name, getattr(device, name), kwargs)
+
+                self._waiting.add(device)
+
+        if not self._queue.put('send', self._send_waiting, {}):
+            return []
+
+        with self._lock:
+            sent, self._sent = self._sent, []
+
+        return sent
+
+    def _send_waiting(self):
+        """ Sends the waiting commands, devices with the same command as
+            one batch. """
+        with self._lock:
+            devices = sorted(self._waiting, key=lambda dev: dev.entity_id)
+            self._waiting.clear()
+
+        # [name, func, kwargs, devices] per distinct command
+        commands = []
+
+        for device in devices:
+            with self.queues.hold(device.entity_id,
+                                  device.min_command_interval) as queue:
+                pending = queue.take()
+
+            if pending is None:
+                continue
+
+            for command in commands:
+                if command[0] == pending[0] and command[2] == pending[2]:
+                    command[3].append(device)
+                    break
+            else:
+                commands.append(list(pending) + [[device]])
+
+        for name, func, kwargs, batch in commands:
+            self._send(name, func, kwargs, batch)
+
+            with self._lock:
+                self._sent.extend(batch)
+
+    def _send(self, name, func, kwargs, devices):
+        """ Sends one command to devices and records it. """
+        if len(devices) > 1:
+            delay = self._last_batch - time.time() + \
+                getattr(self.handler, 'min_command_interval', 0)
+
+            func = functools.partial(getattr(self.handler, name), devices)
+
+        else:
+            with self.queues.hold(devices[0].entity_id,
+                                  devices[0].min_command_interval) as queue:
+                delay = queue.send_delay()
+
+        if delay > 0:
+            time.sleep(delay)
+
+        try:
+            func(**kwargs)  # pylint: disable=star-args
+
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error sending command %s to %s", name,
+                              [device.entity_id for device in devices])
+
+        if len(devices) > 1:
+            self._last_batch = time.time()
+
+        for device in devices:
+            with self.queues.hold(device.entity_id,
+                                  device.min_command_interval) as queue:
+                queue.command_sent()
+
+
+class CommandQueues(object):
+    """
+    Keeps a CommandQueue per key, for example per entity id. Queues are
+    created when they are needed and removed when they are idle.
+    """
 
-        return hass.states.set(self.entity_id, state,
-                               self.get_state_attributes())
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # CommandQueue and the number of threads using it per key
+        self._queues = {}
+        self._users = {}
+
+    def __len__(self):
+        return len(self._queues)
+
+    @contextmanager
+    def hold(self, key, min_interval=0):
+        """ Context manager that returns the CommandQueue of key. The queue
+            is not removed while it is held. """
+        with self._lock:
+            if key not in self._queues:
+                self._queues[key] = CommandQueue(min_interval)
+                self._users[key] = 0
+
+            self._users[key] += 1
+            queue = self._queues[key]
+
+        try:
+            yield queue
+
+        finally:
+            with self._lock:
+                self._users[key] -= 1
+
+                # Queues that are still rate limiting are removed by a
+                # later call
+                for idle_key in [idle_key for idle_key, users
+                                 in self._users.items()
+                                 if users == 0 and
+                                 self._queues[idle_key].idle]:
+                    del self._queues[idle_key]
+                    del self._users[idle_key]
@@ -15,20 +15,28 @@ will check the built-in components and platforms.
 """
 import os
 import sys
+import json
+import time
 import pkgutil
 import importlib
+import importlib.util
 import logging
+import threading
 
 from homeassistant.util import OrderedSet
+import homeassistant.profiler as profiler
 
 PREPARED = False
 
-# List of available components
-AVAILABLE_COMPONENTS = []
+# Set of available components
+AVAILABLE_COMPONENTS = set()
 
 # Dict of loaded components mapped name => module
 _COMPONENT_CACHE = {}
 
+# File in the config dir that caches the available components
+COMPONENT_INDEX_FILE = ".component_index.json"
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -39,12 +47,6 @@ def prepare(hass):
     # Load the built-in components
     import homeassistant.components as components
 
-    AVAILABLE_COMPONENTS.clear()
-
-    AVAILABLE_COMPONENTS.extend(
-        item[1] for item in
-        pkgutil.iter_modules(components.__path__, 'homeassistant.components.'))
-
     # Look for available custom components
     custom_path = hass.get_config_path("custom_components")
 
@@ -52,6 +54,33 @@ def prepare(hass):
         # Ensure we can load custom components using Pythons import
         sys.path.insert(0, hass.config_dir)
 
+    # The index is valid as long as no entries have been added or removed
+    # in the scanned directories, which is reflected by their mtime.
+    index_key = [[path, _get_mtime(path)]
+                 for path in list(components.__path__) + [custom_path]]
+
+    index_path = hass.get_config_path(COMPONENT_INDEX_FILE)
+
+    available = _read_component_index(index_path, index_key)
+
+    if available is None:
+        available = _scan_components(components.__path__, custom_path)
+
+        _write_component_index(index_path, index_key, available)
+
+    AVAILABLE_COMPONENTS.clear()
+    AVAILABLE_COMPONENTS.update(available)
+
+    PREPARED = True
+
+
+def _scan_components(components_path, custom_path):
+    """ Returns a list of the built-in and custom components. """
+    available = [item[1] for item in
+                 pkgutil.iter_modules(components_path,
+                                      'homeassistant.components.')]
+
+    if os.path.isdir(custom_path):
         # We cannot use the same approach as for built-in components because
         # custom components might only contain a platform for a component.
         # ie custom_components/switch/some_platform.py. Using pkgutil would
@@ -63,15 +92,52 @@ def prepare(hass):
         for fil in os.listdir(custom_path):
             if os.path.isdir(os.path.join(custom_path, fil)):
                 if fil != '__pycache__':
-                    AVAILABLE_COMPONENTS.append(
-                        'custom_components.{}'.format(fil))
+                    available.append('custom_components.{}'.format(fil))
 
             else:
                 # For files we will strip out .py extension
-                AVAILABLE_COMPONENTS.append(
+                available.append(
                     'custom_components.{}'.format(fil[0:-3]))
 
-    PREPARED = True
+    return available
+
+
+def _get_mtime(path):
+    """ Returns the mtime of path or None if it does not exist. """
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _read_component_index(index_path, index_key):
+    """
+    Returns the cached list of components if the index file exists and was
+    written for index_key. Returns None otherwise.
+    """
+    try:
+        with open(index_path) as inp:
+            index = json.load(inp)
+
+        if index['key'] == index_key:
+            return index['components']
+
+    except (IOError, ValueError, KeyError, TypeError):
+        # IOError if file does not exist or cannot be read
+        # ValueError, KeyError and TypeError if file is corrupt
+        pass
+
+    return None
+
+
+def _write_component_index(index_path, index_key, available):
+    """ Writes the component index. Fails silently if not writable. """
+    try:
+        with open(index_path, 'w') as outp:
+            json.dump({'key': index_key, 'components': available}, outp)
+
+    except IOError:
+        _LOGGER.info("Unable to write component index to %s", index_path)
 
 
 def set_component(comp_name, component):
@@ -113,7 +179,8 @@ def get_component(comp_name):
             continue
 
         try:
-            module = importlib.import_module(path)
+            with profiler.timed(profiler.CATEGORY_IMPORT, path):
+                module = importlib.import_module(path)
 
             # In Python 3 you can import files from directories that do not
             # contain the file __init__.py. A directory is a valid module if
@@ -142,6 +209,73 @@ def get_component(comp_name):
     return None
 
 
+class LazyModule(object):
+    """
+    Proxy for a module that will only be imported when one of its attributes
+    is accessed for the first time. Created by lazy_import.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._available = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return "<LazyModule {} ({})>".format(
+            self._name, "loaded" if self._module else "not loaded")
+
+    @property
+    def loaded(self):
+        """ Returns if the module has been imported. """
+        return self._module is not None
+
+    @property
+    def available(self):
+        """
+        Returns if the module can be found without importing it.
+        Use this to validate dependencies during setup.
+        """
+        if self._available is None:
+            try:
+                self._available = \
+                    importlib.util.find_spec(self._name) is not None
+            except ImportError:
+                # Raised if a parent package does not exist
+                self._available = False
+
+        return self._available
+
+    def load(self):
+        """ Imports the module if not done yet and returns it. """
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.time()
+
+                    with profiler.timed(profiler.CATEGORY_IMPORT, self._name):
+                        module = importlib.import_module(self._name)
+
+                    _LOGGER.info("Lazily imported %s in %.3fs",
+                                 self._name, time.time() - start)
+
+                    self._module = module
+
+        return self._module
+
+
+def lazy_import(name):
+    """
+    Returns a LazyModule for module name. The import, and its cost, is
+    deferred until an attribute of the module is used. ImportErrors are
+    raised at that point.
+    """
+    return LazyModule(name)
+
+
 def load_order_components(components):
     """
     Takes in a list of components we want to load:
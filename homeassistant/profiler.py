@@ -0,0 +1,129 @@
+"""
+homeassistant.profiler
+~~~~~~~~~~~~~~~~~~~~~~
+
+Opt-in profiler that records where the startup time of Home Assistant goes.
+
+When enabled, the bootstrap, the loader and the platform helpers record the
+wall and CPU time of every startup phase, component import, component setup
+and platform initialization. The result can be exported as a JSON report to
+track regressions between releases and printed as a summary table.
+
+Timings of nested records overlap: the import of a component also contains
+the imports it triggers and the setup of a component contains the setup of
+its platforms.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+CATEGORY_PHASE = "phase"
+CATEGORY_IMPORT = "import"
+CATEGORY_SETUP = "setup"
+CATEGORY_PLATFORM = "platform"
+
+# Components are set up concurrently so we measure the CPU time of the
+# thread doing the work when the Python version supports it.
+_CPU_TIME = getattr(time, 'thread_time', time.process_time)
+
+_LOCK = threading.Lock()
+
+# List of recorded timings, None if the profiler is not enabled
+_RECORDS = None
+
+# Wall time at which the profiler got enabled
+_START = None
+
+
+def enable():
+    """ Starts recording timings. Discards previous recordings. """
+    global _RECORDS, _START  # pylint: disable=global-statement
+
+    with _LOCK:
+        _RECORDS = []
+        _START = time.time()
+
+
+def disable():
+    """ Stops recording timings. """
+    global _RECORDS  # pylint: disable=global-statement
+
+    with _LOCK:
+        _RECORDS = None
+
+
+def is_enabled():
+    """ Returns if the profiler is recording. """
+    return _RECORDS is not None
+
+
+@contextmanager
+def timed(category, name):
+    """ Context manager that records the time it takes to run its body. """
+    if _RECORDS is None:
+        yield
+        return
+
+    wall_start = time.time()
+    cpu_start = _CPU_TIME()
+
+    try:
+        yield
+
+    finally:
+        record = {
+            'category': category,
+            'name': name,
+            'start': wall_start - _START,
+            'wall': time.time() - wall_start,
+            'cpu': _CPU_TIME() - cpu_start,
+            'thread': threading.current_thread().name,
+        }
+
+        with _LOCK:
+            if _RECORDS is not None:
+                _RECORDS.append(record)
+
+
+def report():
+    """ Returns a dict with all recorded timings ordered by start time. """
+    with _LOCK:
+        records = sorted(_RECORDS or [], key=lambda rec: rec['start'])
+
+        return {
+            'total_wall': time.time() - _START if _START else 0,
+            'records': records
+        }
+
+
+def write_report(path):
+    """ Writes the report as JSON to path. """
+    with open(path, 'w') as outp:
+        json.dump(report(), outp, indent=4, sort_keys=True)
+
+
+def summary(limit=None):
+    """
+    Returns a table with the recorded timings, slowest first.
+    Pass limit to only include that many records per category.
+    """
+    data = report()
+
+    lines = ["{:<10} {:<45} {:>9} {:>9}".format(
+        "category", "name", "wall (s)", "cpu (s)")]
+
+    for category in (CATEGORY_PHASE, CATEGORY_IMPORT, CATEGORY_SETUP,
+                     CATEGORY_PLATFORM):
+
+        records = sorted((rec for rec in data['records']
+                          if rec['category'] == category),
+                         key=lambda rec: rec['wall'], reverse=True)
+
+        for rec in records[:limit]:
+            lines.append("{:<10} {:<45} {:>9.3f} {:>9.3f}".format(
+                category, rec['name'], rec['wall'], rec['cpu']))
+
+    lines.append("Total startup time: {:.3f}s".format(data['total_wall']))
+
+    return "\n".join(lines)
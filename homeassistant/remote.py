@@ -13,6 +13,7 @@ import threading
 import logging
 import json
 import enum
+import codecs
 import urllib.parse
 
 import requests
@@ -28,6 +29,9 @@ METHOD_GET = "get"
 METHOD_POST = "post"
 METHOD_DELETE = "delete"
 
+# Size of the chunks read from the socket when streaming a response
+STREAM_CHUNK_SIZE = 8192
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -63,8 +67,9 @@ class API(object):
 
         return self.status == APIStatus.OK
 
-    def __call__(self, method, path, data=None):
-        """ Makes a call to the Home Assistant api. """
+    def __call__(self, method, path, data=None, stream=False):
+        """ Makes a call to the Home Assistant api.
+            Pass stream=True to not read the response body upfront. """
         if data is not None:
             data = json.dumps(data, cls=JSONEncoder)
 
@@ -73,10 +78,12 @@ class API(object):
         try:
             if method == METHOD_GET:
                 return requests.get(
-                    url, params=data, timeout=5, headers=self._headers)
+                    url, params=data, timeout=5, headers=self._headers,
+                    stream=stream)
             else:
                 return requests.request(
-                    method, url, data=data, timeout=5, headers=self._headers)
+                    method, url, data=data, timeout=5, headers=self._headers,
+                    stream=stream)
 
         except requests.exceptions.ConnectionError:
             _LOGGER.exception("Error connecting to server")
@@ -248,8 +255,16 @@ class StateMachine(ha.StateMachine):
 
     def mirror(self):
         """ Discards current data and mirrors the remote state machine. """
-        self._states = {state.entity_id: state for state
-                        in get_states(self._api)}
+        # Build the mirror straight from the stream so we never hold the raw
+        # response, the decoded JSON and the State objects at the same time.
+        try:
+            self._states = {state.entity_id: state for state
+                            in iter_states(self._api)}
+
+        except (ha.HomeAssistantError, ValueError):
+            _LOGGER.exception("Error mirroring states")
+
+            self._states = {}
 
     def _state_changed_listener(self, event):
         """ Listens for state changed events and applies them. """
@@ -388,19 +403,110 @@ def get_states(api):
     """ Queries given API for all states. """
 
     try:
-        req = api(METHOD_GET,
-                  URL_API_STATES)
+        return list(iter_states(api))
 
-        return [ha.State.from_dict(item) for
-                item in req.json()]
-
-    except (ha.HomeAssistantError, ValueError, AttributeError):
-        # ValueError if req.json() can't parse the json
+    except (ha.HomeAssistantError, ValueError):
+        # ValueError if the response can't be parsed as json
         _LOGGER.exception("Error fetching states")
 
         return []
 
 
+def iter_states(api):
+    """
+    Generator that queries given API for all states and yields them one by
+    one while the response is being received.
+    Raises HomeAssistantError on connection problems and ValueError if the
+    response is not a valid list of states.
+    """
+    req = api(METHOD_GET, URL_API_STATES, stream=True)
+
+    try:
+        if req.status_code != 200:
+            raise ha.HomeAssistantError(
+                "Error fetching states: {}".format(req.status_code))
+
+        for item in _iter_json_array(
+                req.iter_content(chunk_size=STREAM_CHUNK_SIZE)):
+
+            state = ha.State.from_dict(item)
+
+            if state is None:
+                raise ValueError("Invalid state received: {}".format(item))
+
+            yield state
+
+    except requests.exceptions.RequestException:
+        # Connection got dropped while reading the response
+        raise ha.HomeAssistantError("Error reading states from server")
+
+    finally:
+        req.close()
+
+
+def _iter_json_array(chunks):
+    """
+    Incrementally decodes a JSON array from an iterable of byte chunks.
+    Yields every item of the array as soon as it has been received.
+    Only the not yet decoded part of the document is kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = False
+
+    while True:
+        # Skip whitespace and the separators between items
+        while pos < len(buf) and (buf[pos].isspace() or
+                                  (in_array and buf[pos] == ',')):
+            pos += 1
+
+        if pos < len(buf):
+            if not in_array:
+                if buf[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+
+                in_array = True
+                pos += 1
+                continue
+
+            elif buf[pos] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+
+            except ValueError:
+                # Item is not complete yet, we need more data
+                if eof:
+                    raise
+
+            else:
+                # A number at the end of the buffer might be cut off,
+                # only accept it if no more data can follow it.
+                if end < len(buf) or eof:
+                    yield item
+                    pos = end
+                    continue
+
+        elif eof:
+            raise ValueError("Unexpected end of JSON array")
+
+        # Drop the decoded part and read the next chunk
+        buf = buf[pos:]
+        pos = 0
+
+        try:
+            buf += utf8.decode(next(chunks))
+        except StopIteration:
+            buf += utf8.decode(b'', final=True)
+            eof = True
+
+
 def set_state(api, entity_id, new_state, attributes=None):
     """
     Tells API to update state for entity_id.
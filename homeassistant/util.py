@@ -51,6 +51,18 @@ def str_to_datetime(dt_str):
 
     @rtype: datetime
     """
+    # Fast path for strings as written by datetime_to_str: HH:MM:SS DD-MM-YYYY
+    # Parsing by slicing is an order of magnitude faster than strptime, which
+    # matters when decoding thousands of states at once.
+    if len(dt_str) == 19 and dt_str[2] == dt_str[5] == ':' and \
+       dt_str[8] == ' ' and dt_str[11] == dt_str[14] == '-':
+        try:
+            return datetime(int(dt_str[15:19]), int(dt_str[12:14]),
+                            int(dt_str[9:11]), int(dt_str[0:2]),
+                            int(dt_str[3:5]), int(dt_str[6:8]))
+        except ValueError:
+            pass
+
     try:
         return datetime.strptime(dt_str, DATE_STR_FORMAT)
     except ValueError:  # If dt_str did not match our format
@@ -135,7 +147,10 @@ def ensure_unique_string(preferred_string, current_strings):
     """ Returns a string that is not present in current_strings.
         If preferred string exists will append _2, _3, .. """
     string = preferred_string
-    current_strings = list(current_strings)
+
+    # Allow passing in generators, keep sets and dicts for fast lookups
+    if not isinstance(current_strings, (set, frozenset, dict)):
+        current_strings = set(current_strings)
 
     tries = 1
 